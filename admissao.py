@@ -0,0 +1,75 @@
+"""Controle de admissão: limite de conexões e de mensagens por conexão.
+
+Cada conexão tem baldes de fichas (token bucket): um para todas as mensagens e um por
+tipo caro ou raro (REINICIAR, DICA, ...). Uma mensagem gasta uma ficha de cada balde
+que se aplica a ela, e os baldes se enchem sozinhos na taxa configurada até a rajada
+máxima. Não há thread nem relógio: o balde só faz a conta quando alguém tenta retirar,
+usando o instante da leitura (conn.visto), então o custo é uma multiplicação e uma
+comparação por mensagem. Cada conexão é lida por uma thread só (ou pelo event loop),
+e os baldes dela não precisam de lock.
+
+Quem passa do limite recebe ERRO 'Mensagens demais' e a mensagem é descartada sem
+pegar lock nenhum; quem insiste (LIMITE_RECUSAS recusas seguidas) é desconectado.
+"""
+from protocolo import CODEC_JSON
+
+# Tipo -> (fichas por segundo, rajada). Muito acima do que uma pessoa faz; um cliente
+# que manda REINICIAR em laço pega o lock da sala no máximo uma vez por segundo
+LIMITES_TIPO = {
+    'JOGADA': (10.0, 20),
+    'REINICIAR': (1.0, 3),
+    'DICA': (2.0, 5),
+    'SINCRONIZAR': (2.0, 5),
+    'CONECTAR': (0.5, 3),
+    'RETOMAR': (0.5, 3),
+    'ASSISTIR': (1.0, 5),
+}
+LIMITE_RECUSAS = 50  # recusas seguidas até a conexão ser derrubada
+
+# Resposta de quem chega com o servidor cheio: pronta, em JSON (o codec ainda não foi escolhido)
+QUADRO_LOTADO = CODEC_JSON.codificar({'tipo': 'ERRO', 'mensagem': 'Servidor cheio'})
+
+
+class Balde:
+    """Balde de fichas: 'taxa' fichas por segundo, no máximo 'capacidade' guardadas"""
+    __slots__ = ('taxa', 'capacidade', 'fichas', 'instante')
+
+    def __init__(self, taxa, capacidade, agora):
+        self.taxa = taxa
+        self.capacidade = capacidade
+        self.fichas = capacidade  # começa cheio: a rajada do handshake passa
+        self.instante = agora
+
+    def encher(self, agora):
+        """Soma as fichas que pingaram até 'agora'; True se há pelo menos uma para gastar"""
+        fichas = self.fichas + (agora - self.instante) * self.taxa
+        self.fichas = fichas if fichas < self.capacidade else self.capacidade
+        self.instante = agora
+        return self.fichas >= 1
+
+
+class Limitador:
+    """Baldes de uma conexão: o geral e os por tipo (criados no primeiro uso)"""
+    __slots__ = ('geral', 'por_tipo', 'recusas_seguidas')
+
+    def __init__(self, taxa, agora):
+        self.geral = Balde(taxa, max(1, 2 * taxa), agora)  # abaixo de 0,5/s, rajada de 1: ainda passa uma
+        self.por_tipo = {}
+        self.recusas_seguidas = 0
+
+    def permitir(self, tipo, agora):
+        """True se a mensagem pode ser processada; conta as recusas seguidas"""
+        balde = self.por_tipo.get(tipo)
+        if balde is None and tipo in LIMITES_TIPO:
+            taxa, rajada = LIMITES_TIPO[tipo]
+            balde = self.por_tipo[tipo] = Balde(taxa, rajada, agora)
+        # Os dois baldes precisam ter ficha antes de gastar de qualquer um: recusada pelo
+        # geral, a mensagem não pode consumir a cota do tipo (nem o contrário)
+        if self.geral.encher(agora) and (balde is None or balde.encher(agora)):
+            self.geral.fichas -= 1
+            if balde is not None:
+                balde.fichas -= 1
+            self.recusas_seguidas = 0
+            return True
+        self.recusas_seguidas += 1
+        return False
@@ -0,0 +1,269 @@
+"""Benchmark do servidor com bots falando o protocolo de verdade.
+
+Abre N conexões (o lobby junta em pares), deixa os bots jogarem por um tempo e
+imprime um relatório JSON: conexões/s, jogadas/s e latência jogada -> broadcast
+(p50/p99/p999). Sem --porta, sobe um servidor local próprio num subprocesso.
+
+Com --espectadores N, N sockets assistem a partida em destaque durante a medição (todos
+lidos por uma thread só, com selectors), e o relatório separa a latência dos dois bots
+que jogam nela.
+"""
+import argparse
+import json
+import os
+import selectors
+import socket
+import subprocess
+import sys
+import time
+
+from threading import Thread
+
+from bot import ClienteBot
+from protocolo import CODEC_JSON, CODECS
+from tabuleiro import VARIANTES
+
+
+def porta_livre():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def subir_servidor(modo, processos=1, pipeline=False):
+    """Servidor em outro processo: assim ele não disputa o GIL com os bots"""
+    porta = porta_livre()
+    diretorio = os.path.dirname(os.path.abspath(__file__))
+    processo = subprocess.Popen(
+        [sys.executable, os.path.join(diretorio, 'servidor.py'), '--porta', str(porta), '--modo', modo,
+         '--processos', str(processos)] + (['--pipeline'] if pipeline else []),
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, cwd=diretorio)
+    prazo = time.monotonic() + 10
+    while time.monotonic() < prazo:
+        try:
+            socket.create_connection(('127.0.0.1', porta), timeout=1).close()
+            return processo, porta
+        except OSError:
+            time.sleep(0.05)
+    processo.kill()
+    raise RuntimeError("servidor do benchmark não subiu")
+
+
+class Plateia:
+    """Conexões cruas: uma thread lê e descarta tudo de todas e manda um PING a cada intervalo
+
+    Por padrão são espectadores (ASSISTIR); com pedido={'tipo': 'CONECTAR'}, jogadores que
+    entram numa sala e nunca jogam (conexões paradas, para medir memória).
+    """
+
+    def __init__(self, porta, quantidade, intervalo_ping=5.0, pedido=None):
+        self.socks = []
+        self.bytes = 0
+        self.ativa = True
+        self.destaque = None
+        self.seletor = selectors.DefaultSelector()
+        assistir = pedido is None
+        pedido = CODEC_JSON.codificar({'tipo': 'ASSISTIR'} if assistir else pedido)
+        for _ in range(quantidade):
+            sock = socket.create_connection(('127.0.0.1', porta), timeout=10)
+            sock.sendall(pedido)
+            if assistir and self.destaque is None:
+                # O primeiro ASSISTINDO diz qual é a sala em destaque (a mesma para todos)
+                resposta = b''
+                while b'\n' not in resposta:
+                    resposta += sock.recv(4096)
+                self.destaque = CODEC_JSON.decodificar(resposta[:resposta.index(b'\n')]).get('sala')
+            sock.setblocking(False)
+            self.seletor.register(sock, selectors.EVENT_READ)
+            self.socks.append(sock)
+        self.intervalo_ping = intervalo_ping
+        Thread(target=self.ler, daemon=True).start()
+
+    def ler(self):
+        ping = CODEC_JSON.codificar({'tipo': 'PING'})
+        proximo_ping = time.monotonic() + self.intervalo_ping
+        while self.ativa:
+            for chave, _ in self.seletor.select(timeout=0.5):
+                try:
+                    dados = chave.fileobj.recv(65536)
+                except (BlockingIOError, InterruptedError):
+                    continue
+                except OSError:
+                    dados = b''
+                if not dados:
+                    self.seletor.unregister(chave.fileobj)
+                    continue
+                self.bytes += len(dados)
+            if time.monotonic() >= proximo_ping:
+                proximo_ping += self.intervalo_ping
+                for sock in self.socks:
+                    try:
+                        sock.send(ping)
+                    except OSError:
+                        pass
+
+    def fechar(self):
+        self.ativa = False
+        for sock in self.socks:
+            sock.close()
+
+
+def rss_kb(pid):
+    """Memória residente (kB) do processo e dos filhos diretos (trabalhadores); None fora do Linux"""
+    try:
+        with open(f'/proc/{pid}/task/{pid}/children') as arquivo:
+            filhos = [int(filho) for filho in arquivo.read().split()]
+        total = 0
+        for processo in [pid] + filhos:
+            with open(f'/proc/{processo}/status') as arquivo:
+                for linha in arquivo:
+                    if linha.startswith('VmRSS:'):
+                        total += int(linha.split()[1])
+        return total
+    except OSError:
+        return None
+
+
+def medir_ociosas(porta, pid, quantidade):
+    """Memória por conexão parada: RSS do servidor antes e depois de 'quantidade' CONECTARs sem jogo"""
+    antes = rss_kb(pid)
+    paradas = Plateia(porta, quantidade, pedido={'tipo': 'CONECTAR'})
+    time.sleep(2.0)  # o servidor termina de registrar todas e as mensagens de início saem
+    depois = rss_kb(pid)
+    medida = {'quantidade': quantidade, 'rss_kb_antes': antes, 'rss_kb_depois': depois}
+    if antes is not None and depois is not None:
+        medida['kb_por_conexao'] = round((depois - antes) / quantidade, 2)
+    return paradas, medida
+
+
+def percentil(valores, p):
+    if not valores:
+        return None
+    return valores[min(len(valores) - 1, int(p * len(valores)))]
+
+
+def resumo_latencias(latencias):
+    ms = lambda s: None if s is None else round(s * 1000, 3)
+    return {
+        'p50': ms(percentil(latencias, 0.50)),
+        'p99': ms(percentil(latencias, 0.99)),
+        'p999': ms(percentil(latencias, 0.999)),
+        'max': ms(latencias[-1] if latencias else None),
+    }
+
+
+def medir(porta, conexoes, duracao, jogadas_por_segundo, codec, espectadores=0, variante=None, ociosas=0, pid=None):
+    intervalo = 1.0 / jogadas_por_segundo if jogadas_por_segundo else 0.0
+    # Fase 0: conexões paradas, com o servidor ainda sem os bots (ficam abertas até o fim)
+    paradas, memoria = medir_ociosas(porta, pid, ociosas) if ociosas else (None, None)
+
+    bots = [ClienteBot('127.0.0.1', porta, codec, intervalo, variante=variante) for _ in range(conexoes)]
+
+    # Fase 1: conexões (até o CONECTADO de todas)
+    inicio = time.perf_counter()
+    for bot in bots:
+        bot.abrir_conexao()
+    for bot in bots:
+        if not bot.pronto.wait(30):
+            raise RuntimeError("conexão sem CONECTADO em 30s")
+    tempo_conexao = time.perf_counter() - inicio
+
+    plateia = Plateia(porta, espectadores) if espectadores else None
+
+    # Fase 2: jogos (os pares já começaram; só conta o que acontece na janela)
+    ja_medidas = [len(bot.latencias) for bot in bots]
+    jogos_antes = sum(bot.jogos for bot in bots)
+    inicio = time.perf_counter()
+    time.sleep(duracao)
+    janela = time.perf_counter() - inicio
+    latencias = sorted(l for bot, n in zip(bots, ja_medidas) for l in bot.latencias[n:])
+    if plateia is not None:
+        latencias_destaque = sorted(l for bot, n in zip(bots, ja_medidas) if bot.sala == plateia.destaque
+                                    for l in bot.latencias[n:])
+        plateia.fechar()
+    jogos = sum(bot.jogos for bot in bots) - jogos_antes
+    caidos = sum(1 for bot in bots if not bot.conectado)
+
+    for bot in bots:
+        bot.fechar()
+    if paradas is not None:
+        paradas.fechar()
+
+    relatorio = {
+        'conexoes': conexoes,
+        'codec': codec,
+        'jogadas_por_segundo_por_bot': jogadas_por_segundo,
+        'duracao_s': round(janela, 2),
+        'conexoes_por_s': round(conexoes / tempo_conexao, 1),
+        'jogadas_por_s': round(len(latencias) / janela, 1),
+        'jogos_por_s': round(jogos / 2 / janela, 1),  # cada jogo é contado pelos dois bots
+        'latencia_ms': resumo_latencias(latencias),
+        'jogadas_medidas': len(latencias),
+        'conexoes_caidas': caidos,
+    }
+    if memoria is not None:
+        relatorio['conexoes_paradas'] = memoria
+    if plateia is not None:
+        relatorio['espectadores'] = {
+            'quantidade': espectadores,
+            'sala_destaque': plateia.destaque,
+            'bytes_recebidos_por_s': round(plateia.bytes / janela, 1),
+            'latencia_destaque_ms': resumo_latencias(latencias_destaque),
+            'jogadas_destaque_medidas': len(latencias_destaque),
+        }
+    return relatorio
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark do servidor do Jogo da Velha")
+    parser.add_argument('--conexoes', type=int, default=200, help="número de bots (pares viram jogos)")
+    parser.add_argument('--duracao', type=float, default=10.0, help="segundos de jogo medidos")
+    parser.add_argument('--jogadas-por-segundo', type=float, default=0.0,
+                        help="ritmo de cada bot na sua vez (0 = o mais rápido possível)")
+    parser.add_argument('--codec', choices=sorted(CODECS), default='json')
+    parser.add_argument('--espectadores', type=int, default=0,
+                        help="sockets assistindo a partida em destaque durante a medição")
+    parser.add_argument('--modo', choices=['threads', 'async'], default='threads',
+                        help="modo do servidor que o benchmark sobe")
+    parser.add_argument('--processos', type=int, default=1,
+                        help="processos trabalhadores do servidor que o benchmark sobe")
+    parser.add_argument('--pipeline', action='store_true', help="servidor que o benchmark sobe no modo pipeline")
+    parser.add_argument('--variante', choices=sorted(VARIANTES), help="tabuleiro dos jogos (padrão: jogo da velha)")
+    parser.add_argument('--ociosas', type=int, default=0,
+                        help="antes dos bots, abre N conexões que não jogam e mede a memória do servidor por conexão")
+    parser.add_argument('--porta', type=int, default=None,
+                        help="usar um servidor já rodando em 127.0.0.1 nesta porta")
+    parser.add_argument('--saida', help="também grava o relatório JSON neste arquivo")
+    args = parser.parse_args()
+
+    processo = None
+    porta = args.porta
+    if porta is None:
+        processo, porta = subir_servidor(args.modo, args.processos, args.pipeline)
+
+    saida_original = sys.stdout
+    sys.stdout = open(os.devnull, 'w')  # os bots imprimem cada mensagem: silencia
+    try:
+        relatorio = medir(porta, args.conexoes, args.duracao, args.jogadas_por_segundo, args.codec,
+                          args.espectadores, args.variante, args.ociosas, processo.pid if processo else None)
+    finally:
+        sys.stdout = saida_original
+        if processo:
+            processo.terminate()
+            processo.wait()
+    if processo:
+        relatorio['modo_servidor'] = args.modo
+        relatorio['processos_servidor'] = args.processos
+        relatorio['pipeline'] = args.pipeline
+    if args.variante:
+        relatorio['variante'] = args.variante
+
+    texto = json.dumps(relatorio, indent=2)
+    print(texto)
+    if args.saida:
+        with open(args.saida, 'w') as arquivo:
+            arquivo.write(texto + '\n')
+
+
+if __name__ == '__main__':
+    main()
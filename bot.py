@@ -0,0 +1,109 @@
+import argparse
+import random
+import time
+from threading import Event, Lock
+
+from cliente_base import ClienteBase
+from tabuleiro import VARIANTES
+
+class ClienteBot(ClienteBase):
+    """Cliente sem interface que joga jogadas aleatórias válidas
+
+    Usa o mesmo protocolo do cliente Tk (ClienteBase). Na sua vez, espera
+    intervalo_jogada e joga numa casa livre; no fim de cada jogo o X pede
+    REINICIAR até completar 'rodadas'. Mede o tempo entre enviar a jogada
+    e receber o broadcast dela de volta.
+    """
+    jogada_prevista = False  # a latência medida é a ida e volta ao servidor
+
+    def __init__(self, ip_servidor, porta=12111, codec='json', intervalo_jogada=0.0, rodadas=None, rating=None,
+                 contra_bot=False, variante=None):
+        super().__init__(ip_servidor, porta, codec, rating, contra_bot, variante=variante)
+        self.intervalo_jogada = intervalo_jogada
+        self.rodadas = rodadas  # None: joga até ser parado
+        self.jogos = 0
+        self.latencias = []  # segundos entre JOGADA e o JOGADA_OK/FIM_JOGO dela
+        self.pendente = None  # (linha, coluna, instante do envio) da jogada esperando broadcast
+        self.lock_jogada = Lock()
+        self.pronto = Event()  # CONECTADO recebido
+        self.terminou = Event()  # completou as rodadas ou perdeu a conexão
+        self.instante_conectado = None
+
+    def processar_resposta(self, mensagem):
+        super().processar_resposta(mensagem)
+        if mensagem.get('tipo') == 'CONECTADO':
+            self.instante_conectado = time.perf_counter()
+            self.pronto.set()
+
+    def atualizar_turno(self, turno):
+        if turno != self.meu_simbolo or not self.jogo_ativo:
+            return
+        with self.lock_jogada:
+            if self.pendente is not None:
+                return  # já jogou, esperando o broadcast
+            tamanho = len(self.tabuleiro)
+            livres = [(i, j) for i in range(tamanho) for j in range(tamanho) if self.tabuleiro[i][j] == '']
+            if not livres:
+                return
+            linha, coluna = random.choice(livres)
+            if self.intervalo_jogada:
+                time.sleep(self.intervalo_jogada)
+                if not self.conectado:
+                    return  # fechado enquanto esperava
+            self.pendente = (linha, coluna, time.perf_counter())
+        self.enviar_jogada(linha, coluna)
+
+    def atualizar_casa(self, linha, coluna):
+        with self.lock_jogada:
+            if self.pendente is None or self.pendente[:2] != (linha, coluna):
+                return
+            if self.tabuleiro[linha][coluna] == self.meu_simbolo:
+                self.latencias.append(time.perf_counter() - self.pendente[2])
+            self.pendente = None
+
+    def atualizar_tabuleiro(self):
+        # Tabuleiro inteiro (v1, ESTADO, REINICIO): se a jogada pendente já está nele, conta
+        with self.lock_jogada:
+            pendente = self.pendente
+        if pendente is not None:
+            self.atualizar_casa(*pendente[:2])
+
+    def mostrar_erro(self, mensagem):
+        with self.lock_jogada:
+            self.pendente = None  # a jogada foi recusada
+
+    def finalizar_jogo(self, ganhador):
+        self.jogos += 1
+        if self.rodadas is not None and self.jogos >= self.rodadas:
+            self.terminou.set()
+        elif self.meu_simbolo == 'X':
+            self.reiniciar_jogo()
+
+    def oponente_desconectou(self, mensagem):
+        with self.lock_jogada:
+            self.pendente = None
+
+    def ao_desconectar(self):
+        self.terminou.set()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Bot do Jogo da Velha (sem interface)")
+    parser.add_argument('--ip', default='127.0.0.1')
+    parser.add_argument('--porta', type=int, default=12111)
+    parser.add_argument('--codec', choices=['json', 'binario'], default='json')
+    parser.add_argument('--intervalo-jogada', type=float, default=0.5)
+    parser.add_argument('--rodadas', type=int, default=None)
+    parser.add_argument('--rating', type=int, default=None)
+    parser.add_argument('--contra-bot', action='store_true', help="jogar contra o bot de jogo perfeito do servidor")
+    parser.add_argument('--variante', choices=sorted(VARIANTES), help="tabuleiro pedido (padrão: jogo da velha)")
+    args = parser.parse_args()
+
+    bot = ClienteBot(args.ip, args.porta, args.codec, args.intervalo_jogada, args.rodadas, args.rating,
+                     args.contra_bot, args.variante)
+    bot.abrir_conexao()
+    try:
+        bot.terminou.wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        bot.fechar()
@@ -1,29 +1,30 @@
-import socket
-import json
+import queue
 import tkinter as tk
 from tkinter import messagebox
-from threading import Thread, Lock
-import time
 
-class ClienteJogoDaVelha:
-    def __init__(self, ip_servidor, porta=12111):
-        # Configuração de rede
-        self.ip_servidor = ip_servidor
-        self.porta = porta
-        self.cliente = None
-        self.conectado = False
+from cliente_base import ClienteBase
+
+INTERVALO_BOMBA_MS = 16  # a fila de entrada é esvaziada (e a tela redesenhada) até ~60 vezes por segundo
+_DESCONECTOU = object()
+
+class ClienteJogoDaVelha(ClienteBase):
+    """Interface Tk: o protocolo e o estado do jogo vêm do ClienteBase
+
+    A thread de rede nunca toca no Tk: ela só coloca as mensagens numa fila. A bomba
+    (janela.after na thread do Tk) esvazia a fila, aplica tudo ao estado e redesenha uma
+    vez só, e só as casas e textos que mudaram desde o último desenho.
+    """
+    def __init__(self, ip_servidor, porta=12111, codec='json', rating=None, contra_bot=False, espectador=False,
+                 sala=None, variante=None):
+        super().__init__(ip_servidor, porta, codec, rating, contra_bot, espectador, sala, variante)
         self.tentativas_reconexao = 0
         self.max_tentativas = 5
-        
-        # Estado do jogo
-        self.meu_simbolo = None
-        self.turno_atual = 'X'
-        self.tabuleiro = [['' for _ in range(3)] for _ in range(3)]
-        self.jogo_ativo = False
-        self.lock = Lock()
-        
-        # Buffer para mensagens TCP
-        self.buffer = ""
+        self.reconexao_agendada = False
+        self.entrada = queue.SimpleQueue()  # mensagens da thread de rede para a thread do Tk
+        self.exibido = []  # valor desenhado em cada botão
+        self.casas_sujas = set()  # casas mudadas desde o último desenho
+        self.tudo_sujo = False  # tabuleiro trocado inteiro: compara todas as casas
+        self.textos = {}  # {label: (texto, cor)} pendentes de desenho
         
         # Interface gráfica
         self.janela = tk.Tk()
@@ -36,6 +37,7 @@ class ClienteJogoDaVelha:
         
         # Conectar após criar interface
         self.janela.after(100, self.conectar_servidor)
+        self.janela.after(INTERVALO_BOMBA_MS, self.bombear)
     
     def criar_interface(self):
         """Cria a interface gráfica do jogo"""
@@ -61,28 +63,11 @@ class ClienteJogoDaVelha:
         )
         self.label_turno.pack()
         
-        # Frame do tabuleiro
-        frame_tabuleiro = tk.Frame(self.janela, bg='#34495e')
-        frame_tabuleiro.pack(pady=20)
-        
+        # Frame do tabuleiro (os botões são refeitos se a partida vier com outro tamanho)
+        self.frame_tabuleiro = tk.Frame(self.janela, bg='#34495e')
+        self.frame_tabuleiro.pack(pady=20)
         self.botoes = []
-        for i in range(3):
-            linha_botoes = []
-            for j in range(3):
-                btn = tk.Button(
-                    frame_tabuleiro,
-                    text='',
-                    font=('Arial', 32, 'bold'),
-                    width=5,
-                    height=2,
-                    bg='#ecf0f1',
-                    fg='#2c3e50',
-                    activebackground='#bdc3c7',
-                    command=lambda linha=i, col=j: self.fazer_jogada(linha, col)
-                )
-                btn.grid(row=i, column=j, padx=5, pady=5)
-                linha_botoes.append(btn)
-            self.botoes.append(linha_botoes)
+        self.criar_grade(3)
         
         # Botão de reiniciar
         self.btn_reiniciar = tk.Button(
@@ -97,6 +82,15 @@ class ClienteJogoDaVelha:
         )
         self.btn_reiniciar.pack(pady=10)
         
+        # Botão de dica (melhor jogada segundo o servidor)
+        self.btn_dica = tk.Button(
+            self.janela,
+            text="Dica",
+            font=('Arial', 10),
+            command=self.pedir_dica
+        )
+        self.btn_dica.pack()
+        
         # Indicador de conexão
         self.label_conexao = tk.Label(
             self.janela,
@@ -106,201 +100,136 @@ class ClienteJogoDaVelha:
         )
         self.label_conexao.pack(pady=5)
     
+    def criar_grade(self, tamanho):
+        """Botões do tabuleiro N x N; nos tabuleiros grandes, menores e sem espaço entre eles"""
+        for linha_botoes in self.botoes:
+            for btn in linha_botoes:
+                btn.destroy()
+        grande = tamanho > 3
+        self.botoes = []
+        for i in range(tamanho):
+            linha_botoes = []
+            for j in range(tamanho):
+                btn = tk.Button(
+                    self.frame_tabuleiro,
+                    text='',
+                    font=('Arial', 10 if grande else 32, 'bold'),
+                    width=2 if grande else 5,
+                    height=1 if grande else 2,
+                    bg='#ecf0f1',
+                    fg='#2c3e50',
+                    activebackground='#bdc3c7',
+                    command=lambda linha=i, col=j: self.fazer_jogada(linha, col)
+                )
+                btn.grid(row=i, column=j, padx=0 if grande else 5, pady=0 if grande else 5)
+                linha_botoes.append(btn)
+            self.botoes.append(linha_botoes)
+        self.exibido = [[''] * tamanho for _ in range(tamanho)]
+        if grande:
+            self.janela.geometry('')  # a janela cresce até caber o tabuleiro
+    
+    def bombear(self):
+        """Esvazia a fila de entrada e redesenha o que mudou (thread do Tk)"""
+        try:
+            while True:
+                mensagem = self.entrada.get_nowait()
+                if mensagem is _DESCONECTOU:
+                    self.desconectou()
+                else:
+                    if mensagem.get('tipo') in ('CONECTADO', 'ASSISTINDO'):
+                        # Só o handshake zera a espera: um servidor que aceita e fecha
+                        # (cheio, limite de mensagens) continua alargando o intervalo
+                        self.tentativas_reconexao = 0
+                    self.processar_resposta(mensagem)
+        except queue.Empty:
+            pass
+        finally:
+            self.desenhar()
+            self.janela.after(INTERVALO_BOMBA_MS, self.bombear)
+    
+    def desenhar(self):
+        """Aplica no Tk só as diferenças entre o estado e o que está na tela"""
+        if self.tudo_sujo:
+            if len(self.tabuleiro) != len(self.botoes):
+                self.criar_grade(len(self.tabuleiro))
+            tamanho = len(self.tabuleiro)
+            casas = [(i, j) for i in range(tamanho) for j in range(tamanho)]
+        else:
+            casas = self.casas_sujas
+        for linha, coluna in casas:
+            valor = self.tabuleiro[linha][coluna]
+            if valor != self.exibido[linha][coluna]:
+                self.exibido[linha][coluna] = valor
+                self.botoes[linha][coluna].config(
+                    text=valor,
+                    fg='#e74c3c' if valor == 'X' else '#3498db' if valor == 'O' else '#2c3e50'
+                )
+        self.casas_sujas = set()
+        self.tudo_sujo = False
+        for label, (texto, cor) in self.textos.items():
+            if cor is None:
+                label.config(text=texto)
+            else:
+                label.config(text=texto, fg=cor)
+        self.textos.clear()
+    
+    def atualizar_tabuleiro(self):
+        self.tudo_sujo = True
+    
     def conectar_servidor(self):
         """Conecta ao servidor usando TCP"""
+        self.reconexao_agendada = False
         if self.conectado:
             return
         
         try:
-            print(f"Conectando ao servidor {self.ip_servidor}:{self.porta}...")
-            self.cliente = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.cliente.settimeout(10.0)
-            self.cliente.connect((self.ip_servidor, self.porta))
-            
-            self.conectado = True
-            self.tentativas_reconexao = 0
-            
-            print("✓ Conectado ao servidor!")
+            self.abrir_conexao()
             self.atualizar_status("Conectado! Aguardando jogadores...")
             self.label_conexao.config(text="● Conectado", fg='#27ae60')
             
-            # Iniciar threads
-            Thread(target=self.receber_mensagens, daemon=True).start()
-            Thread(target=self.enviar_heartbeat, daemon=True).start()
-            
-            # Enviar mensagem de conexão
-            endereco = f"{self.cliente.getsockname()[0]}:{self.cliente.getsockname()[1]}"
-            mensagem = {'tipo': 'CONECTAR', 'endereco': endereco}
-            self.enviar_mensagem(mensagem)
-            
         except Exception as e:
             print(f"Erro ao conectar: {e}")
             self.conectado = False
-            self.tentativas_reconexao += 1
+            if self.reconexao_agendada:
+                return  # caiu logo depois do connect: desconectou() já agendou a próxima
             
-            if self.tentativas_reconexao < self.max_tentativas:
-                tempo_espera = min(3000 * self.tentativas_reconexao, 10000)
-                self.atualizar_status(f"Erro na conexão. Tentando novamente em {tempo_espera//1000}s...")
-                self.janela.after(tempo_espera, self.conectar_servidor)
+            tempo_espera = self.agendar_reconexao()
+            if tempo_espera is not None:
+                self.atualizar_status(f"Erro na conexão. Tentando novamente em {tempo_espera:.1f}s...")
             else:
                 self.atualizar_status("Não foi possível conectar ao servidor")
+                self.desenhar()
                 messagebox.showerror("Erro", "Não foi possível conectar ao servidor após várias tentativas.")
     
-    def enviar_heartbeat(self):
-        """Envia ping periódico para manter conexão ativa"""
-        while self.conectado:
-            try:
-                time.sleep(5)
-                if self.conectado:
-                    self.enviar_mensagem({'tipo': 'PING'})
-            except:
-                break
+    def agendar_reconexao(self):
+        """Agenda a próxima tentativa (uma por vez) e retorna a espera; None se acabaram as tentativas
+        
+        A espera cresce a cada tentativa e só volta ao começo com um CONECTADO: quedas logo
+        depois do connect (servidor cheio, limite de mensagens) também contam.
+        """
+        if self.tentativas_reconexao >= self.max_tentativas:
+            return None
+        tempo_espera = self.atraso_reconexao(self.tentativas_reconexao)
+        self.tentativas_reconexao += 1
+        self.reconexao_agendada = True
+        self.janela.after(int(tempo_espera * 1000), self.conectar_servidor)
+        return tempo_espera
     
-    def enviar_mensagem(self, mensagem):
-        """Envia mensagem para o servidor"""
-        try:
-            if self.cliente and self.conectado:
-                dados = json.dumps(mensagem) + '\n'
-                self.cliente.sendall(dados.encode())
-                print(f"Enviado: {mensagem.get('tipo')}")
-        except Exception as e:
-            print(f"Erro ao enviar mensagem: {e}")
-            self.desconectar()
+    def entregar(self, mensagem):
+        # Thread de rede: só enfileira; a bomba processa na thread do Tk
+        self.entrada.put(mensagem)
     
-    def receber_mensagens(self):
-        """Recebe mensagens do servidor continuamente"""
-        while self.conectado:
-            try:
-                dados = self.cliente.recv(4096).decode()
-                if not dados:
-                    print("Servidor desconectado")
-                    self.desconectar()
-                    break
-                
-                self.buffer += dados
-                
-                # Processar mensagens completas
-                while '\n' in self.buffer:
-                    linha, self.buffer = self.buffer.split('\n', 1)
-                    if linha.strip():
-                        mensagem = json.loads(linha)
-                        print(f"Recebido: {mensagem.get('tipo')}")
-                        
-                        # Processar na thread principal
-                        self.janela.after(0, self.processar_resposta, mensagem)
-                
-            except socket.timeout:
-                continue
-            except Exception as e:
-                if self.conectado:
-                    print(f"Erro ao receber: {e}")
-                    self.desconectar()
-                break
+    def ao_desconectar(self):
+        self.entrada.put(_DESCONECTOU)
     
-    def desconectar(self):
-        """Desconecta do servidor"""
-        with self.lock:
-            if not self.conectado:
-                return
-            
-            self.conectado = False
-            self.jogo_ativo = False
-            
-            try:
-                if self.cliente:
-                    self.cliente.close()
-            except:
-                pass
-            
-            print("Desconectado do servidor")
-            self.janela.after(0, self.atualizar_status, "Desconectado do servidor")
-            self.janela.after(0, lambda: self.label_conexao.config(text="● Desconectado", fg='#e74c3c'))
-            
-            # Tentar reconectar
-            if self.tentativas_reconexao < self.max_tentativas:
-                self.janela.after(3000, self.conectar_servidor)
-    
-    def processar_resposta(self, mensagem):
-        """Processa resposta do servidor"""
-        tipo = mensagem.get('tipo')
-        
-        if tipo == 'PONG':
-            return  # Heartbeat response
-        
-        elif tipo == 'CONECTADO':
-            with self.lock:
-                self.meu_simbolo = mensagem.get('simbolo')
-                jogadores = mensagem.get('jogadores')
-                self.jogo_ativo = mensagem.get('jogo_iniciado', False)
-                
-                if mensagem.get('tabuleiro'):
-                    self.tabuleiro = mensagem.get('tabuleiro')
-                    self.atualizar_tabuleiro()
-                
-                if mensagem.get('turno_atual'):
-                    self.turno_atual = mensagem.get('turno_atual')
-                
-                # Atualizar interface
-                if self.jogo_ativo and jogadores == 2:
-                    self.atualizar_status(f"Você é: {self.meu_simbolo}")
-                    self.atualizar_turno(self.turno_atual)
-                    print(f"✓ Jogo iniciado! Você é {self.meu_simbolo}")
-                else:
-                    self.atualizar_status(f"Você é: {self.meu_simbolo} | Aguardando oponente...")
-                    self.label_turno.config(text="")
-        
-        elif tipo == 'JOGO_INICIADO':
-            with self.lock:
-                self.meu_simbolo = mensagem.get('simbolo')
-                self.jogo_ativo = True
-                self.tabuleiro = mensagem.get('tabuleiro')
-                self.turno_atual = mensagem.get('turno_atual')
-            
-            print(f"✓✓✓ JOGO INICIADO! Você é {self.meu_simbolo}")
-            self.atualizar_tabuleiro()
-            self.atualizar_status(f"Você é: {self.meu_simbolo}")
-            self.atualizar_turno(self.turno_atual)
-        
-        elif tipo == 'JOGADA_OK':
-            with self.lock:
-                self.tabuleiro = mensagem.get('tabuleiro')
-                self.turno_atual = mensagem.get('proximo_turno')
-            self.atualizar_tabuleiro()
-            self.atualizar_turno(self.turno_atual)
-        
-        elif tipo == 'FIM_JOGO':
-            with self.lock:
-                self.tabuleiro = mensagem.get('tabuleiro')
-                self.jogo_ativo = False
-                ganhador = mensagem.get('ganhador')
-            self.atualizar_tabuleiro()
-            self.finalizar_jogo(ganhador)
+    def desconectou(self):
+        self.atualizar_status("Desconectado do servidor")
+        self.label_conexao.config(text="● Desconectado", fg='#e74c3c')
         
-        elif tipo == 'ERRO':
-            msg = mensagem.get('mensagem')
-            print(f"Erro do servidor: {msg}")
-            if msg not in ['Não é seu turno', 'Casa ocupada']:
-                messagebox.showwarning("Aviso", msg)
-        
-        elif tipo == 'REINICIO':
-            with self.lock:
-                self.tabuleiro = mensagem.get('tabuleiro', [['' for _ in range(3)] for _ in range(3)])
-                self.jogo_ativo = True
-                self.turno_atual = mensagem.get('turno_atual', 'X')
-            self.atualizar_tabuleiro()
-            self.atualizar_status(f"Você é: {self.meu_simbolo}")
-            self.atualizar_turno(self.turno_atual)
-            self.btn_reiniciar.config(state=tk.DISABLED)
-        
-        elif tipo == 'OPONENTE_DESCONECTOU':
-            with self.lock:
-                self.jogo_ativo = False
-                self.tabuleiro = [['' for _ in range(3)] for _ in range(3)]
-            self.atualizar_tabuleiro()
-            self.atualizar_status("Oponente desconectou - Aguardando novo jogador...")
-            self.label_turno.config(text="")
-            self.btn_reiniciar.config(state=tk.DISABLED)
-            messagebox.showinfo("Aviso", mensagem.get('mensagem'))
+        # Tentar reconectar logo: com a sessão, o servidor guarda o lugar só por alguns segundos.
+        # Quedas seguidas sem CONECTADO no meio esperam cada vez mais
+        if not self.reconexao_agendada and self.agendar_reconexao() is None:
+            self.atualizar_status("Não foi possível voltar ao servidor")
     
     def fazer_jogada(self, linha, coluna):
         """Envia jogada para o servidor"""
@@ -319,34 +248,54 @@ class ClienteJogoDaVelha:
             if self.tabuleiro[linha][coluna] != '':
                 return  # Silenciosamente ignora casa ocupada
         
-        print(f"Fazendo jogada: ({linha}, {coluna})")
-        mensagem = {
-            'tipo': 'JOGADA',
-            'linha': linha,
-            'coluna': coluna
-        }
-        self.enviar_mensagem(mensagem)
+        self.enviar_jogada(linha, coluna)
+        self.desenhar()  # a jogada prevista aparece já, sem esperar a bomba nem o servidor
     
-    def atualizar_tabuleiro(self):
-        """Atualiza a visualização do tabuleiro"""
-        for i in range(3):
-            for j in range(3):
-                valor = self.tabuleiro[i][j]
-                self.botoes[i][j].config(
-                    text=valor,
-                    fg='#e74c3c' if valor == 'X' else '#3498db' if valor == 'O' else '#2c3e50'
-                )
+    def atualizar_casa(self, linha, coluna):
+        """Marca a casa para o próximo desenho"""
+        self.casas_sujas.add((linha, coluna))
     
     def atualizar_status(self, texto):
-        """Atualiza o texto de status"""
-        self.label_status.config(text=texto)
+        """Atualiza o texto de status (no próximo desenho; só o último de uma rajada aparece)"""
+        self.textos[self.label_status] = (texto, None)
     
     def atualizar_turno(self, turno):
         """Atualiza informação de turno"""
         if turno == self.meu_simbolo:
-            self.label_turno.config(text="SUA VEZ!", fg='#2ecc71')
+            self.textos[self.label_turno] = ("SUA VEZ!", '#2ecc71')
         else:
-            self.label_turno.config(text="Vez do oponente...", fg='#e67e22')
+            self.textos[self.label_turno] = ("Vez do oponente...", '#e67e22')
+    
+    def limpar_turno(self):
+        self.textos[self.label_turno] = ("", None)
+    
+    def jogo_reiniciado(self):
+        self.btn_reiniciar.config(state=tk.DISABLED)
+    
+    def oponente_desconectou(self, mensagem):
+        self.btn_reiniciar.config(state=tk.DISABLED)
+        self.desenhar()  # a caixa de diálogo segura a bomba: a tela tem que estar em dia antes
+        messagebox.showinfo("Aviso", mensagem)
+    
+    def mostrar_dica(self, linha, coluna, resultado):
+        """Destaca a casa sugerida por um instante"""
+        botao = self.botoes[linha][coluna]
+        botao.config(bg='#f9e79f')
+        self.janela.after(1500, lambda: botao.config(bg='#ecf0f1'))
+        if resultado == 'EMPATE':
+            previsao = "jogando perfeito, empata"
+        elif resultado == self.meu_simbolo:
+            previsao = "jogando perfeito, você vence"
+        else:
+            previsao = "jogando perfeito, o oponente vence"
+        self.atualizar_status(f"Você é: {self.meu_simbolo} | Dica: {previsao}")
+    
+    def mostrar_erro(self, mensagem):
+        if mensagem in ('Servidor cheio', 'Mensagens demais'):
+            self.atualizar_status(mensagem)  # sem janela: podem chegar em sequência
+        elif mensagem not in ['Não é seu turno', 'Casa ocupada', 'Jogada fora de sequência']:
+            self.desenhar()
+            messagebox.showwarning("Aviso", mensagem)
     
     def finalizar_jogo(self, ganhador):
         """Finaliza o jogo e exibe resultado"""
@@ -362,7 +311,8 @@ class ClienteJogoDaVelha:
             mensagem = "Você perdeu!"
             self.atualizar_status("Você perdeu...")
         
-        self.label_turno.config(text="")
+        self.limpar_turno()
+        self.desenhar()  # a jogada final aparece antes da caixa de diálogo
         messagebox.showinfo("Fim de Jogo", mensagem)
     
     def reiniciar_jogo(self):
@@ -371,21 +321,11 @@ class ClienteJogoDaVelha:
             messagebox.showinfo("Aviso", "Não conectado ao servidor")
             return
         
-        print("Solicitando reinício do jogo")
-        mensagem = {'tipo': 'REINICIAR'}
-        self.enviar_mensagem(mensagem)
+        super().reiniciar_jogo()
     
     def fechar_janela(self):
         """Fecha a janela e limpa recursos"""
-        with self.lock:
-            self.conectado = False
-        
-        try:
-            if self.cliente:
-                self.cliente.close()
-        except:
-            pass
-        
+        self.fechar()
         self.janela.destroy()
     
     def iniciar(self):
@@ -396,9 +336,15 @@ if __name__ == '__main__':
     # Configuração
     IP_SERVIDOR = '127.0.0.1'  # Altere para o IP do servidor
     PORTA = 12111
+    CODEC = 'json'  # 'binario' para o protocolo binário compacto
+    RATING = None  # ex.: 1500; o servidor procura oponentes de rating parecido
+    CONTRA_BOT = False  # True: joga contra o bot de jogo perfeito do servidor
+    ESPECTADOR = False  # True: só assiste a partida em destaque (ou a sala SALA)
+    SALA = None
+    VARIANTE = None  # 'gomoku' (15x15, 5 em linha) ou 'gomoku19' (19x19); None: jogo da velha
     
     print(f"Iniciando cliente...")
     print(f"Conectando a {IP_SERVIDOR}:{PORTA}")
     
-    cliente = ClienteJogoDaVelha(IP_SERVIDOR, PORTA)
+    cliente = ClienteJogoDaVelha(IP_SERVIDOR, PORTA, CODEC, RATING, CONTRA_BOT, ESPECTADOR, SALA, VARIANTE)
     cliente.iniciar()
\ No newline at end of file
@@ -0,0 +1,530 @@
+import random
+import socket
+import struct
+from threading import Thread, Lock, Event
+import time
+
+from protocolo import CODEC_JSON, CODECS, VERSAO_PROTOCOLO, Enquadrador, QuadroMuitoGrande
+
+PINGS_POR_RTT = 6  # com ping curto, um PING completo (com o RTT) a cada tantos heartbeats
+
+def tabuleiro_vazio(tamanho=3):
+    return [['' for _ in range(tamanho)] for _ in range(tamanho)]
+
+class ClienteBase:
+    """Lado cliente do protocolo, sem interface
+
+    Conexão, handshake, heartbeat, deltas e o estado do jogo ficam aqui. As subclasses
+    (interface Tk em cliente.py, bot em bot.py) só sobrescrevem os ganchos de exibição
+    (atualizar_*, finalizar_jogo, ...), que aqui não fazem nada.
+
+    Com jogada_prevista, a jogada aparece no tabuleiro local na hora em que é enviada,
+    marcada com o seq que o servidor vai dar a ela. A resposta do servidor confirma (delta
+    com o mesmo seq e a mesma casa) ou desfaz (ERRO com o seq, ou outra jogada com ele).
+    """
+    jogada_prevista = True
+    def __init__(self, ip_servidor, porta=12111, codec='json', rating=None, contra_bot=False, espectador=False,
+                 sala=None, variante=None):
+        # Configuração de rede
+        self.ip_servidor = ip_servidor
+        self.porta = porta
+        self.codec_pedido = codec  # 'json' ou 'binario', negociado no CONECTAR
+        self.rating = rating  # usado pelo servidor para escolher o oponente
+        self.contra_bot = contra_bot  # pedir o bot de jogo perfeito como oponente
+        self.variante = variante  # tabuleiro pedido no CONECTAR ('gomoku', ...); None: jogo da velha
+        self.espectador = espectador  # só assiste: ASSISTIR em vez de CONECTAR
+        self.sala_assistida = sala  # None: a partida em destaque (e a próxima, quando ela acabar)
+        self.sala = None
+        self.rtt_ms = None  # medido no connect e em cada PING/PONG
+        self.instante_ping = None
+        self.codec = CODEC_JSON
+        self.handshake = Event()  # setado quando o CONECTADO chega (codec já trocado)
+        self.intervalo_ping = 5.0  # o servidor pode mudar no CONECTADO
+        self.ping_curto = False  # servidor aceita quadro vazio como PING (anunciado no CONECTADO)
+        self.ultimo_envio = 0.0  # qualquer quadro enviado já conta como sinal de vida
+        self.sessao = None  # token do CONECTADO: reconectando com ele, volta para o mesmo jogo
+        self.cliente = None
+        self.conectado = False
+        self.lock_envio = Lock()  # heartbeat e jogadas saem de threads diferentes
+
+        # Estado do jogo
+        self.meu_simbolo = None
+        self.turno_atual = 'X'
+        self.tabuleiro = tabuleiro_vazio()
+        self.seq = 0  # última jogada confirmada pelo servidor (protocolo v2)
+        self.versao = 1  # versão do protocolo que o servidor aceitou no CONECTADO
+        self.previsao = None  # (seq, linha, coluna, turno antes) jogada aplicada localmente sem resposta ainda
+        self.jogo_ativo = False
+        self.lock = Lock()
+
+        # Buffer para mensagens TCP
+        self.enquadrador = Enquadrador()
+
+    def abrir_conexao(self):
+        """Conecta ao servidor, inicia as threads e envia o CONECTAR, ou o RETOMAR se já houver
+        sessão (exceções sobem para quem chamou)"""
+        print(f"Conectando ao servidor {self.ip_servidor}:{self.porta}...")
+        self.cliente = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.cliente.settimeout(10.0)
+        inicio = time.perf_counter()
+        self.cliente.connect((self.ip_servidor, self.porta))
+        if self.rtt_ms is None:
+            self.rtt_ms = (time.perf_counter() - inicio) * 1000  # o handshake TCP é uma ida e volta
+
+        self.conectado = True
+        self.codec = CODEC_JSON
+        self.enquadrador = Enquadrador()
+        self.handshake.clear()
+        print("✓ Conectado ao servidor!")
+
+        # Iniciar threads
+        Thread(target=self.receber_mensagens, daemon=True).start()
+        Thread(target=self.enviar_heartbeat, daemon=True).start()
+
+        # Enviar mensagem de conexão
+        if self.espectador:
+            self.enviar_assistir()
+        elif self.sessao:
+            self.enviar_mensagem({'tipo': 'RETOMAR', 'sessao': self.sessao, 'versao': VERSAO_PROTOCOLO,
+                                  'codec': self.codec_pedido})
+        else:
+            self.enviar_conectar()
+
+    def enviar_conectar(self):
+        endereco = f"{self.cliente.getsockname()[0]}:{self.cliente.getsockname()[1]}"
+        mensagem = {'tipo': 'CONECTAR', 'endereco': endereco, 'versao': VERSAO_PROTOCOLO,
+                    'codec': self.codec_pedido, 'rtt_ms': round(self.rtt_ms)}
+        if self.rating is not None:
+            mensagem['rating'] = self.rating
+        if self.contra_bot:
+            mensagem['oponente'] = 'bot'
+        if self.variante is not None:
+            mensagem['variante'] = self.variante
+        self.enviar_mensagem(mensagem)
+
+    def enviar_assistir(self):
+        mensagem = {'tipo': 'ASSISTIR', 'codec': self.codec_pedido}
+        if self.sala_assistida is not None:
+            mensagem['sala'] = self.sala_assistida
+        self.enviar_mensagem(mensagem)
+
+    def papel(self):
+        """Texto de status com o papel deste cliente na sala"""
+        if self.espectador:
+            return f"Assistindo a sala {self.sala}" if self.sala is not None else "Aguardando uma partida..."
+        return f"Você é: {self.meu_simbolo}"
+
+    def atraso_reconexao(self, tentativa):
+        """Segundos até a próxima tentativa: exponencial com jitter, para que clientes que
+        caíram juntos não voltem todos no mesmo instante"""
+        return min(0.5 * 2 ** tentativa, 10.0) * random.uniform(0.5, 1.0)
+
+    def enviar_heartbeat(self):
+        """Envia ping periódico para manter conexão ativa
+
+        Se alguma mensagem saiu no último intervalo, não precisa de ping. Com ping_curto, o ping
+        é um quadro vazio; o PING completo (que leva o RTT medido) só vai a cada PINGS_POR_RTT.
+        """
+        pings = 0
+        while self.conectado:
+            try:
+                time.sleep(self.intervalo_ping)
+                # Antes do CONECTADO o codec ainda pode mudar: não manda nada no meio do handshake
+                if not (self.conectado and self.handshake.is_set()):
+                    continue
+                if time.monotonic() - self.ultimo_envio < self.intervalo_ping:
+                    continue
+                self.instante_ping = time.perf_counter()
+                if self.ping_curto and pings % PINGS_POR_RTT:
+                    self.enviar_bytes(self.codec.quadro_vazio)
+                else:
+                    self.enviar_mensagem({'tipo': 'PING', 'rtt_ms': min(round(self.rtt_ms), 65535)})
+                pings += 1
+            except:
+                break
+
+    def enviar_bytes(self, quadro):
+        """Envia um quadro já codificado (sem log: é o ping curto)"""
+        try:
+            if self.cliente and self.conectado:
+                with self.lock_envio:
+                    self.cliente.sendall(quadro)
+                self.ultimo_envio = time.monotonic()
+        except Exception as e:
+            print(f"Erro ao enviar mensagem: {e}")
+            self.desconectar()
+
+    def enviar_mensagem(self, mensagem):
+        """Envia mensagem para o servidor"""
+        try:
+            if self.cliente and self.conectado:
+                with self.lock_envio:
+                    self.cliente.sendall(self.codec.codificar(mensagem))
+                self.ultimo_envio = time.monotonic()
+                print(f"Enviado: {mensagem.get('tipo')}")
+        except Exception as e:
+            print(f"Erro ao enviar mensagem: {e}")
+            self.desconectar()
+
+    def receber_mensagens(self):
+        """Recebe mensagens do servidor continuamente"""
+        while self.conectado:
+            try:
+                if not self.enquadrador.receber(self.cliente):
+                    print("Servidor desconectado")
+                    self.desconectar()
+                    break
+
+                # Processar mensagens completas
+                while True:
+                    quadro = self.enquadrador.proximo_quadro(self.codec)
+                    if quadro is None:
+                        break
+                    if not quadro:
+                        # PONG curto: só mede o RTT, não passa pela interface
+                        if self.instante_ping is not None:
+                            self.rtt_ms = (time.perf_counter() - self.instante_ping) * 1000
+                            self.instante_ping = None
+                        continue
+                    mensagem = self.codec.decodificar(quadro)
+                    if mensagem is None:
+                        continue
+                    print(f"Recebido: {mensagem.get('tipo')}")
+
+                    if mensagem.get('tipo') in ('CONECTADO', 'ASSISTINDO'):
+                        # Troca de codec já aqui: o próximo quadro do buffer pode vir no codec novo
+                        self.codec = CODECS.get(mensagem.get('codec', 'json'), CODEC_JSON)
+                        self.intervalo_ping = mensagem.get('intervalo_ping', self.intervalo_ping)
+                        self.ping_curto = bool(mensagem.get('ping_curto'))
+                        self.handshake.set()
+                    elif mensagem.get('tipo') == 'PONG' and self.instante_ping is not None:
+                        # RTT medido aqui, não depois da fila da interface; vai no próximo PING
+                        self.rtt_ms = (time.perf_counter() - self.instante_ping) * 1000
+                        self.instante_ping = None
+
+                    self.entregar(mensagem)
+
+            except socket.timeout:
+                continue
+            except QuadroMuitoGrande as e:
+                print(f"Erro ao receber: {e}")
+                self.desconectar()
+                break
+            except (ValueError, struct.error) as e:
+                print(f"Erro ao decodificar mensagem ({self.codec.nome}): {e}")
+            except Exception as e:
+                if self.conectado:
+                    print(f"Erro ao receber: {e}")
+                    self.desconectar()
+                break
+
+    def entregar(self, mensagem):
+        """Encaminha a mensagem recebida (aqui na própria thread de recepção)"""
+        self.processar_resposta(mensagem)
+
+    def desconectar(self):
+        """Desconecta do servidor"""
+        with self.lock:
+            if not self.conectado:
+                return
+
+            self.conectado = False
+            self.jogo_ativo = False
+
+            try:
+                if self.cliente:
+                    self.cliente.close()
+            except:
+                pass
+
+            print("Desconectado do servidor")
+            self.ao_desconectar()
+
+    def fechar(self):
+        """Encerra a conexão sem tentar reconectar"""
+        if self.conectado and self.handshake.is_set():
+            self.enviar_mensagem({'tipo': 'SAIR'})  # libera o lugar na hora, sem esperar a reserva
+        self.sessao = None
+        with self.lock:
+            self.conectado = False
+
+        try:
+            if self.cliente:
+                # shutdown antes do close: a thread de recepção pode estar presa no recv
+                self.cliente.shutdown(socket.SHUT_RDWR)
+                self.cliente.close()
+        except:
+            pass
+
+    def processar_resposta(self, mensagem):
+        """Processa resposta do servidor"""
+        tipo = mensagem.get('tipo')
+
+        if tipo == 'PONG':
+            return  # Heartbeat response
+
+        elif tipo == 'CONECTADO':
+            with self.lock:
+                self.meu_simbolo = mensagem.get('simbolo')
+                self.sala = mensagem.get('sala')
+                self.sessao = mensagem.get('sessao', self.sessao)
+                self.versao = mensagem.get('versao', 1)
+                self.previsao = None
+                jogadores = mensagem.get('jogadores')
+                self.jogo_ativo = mensagem.get('jogo_iniciado', False)
+                self.seq = mensagem.get('seq', 0)
+
+                if mensagem.get('tabuleiro'):
+                    self.tabuleiro = mensagem.get('tabuleiro')
+                    self.atualizar_tabuleiro()
+
+                if mensagem.get('turno_atual'):
+                    self.turno_atual = mensagem.get('turno_atual')
+
+                iniciado = self.jogo_ativo and jogadores == 2
+
+            # Atualizar interface
+            if iniciado:
+                self.atualizar_status(f"Você é: {self.meu_simbolo}")
+                self.atualizar_turno(self.turno_atual)
+                print(f"✓ Jogo iniciado! Você é {self.meu_simbolo}")
+            else:
+                self.atualizar_status(f"Você é: {self.meu_simbolo} | Aguardando oponente...")
+                self.limpar_turno()
+
+        elif tipo == 'ASSISTINDO':
+            with self.lock:
+                self.sala = mensagem.get('sala')
+                self.jogo_ativo = mensagem.get('jogo_iniciado', False)
+                self.tabuleiro = mensagem.get('tabuleiro')
+                self.turno_atual = mensagem.get('turno_atual')
+                self.seq = mensagem.get('seq', 0)
+            self.atualizar_tabuleiro()
+            self.atualizar_status(self.papel())
+            if self.jogo_ativo:
+                self.atualizar_turno(self.turno_atual)
+            else:
+                self.limpar_turno()
+
+        elif tipo == 'SALA_ENCERRADA':
+            if self.espectador and self.sala_assistida is None:
+                self.enviar_assistir()  # segue para a próxima partida em destaque
+            else:
+                self.atualizar_status("Partida encerrada")
+                self.limpar_turno()
+
+        elif tipo == 'JOGO_INICIADO':
+            with self.lock:
+                self.meu_simbolo = mensagem.get('simbolo')
+                self.sala = mensagem.get('sala')
+                self.jogo_ativo = True
+                self.previsao = None
+                self.tabuleiro = mensagem.get('tabuleiro')
+                self.turno_atual = mensagem.get('turno_atual')
+                self.seq = mensagem.get('seq', 0)
+
+            print(f"✓✓✓ JOGO INICIADO! Você é {self.meu_simbolo}")
+            self.atualizar_tabuleiro()
+            self.atualizar_status(f"Você é: {self.meu_simbolo}")
+            self.atualizar_turno(self.turno_atual)
+
+        elif tipo == 'JOGADA_OK':
+            if 'tabuleiro' not in mensagem:
+                # Protocolo v2: só a casa jogada
+                if not self.aplicar_delta(mensagem):
+                    return
+                with self.lock:
+                    self.turno_atual = mensagem.get('proximo_turno')
+            else:
+                with self.lock:
+                    self.tabuleiro = mensagem.get('tabuleiro')
+                    self.turno_atual = mensagem.get('proximo_turno')
+                    self.previsao = None
+                self.atualizar_tabuleiro()
+            self.atualizar_turno(self.turno_atual)
+
+        elif tipo == 'FIM_JOGO':
+            if 'tabuleiro' not in mensagem:
+                if not self.aplicar_delta(mensagem):
+                    return
+            else:
+                with self.lock:
+                    self.tabuleiro = mensagem.get('tabuleiro')
+                    self.previsao = None
+                self.atualizar_tabuleiro()
+            with self.lock:
+                self.jogo_ativo = False
+                ganhador = mensagem.get('ganhador')
+            self.finalizar_jogo(ganhador)
+
+        elif tipo == 'ESTADO':
+            # Snapshot pedido com SINCRONIZAR depois de um buraco na sequência
+            with self.lock:
+                self.tabuleiro = mensagem.get('tabuleiro')
+                self.turno_atual = mensagem.get('turno_atual')
+                self.jogo_ativo = mensagem.get('jogo_iniciado', False)
+                self.seq = mensagem.get('seq', 0)
+                self.previsao = None
+            self.atualizar_tabuleiro()
+            if self.jogo_ativo:
+                self.atualizar_turno(self.turno_atual)
+
+        elif tipo == 'ERRO':
+            msg = mensagem.get('mensagem')
+            if 'seq' in mensagem:
+                self.desfazer_previsao(mensagem['seq'])
+            if msg == 'Sessão expirada' and not self.handshake.is_set():
+                # O lugar não foi guardado a tempo: entra como jogador novo
+                self.sessao = None
+                self.enviar_conectar()
+                return
+            print(f"Erro do servidor: {msg}")
+            self.mostrar_erro(msg)
+
+        elif tipo == 'REINICIO':
+            with self.lock:
+                self.tabuleiro = mensagem.get('tabuleiro') or tabuleiro_vazio(len(self.tabuleiro))
+                self.previsao = None
+                self.jogo_ativo = True
+                self.turno_atual = mensagem.get('turno_atual', 'X')
+                self.seq = mensagem.get('seq', 0)
+            self.atualizar_tabuleiro()
+            self.atualizar_status(self.papel())
+            self.jogo_reiniciado()
+            self.atualizar_turno(self.turno_atual)
+
+        elif tipo == 'OPONENTE_DESCONECTOU':
+            with self.lock:
+                self.jogo_ativo = False
+                self.tabuleiro = tabuleiro_vazio(len(self.tabuleiro))
+                self.seq = 0
+                self.previsao = None
+            self.atualizar_tabuleiro()
+            self.atualizar_status("Oponente desconectou - Aguardando novo jogador...")
+            self.limpar_turno()
+            self.oponente_desconectou(mensagem.get('mensagem'))
+
+        elif tipo == 'DICA':
+            self.mostrar_dica(mensagem.get('linha'), mensagem.get('coluna'), mensagem.get('resultado'))
+
+        elif tipo == 'OPONENTE_RECONECTANDO':
+            # O jogo continua parado, com o lugar dele reservado
+            self.atualizar_status(f"{self.papel()} | Oponente reconectando...")
+
+        elif tipo == 'OPONENTE_VOLTOU':
+            self.atualizar_status(self.papel())
+            self.atualizar_turno(self.turno_atual)
+
+    def aplicar_delta(self, mensagem):
+        """Aplica uma jogada recebida como delta; se faltou alguma, pede o estado completo
+
+        O delta com o seq da jogada prevista a confirma (já está no tabuleiro) ou, se a
+        casa for outra, desfaz a previsão antes de aplicar o que o servidor decidiu.
+        """
+        desfeita = None
+        with self.lock:
+            if mensagem.get('seq') != self.seq + 1:
+                sincronizar = True
+            else:
+                sincronizar = False
+                linha, coluna = mensagem['linha'], mensagem['coluna']
+                previsao = self.previsao
+                if previsao is not None and previsao[0] == mensagem['seq']:
+                    self.previsao = None
+                    if previsao[1:3] != (linha, coluna) or mensagem['simbolo'] != self.meu_simbolo:
+                        desfeita = previsao[1:3]
+                        self.tabuleiro[desfeita[0]][desfeita[1]] = ''
+                self.tabuleiro[linha][coluna] = mensagem['simbolo']
+                self.seq = mensagem['seq']
+
+        if sincronizar:
+            print(f"Sequência fora de ordem (esperava {self.seq + 1}, veio {mensagem.get('seq')}) - sincronizando")
+            self.enviar_mensagem({'tipo': 'SINCRONIZAR'})
+            return False
+
+        if desfeita is not None:
+            self.atualizar_casa(*desfeita)
+        self.atualizar_casa(linha, coluna)
+        return True
+
+    def desfazer_previsao(self, seq):
+        """O servidor recusou a jogada prevista 'seq': tira do tabuleiro e devolve a vez"""
+        with self.lock:
+            previsao = self.previsao
+            if previsao is None or previsao[0] != seq:
+                return
+            self.previsao = None
+            _, linha, coluna, turno = previsao
+            self.tabuleiro[linha][coluna] = ''
+            self.turno_atual = turno
+        self.atualizar_casa(linha, coluna)
+        self.atualizar_turno(turno)
+
+    def enviar_jogada(self, linha, coluna):
+        """Envia jogada para o servidor (sem validar: o servidor é quem decide)
+
+        Se a jogada parece válida e a previsão está ligada, ela já entra no tabuleiro local.
+        """
+        print(f"Fazendo jogada: ({linha}, {coluna})")
+        mensagem = {'tipo': 'JOGADA', 'linha': linha, 'coluna': coluna}
+        with self.lock:
+            tamanho = len(self.tabuleiro)
+            prever = (self.jogada_prevista and self.versao >= 2 and self.previsao is None and self.jogo_ativo
+                      and self.turno_atual == self.meu_simbolo
+                      and 0 <= linha < tamanho and 0 <= coluna < tamanho and self.tabuleiro[linha][coluna] == '')
+            if prever:
+                mensagem['seq'] = self.seq + 1
+                self.previsao = (mensagem['seq'], linha, coluna, self.turno_atual)
+                self.tabuleiro[linha][coluna] = self.meu_simbolo
+                self.turno_atual = 'O' if self.meu_simbolo == 'X' else 'X'
+        if prever:
+            self.atualizar_casa(linha, coluna)
+            self.atualizar_turno(self.turno_atual)
+        self.enviar_mensagem(mensagem)
+
+    def reiniciar_jogo(self):
+        """Solicita reinício do jogo"""
+        print("Solicitando reinício do jogo")
+        self.enviar_mensagem({'tipo': 'REINICIAR'})
+
+    def pedir_dica(self):
+        """Pede ao servidor a melhor jogada da posição (resposta em mostrar_dica)"""
+        self.enviar_mensagem({'tipo': 'DICA'})
+
+    # Ganchos de exibição: a interface sobrescreve
+
+    def atualizar_tabuleiro(self):
+        tamanho = len(self.tabuleiro)
+        for i in range(tamanho):
+            for j in range(tamanho):
+                self.atualizar_casa(i, j)
+
+    def atualizar_casa(self, linha, coluna):
+        pass
+
+    def atualizar_status(self, texto):
+        pass
+
+    def atualizar_turno(self, turno):
+        pass
+
+    def limpar_turno(self):
+        pass
+
+    def finalizar_jogo(self, ganhador):
+        pass
+
+    def jogo_reiniciado(self):
+        pass
+
+    def oponente_desconectou(self, mensagem):
+        pass
+
+    def mostrar_erro(self, mensagem):
+        pass
+
+    def mostrar_dica(self, linha, coluna, resultado):
+        pass
+
+    def ao_desconectar(self):
+        pass
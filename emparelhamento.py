@@ -0,0 +1,140 @@
+"""Emparelhamento: fila de espera em faixas de rating e de RTT.
+
+Cada sala com um jogador esperando fica numa faixa (rating // faixa_rating, faixa do RTT
+medido no PING/PONG, variante do tabuleiro). Variantes diferentes nunca se encontram. Quem chega procura primeiro na própria faixa e depois em anéis de
+faixas vizinhas, só até o raio que o jogador mais antigo da espera já alcançou: a cada
+espera_alargar segundos esperando, o raio de um jogador cresce uma faixa (até raio_max).
+
+Dentro de uma faixa as salas ficam em ordem de chegada, então só a primeira (a que espera
+há mais tempo, e portanto tem o maior raio) precisa ser olhada. O custo de emparelhar é
+o número de faixas nos anéis, que não depende de quantos jogadores estão esperando. Os
+alargamentos também não varrem a espera: cada sala tem um prazo numa roda de temporização
+e, quando o raio dela cresce, só o anel novo é procurado.
+"""
+from bisect import bisect_right
+from collections import OrderedDict
+
+from temporizador import RodaTemporizadora
+
+RATING_PADRAO = 1500
+LIMITES_RTT_MS = (50, 150, 300)  # faixas: <50ms, <150ms, <300ms, o resto
+
+
+class Emparelhador:
+    """Salas esperando oponente, indexadas por faixa (chamar dentro do lock global do servidor)"""
+
+    def __init__(self, faixa_rating=200, limites_rtt=LIMITES_RTT_MS, espera_alargar=5.0, raio_max=10):
+        self.faixa_rating = faixa_rating
+        self.limites_rtt = tuple(limites_rtt)
+        self.espera_alargar = espera_alargar
+        self.raio_max = raio_max
+        self.esperando = OrderedDict()  # {sala.id: sala} todas, em ordem de chegada
+        self.faixas = {}  # {faixa: OrderedDict {sala.id: sala}}; só faixas com alguém
+        self.alargamentos = RodaTemporizadora(resolucao=min(1.0, espera_alargar / 4),
+                                              horizonte=espera_alargar * 2)
+        self._aneis = [self._anel(raio) for raio in range(raio_max + 1)]
+
+    @staticmethod
+    def _anel(raio):
+        """Deslocamentos (rating, rtt) a exatamente 'raio' faixas de distância"""
+        return [(dr, dt) for dr in range(-raio, raio + 1) for dt in range(-raio, raio + 1)
+                if max(abs(dr), abs(dt)) == raio]
+
+    def faixa(self, dados):
+        """Faixa de um jogador (sessao.Jogador: rating, rtt_ms e variante)"""
+        rtt = dados.rtt_ms
+        return (int(dados.rating // self.faixa_rating), bisect_right(self.limites_rtt, rtt) if rtt is not None else 0,
+                dados.variante)
+
+    def raio(self, sala, agora):
+        return min(int((agora - sala.desde) / self.espera_alargar), self.raio_max)
+
+    def chaves(self):
+        """(variante, faixa de rating) de quem está esperando: o modo multiprocesso roteia por elas"""
+        return {(variante, fr) for fr, _, variante in self.faixas}
+
+    def __len__(self):
+        return len(self.esperando)
+
+    def __contains__(self, sala):
+        return self.esperando.get(sala.id) is sala
+
+    def colocar(self, sala, faixa, agora, procurou=True):
+        """A sala (com um jogador) entra na espera
+
+        procurou=False: ninguém procurou oponente para ela (sala que perdeu um jogador);
+        a procura, a partir da própria faixa, fica para o próximo alargar().
+        """
+        sala.faixa = faixa
+        sala.desde = agora
+        sala.alcance = 0 if procurou else -1  # último raio já procurado
+        self.esperando[sala.id] = sala
+        self.faixas.setdefault(faixa, OrderedDict())[sala.id] = sala
+        if not procurou:
+            self.alargamentos.agendar(sala.id, agora)
+        elif self.raio_max:
+            self.alargamentos.agendar(sala.id, agora + self.espera_alargar)
+
+    def retirar(self, sala):
+        if self.esperando.pop(sala.id, None) is None:
+            return
+        fila = self.faixas[sala.faixa]
+        del fila[sala.id]
+        if not fila:
+            del self.faixas[sala.faixa]
+        self.alargamentos.cancelar(sala.id)
+
+    def _primeira(self, faixa, excluir=None):
+        fila = self.faixas.get(faixa)
+        if not fila:
+            return None
+        for sala in fila.values():
+            if sala is not excluir:
+                return sala
+        return None
+
+    def procurar(self, faixa, agora):
+        """Sala esperando que aceita um jogador novo na 'faixa' (ou None), sem tirá-la da espera"""
+        if not self.esperando:
+            return None
+        # Ninguém tem raio maior que o do mais antigo: não adianta olhar anéis além dele
+        mais_antiga = next(iter(self.esperando.values()))
+        alcance = self.raio(mais_antiga, agora)
+        fr, ft, variante = faixa
+        for raio in range(alcance + 1):
+            for dr, dt in self._aneis[raio]:
+                sala = self._primeira((fr + dr, ft + dt, variante))
+                if sala is not None and self.raio(sala, agora) >= raio:
+                    return sala
+        return None
+
+    def _procurar_aneis(self, sala, raios):
+        fr, ft, variante = sala.faixa
+        for raio in raios:
+            for dr, dt in self._aneis[raio]:
+                outra = self._primeira((fr + dr, ft + dt, variante), excluir=sala)
+                if outra is not None:
+                    return outra
+        return None
+
+    def alargar(self, agora):
+        """Cresce o raio das salas cujo prazo venceu; retorna os pares (fica, vem) que agora se aceitam
+
+        Os pares já saem da espera. A mais antiga das duas fica, a outra vem para ela.
+        """
+        pares = []
+        for id_sala in self.alargamentos.avancar(agora):
+            sala = self.esperando.get(id_sala)
+            if sala is None:
+                continue
+            raio = self.raio(sala, agora)
+            outra = self._procurar_aneis(sala, range(sala.alcance + 1, raio + 1))
+            sala.alcance = raio
+            if outra is not None:
+                fica, vem = (sala, outra) if sala.desde <= outra.desde else (outra, sala)
+                self.retirar(fica)
+                self.retirar(vem)
+                pares.append((fica, vem))
+            elif raio < self.raio_max:
+                self.alargamentos.agendar(id_sala, sala.desde + (raio + 1) * self.espera_alargar)
+        return pares
@@ -0,0 +1,220 @@
+"""Teste de estresse do servidor: muitos jogos simultâneos, pings, jogadas fora de turno,
+reinícios e quedas de conexão. Termina com código 1 se alguma thread travar (deadlock)."""
+import argparse
+import faulthandler
+import json
+import queue
+import random
+import socket
+import sys
+import time
+from threading import Thread, Lock, Event
+
+import registro
+from protocolo import CODEC_JSON, CODECS, Enquadrador
+from servidor import ServidorJogoDaVelha
+
+
+class JogadorEstresse:
+    """Cliente sem interface que joga jogadas aleatórias"""
+
+    def __init__(self, porta, codec, rodadas, chance_queda, intervalo_ping, prazo):
+        self.porta = porta
+        self.codec_pedido = codec
+        self.codec = CODEC_JSON
+        self.handshake = Event()
+        self.rodadas = rodadas
+        self.chance_queda = chance_queda
+        self.intervalo_ping = intervalo_ping
+        self.prazo = prazo
+        self.fila = queue.Queue()
+        self.lock_envio = Lock()
+        self.ativo = True
+        self.estado = 'conectando'  # conectando -> esperando (sem oponente) -> jogando
+        self.resultado = None
+
+    def enviar(self, mensagem):
+        with self.lock_envio:
+            self.sock.sendall(self.codec.codificar(mensagem))
+
+    def receber(self):
+        enquadrador = Enquadrador()
+        try:
+            while self.ativo:
+                if not enquadrador.receber(self.sock):
+                    break
+                while True:
+                    quadro = enquadrador.proximo_quadro(self.codec)
+                    if quadro is None:
+                        break
+                    mensagem = self.codec.decodificar(quadro)
+                    if mensagem['tipo'] == 'CONECTADO':
+                        self.codec = CODECS[mensagem['codec']]
+                        self.handshake.set()
+                    self.fila.put(mensagem)
+        except OSError:
+            pass
+        self.fila.put(None)
+
+    def pingar(self):
+        try:
+            self.handshake.wait()
+            while self.ativo:
+                self.enviar({'tipo': 'PING'})
+                time.sleep(self.intervalo_ping)
+        except OSError:
+            pass
+
+    def proxima(self):
+        restante = self.prazo - time.monotonic()
+        if restante <= 0:
+            raise TimeoutError
+        try:
+            return self.fila.get(timeout=restante)
+        except queue.Empty:
+            raise TimeoutError
+
+    def jogar(self):
+        try:
+            self.sock = socket.create_connection(('127.0.0.1', self.porta))
+            Thread(target=self.receber, daemon=True).start()
+            Thread(target=self.pingar, daemon=True).start()
+            self.enviar({'tipo': 'CONECTAR', 'endereco': 'estresse', 'codec': self.codec_pedido})
+            self.resultado = self.partidas()
+        except TimeoutError:
+            # Sem oponente não é travamento; esperando resposta do servidor é
+            self.resultado = 'SEM_OPONENTE' if self.estado == 'esperando' else 'TRAVOU'
+        except OSError:
+            self.resultado = 'QUEDA'
+        finally:
+            self.ativo = False
+            try:
+                # shutdown antes do close: com a thread de leitura presa no recv, só o close não envia FIN
+                self.sock.shutdown(socket.SHUT_RDWR)
+                self.sock.close()
+            except (OSError, AttributeError):
+                pass
+
+    def partidas(self):
+        simbolo = None
+        tabuleiro = None
+        turno = None
+        jogos = 0
+        while True:
+            mensagem = self.proxima()
+            if mensagem is None:
+                return 'SEM_OPONENTE' if not self.ativo else 'QUEDA'
+            tipo = mensagem['tipo']
+
+            if tipo in ('CONECTADO', 'JOGO_INICIADO'):
+                simbolo = mensagem['simbolo']
+                self.estado = 'esperando'
+                if mensagem['jogo_iniciado']:
+                    self.estado = 'jogando'
+                    tabuleiro, turno = mensagem['tabuleiro'], mensagem['turno_atual']
+            elif tipo == 'REINICIO':
+                self.estado = 'jogando'
+                tabuleiro, turno = mensagem['tabuleiro'], mensagem['turno_atual']
+            elif tipo == 'JOGADA_OK':
+                tabuleiro, turno = mensagem['tabuleiro'], mensagem['proximo_turno']
+            elif tipo == 'FIM_JOGO':
+                jogos += 1
+                tabuleiro = turno = None
+                # O oponente pode ter entrado depois e já ter terminado as rodadas dele
+                self.estado = 'esperando'
+                if jogos >= self.rodadas:
+                    return 'OK'
+                if simbolo == 'X':
+                    self.enviar({'tipo': 'REINICIAR'})
+            elif tipo == 'OPONENTE_DESCONECTOU':
+                return 'OPONENTE_CAIU'
+            else:
+                continue
+
+            if turno is None:
+                continue
+            # Só cai na própria vez: assim o jogo com certeza está ativo no servidor
+            if turno == simbolo and random.random() < self.chance_queda:
+                return 'CAIU'
+
+            livres = [(i, j) for i in range(3) for j in range(3) if tabuleiro[i][j] == '']
+            if not livres:
+                continue
+            linha, coluna = random.choice(livres)
+            if turno == simbolo or random.random() < 0.2:  # às vezes joga fora de turno de propósito
+                self.enviar({'tipo': 'JOGADA', 'linha': linha, 'coluna': coluna})
+
+
+def verificar_locks(servidor):
+    """Todos os locks do servidor precisam estar livres no fim"""
+    travados = []
+    for nome, lock in [('global', servidor.lock)] + [(f'sala {s.id}', s.lock) for s in list(servidor.lobby.salas.values())]:
+        if not lock.acquire(timeout=2):
+            travados.append(nome)
+        else:
+            lock.release()
+    return travados
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Teste de estresse de concorrência do servidor")
+    parser.add_argument('--jogadores', type=int, default=200)
+    parser.add_argument('--rodadas', type=int, default=3)
+    parser.add_argument('--chance-queda', type=float, default=0.02)
+    parser.add_argument('--intervalo-ping', type=float, default=0.05,
+                        help="segundos entre PINGs de cada jogador (bem mais que os 5s do cliente real)")
+    parser.add_argument('--tempo-limite', type=float, default=60.0)
+    parser.add_argument('--modo', choices=['threads', 'async'], default='threads')
+    parser.add_argument('--codec', choices=sorted(CODECS), default='json')
+    parser.add_argument('--tempo-retomada', type=float, default=0.5,
+                        help="reserva do lugar de quem cai (quem cai aqui não volta: só passa pela expiração)")
+    parser.add_argument('--pipeline', action='store_true', help="servidor no modo pipeline")
+    args = parser.parse_args()
+
+    registro.configurar('ERROR')  # quedas de propósito geram muitos avisos; erros de verdade aparecem
+    servidor = ServidorJogoDaVelha(porta=0, tempo_retomada=args.tempo_retomada, pipeline=args.pipeline)
+    if args.modo == 'async':
+        from servidor_async import iniciar_async
+        Thread(target=iniciar_async, args=(servidor,), daemon=True).start()
+    else:
+        Thread(target=servidor.iniciar, daemon=True).start()
+
+    prazo = time.monotonic() + args.tempo_limite
+    jogadores = [JogadorEstresse(servidor.porta, args.codec, args.rodadas, args.chance_queda, args.intervalo_ping, prazo)
+                 for _ in range(args.jogadores)]
+    threads = [Thread(target=j.jogar, daemon=True) for j in jogadores]
+    inicio = time.monotonic()
+    for t in threads:
+        t.start()
+
+    while time.monotonic() < prazo + 1:
+        pendentes = [j for j, t in zip(jogadores, threads) if t.is_alive()]
+        if not pendentes:
+            break
+        # Quem sobrou sozinho numa sala nunca vai ganhar oponente: libera
+        if all(j.estado == 'esperando' for j in pendentes):
+            for j in pendentes:
+                j.ativo = False
+                j.fila.put(None)
+        time.sleep(0.1)
+    for t in threads:
+        t.join(1)
+    duracao = time.monotonic() - inicio
+
+    travados = verificar_locks(servidor)
+    filas = servidor.metricas_filas()
+
+    resultados = {}
+    for j in jogadores:
+        resultados[j.resultado] = resultados.get(j.resultado, 0) + 1
+    print(json.dumps({'duracao_s': round(duracao, 2), 'resultados': resultados, 'locks_travados': travados,
+                      'filas_saida': filas}))
+
+    if resultados.get('TRAVOU') or resultados.get(None) or travados:
+        print("DEADLOCK OU TRAVAMENTO DETECTADO - pilhas das threads:")
+        faulthandler.dump_traceback(all_threads=True)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+from collections import deque
+from threading import Condition
+
+
+class FilaEnvio:
+    """Fila limitada de quadros já codificados esperando para sair por uma conexão
+
+    Quem envia só coloca na fila e volta (nunca espera o socket); quem escreve
+    (thread de escrita ou event loop) retira tudo de uma vez e manda num único send.
+    O limite é em bytes; colocar() retorna False quando não cabe e a decisão do que
+    fazer fica com o servidor (descartar, coalescer ou desconectar).
+
+    Entre segurar() e soltar() quem escreve não é acordado: as respostas de uma leitura
+    inteira (modo pipeline) saem juntas num único envio.
+    """
+
+    def __init__(self, limite=64 * 1024):
+        self.limite = limite
+        self.quadros = deque()
+        self.bytes = 0
+        self.fechada = False
+        self.segurando = 0
+        self.condicao = Condition()
+
+    def colocar(self, dados):
+        """Enfileira um quadro; False se passaria do limite (nada é enfileirado)"""
+        with self.condicao:
+            if self.fechada:
+                return True  # conexão saindo: descarta sem contar como transbordo
+            if self.quadros and self.bytes + len(dados) > self.limite:
+                return False
+            self.quadros.append(dados)
+            self.bytes += len(dados)
+            if not self.segurando:
+                self.condicao.notify()
+            return True
+
+    def substituir(self, quadros):
+        """Joga fora tudo o que ainda não saiu e põe 'quadros' no lugar"""
+        with self.condicao:
+            if self.fechada:
+                return
+            self.quadros.clear()
+            self.quadros.extend(quadros)
+            self.bytes = sum(len(q) for q in quadros)
+            if not self.segurando:
+                self.condicao.notify()
+
+    def retirar_quadros(self, esperar=True):
+        """Tudo o que está na fila, como lista de quadros (para sendmsg); None se fechada"""
+        with self.condicao:
+            while esperar and not self.quadros and not self.fechada:
+                self.condicao.wait()
+            if self.fechada:
+                return None
+            quadros = list(self.quadros)
+            self.quadros.clear()
+            self.bytes = 0
+            return quadros
+
+    def segurar(self):
+        with self.condicao:
+            self.segurando += 1
+
+    def soltar(self):
+        with self.condicao:
+            self.segurando -= 1
+            if not self.segurando and self.quadros:
+                self.condicao.notify()
+
+    def fechar(self):
+        with self.condicao:
+            self.fechada = True
+            self.quadros.clear()
+            self.bytes = 0
+            self.condicao.notify_all()
+
+    def __len__(self):
+        return len(self.quadros)
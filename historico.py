@@ -0,0 +1,192 @@
+"""Histórico das partidas: log só de acréscimo (JSONL) gravado por uma thread em lotes.
+
+Quem joga só monta um dict pequeno e coloca numa fila (sem I/O, sem esperar o disco). A
+thread de gravação junta tudo o que acumulou num único write (group commit) e faz fsync
+conforme a durabilidade escolhida:
+
+    sempre     fsync a cada lote: uma queda perde no máximo o lote em andamento
+    periodica  fsync a cada intervalo_fsync segundos (padrão)
+    nunca      o sistema operacional decide quando gravar
+
+Registros, um por linha ('p' é o id da partida):
+    {"e": "inicio", "p": ..., "t": epoch, "x": jogador X, "o": jogador O, "v": variante (só fora do 3x3)}
+    {"e": "jogada", "p": ..., "n": seq, "s": "X"/"O", "c": casa (linha * N + coluna)}
+    {"e": "fim", "p": ..., "g": "X"/"O"/"EMPATE", "t": epoch}
+    {"e": "cancelada", "p": ..., "t": epoch}
+
+Uso do leitor:
+    python historico.py partidas.jsonl                  estatísticas
+    python historico.py partidas.jsonl --replay ID      tabuleiro jogada a jogada
+"""
+import argparse
+import atexit
+import json
+import os
+import queue
+import time
+from collections import Counter
+from threading import Thread
+
+from tabuleiro import VARIANTE_PADRAO, VARIANTES
+
+DURABILIDADES = ('sempre', 'periodica', 'nunca')
+LOTE_MAXIMO = 4096  # registros por write
+_FIM = object()
+
+
+class GravadorPartidas:
+    def __init__(self, caminho, durabilidade='periodica', intervalo_fsync=1.0):
+        if durabilidade not in DURABILIDADES:
+            raise ValueError(f"durabilidade desconhecida: {durabilidade}")
+        self.caminho = caminho
+        self.durabilidade = durabilidade
+        self.intervalo_fsync = intervalo_fsync
+        self.fd = os.open(caminho, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self.fila = queue.SimpleQueue()
+        self.registros = 0  # gravados
+        self.lotes = 0
+        self.fsyncs = 0
+        self.fechado = False
+        self.thread = Thread(target=self.gravar, daemon=True)
+        self.thread.start()
+        atexit.register(self.fechar)  # o que ainda está na fila vai para o disco antes de sair
+
+    def registrar(self, registro):
+        """Coloca o registro na fila de gravação (não faz I/O)"""
+        self.fila.put(registro)
+
+    def pendentes(self):
+        return self.fila.qsize()
+
+    def gravar(self):
+        """Thread de gravação: um write por lote, fsync conforme a durabilidade"""
+        ultimo_fsync = time.monotonic()
+        sujo = False  # há bytes gravados sem fsync
+        terminar = False
+        while not terminar:
+            try:
+                espera = self.intervalo_fsync if sujo and self.durabilidade == 'periodica' else None
+                item = self.fila.get(timeout=espera)
+            except queue.Empty:
+                item = None  # só acordou para o fsync periódico
+
+            lote = []
+            while item is not None:
+                if item is _FIM:
+                    terminar = True
+                else:
+                    lote.append(item)
+                if len(lote) >= LOTE_MAXIMO:
+                    break
+                try:
+                    item = self.fila.get_nowait()
+                except queue.Empty:
+                    item = None
+
+            if lote:
+                dados = b''.join(json.dumps(r, separators=(',', ':')).encode() + b'\n' for r in lote)
+                while dados:
+                    escritos = os.write(self.fd, dados)
+                    dados = dados[escritos:]
+                self.registros += len(lote)
+                self.lotes += 1
+                sujo = True
+
+            agora = time.monotonic()
+            if sujo and self.durabilidade != 'nunca' and (
+                    self.durabilidade == 'sempre' or terminar or agora - ultimo_fsync >= self.intervalo_fsync):
+                os.fsync(self.fd)
+                self.fsyncs += 1
+                ultimo_fsync = agora
+                sujo = False
+
+    def fechar(self):
+        """Grava o que falta e fecha o arquivo"""
+        if self.fechado:
+            return
+        self.fechado = True
+        self.fila.put(_FIM)
+        self.thread.join()
+        os.close(self.fd)
+
+
+def ler_registros(caminhos):
+    """Registros dos arquivos, em ordem; uma última linha cortada (queda no meio do write) é ignorada"""
+    for caminho in caminhos:
+        with open(caminho, 'rb') as arquivo:
+            for linha in arquivo:
+                try:
+                    yield json.loads(linha)
+                except ValueError:
+                    continue
+
+
+def ler_partidas(caminhos):
+    """Partidas terminadas (ou canceladas), na ordem em que terminaram
+
+    Só as partidas em andamento ficam na memória, então arquivos grandes são lidos
+    em streaming. Cada partida: {'id', 'inicio', 'x', 'o', 'tamanho', 'jogadas': [(simbolo, casa)],
+    'resultado': 'X'/'O'/'EMPATE'/None (cancelada)}.
+    """
+    abertas = {}
+    for registro in ler_registros(caminhos):
+        evento, id_partida = registro.get('e'), registro.get('p')
+        if evento == 'inicio':
+            tamanho, _ = VARIANTES.get(registro.get('v', VARIANTE_PADRAO), VARIANTES[VARIANTE_PADRAO])
+            abertas[id_partida] = {'id': id_partida, 'inicio': registro.get('t'), 'x': registro.get('x'),
+                                   'o': registro.get('o'), 'tamanho': tamanho, 'jogadas': [], 'resultado': None}
+        elif evento == 'jogada' and id_partida in abertas:
+            abertas[id_partida]['jogadas'].append((registro['s'], registro['c']))
+        elif evento in ('fim', 'cancelada') and id_partida in abertas:
+            partida = abertas.pop(id_partida)
+            partida['resultado'] = registro.get('g')
+            yield partida
+
+
+def estatisticas(partidas):
+    resultados = Counter()
+    aberturas = Counter()
+    jogadas = 0
+    for partida in partidas:
+        resultados[partida['resultado'] or 'cancelada'] += 1
+        jogadas += len(partida['jogadas'])
+        if partida['jogadas']:
+            aberturas[divmod(partida['jogadas'][0][1], partida['tamanho'])] += 1
+    total = sum(resultados.values())
+    return {
+        'partidas': total,
+        'resultados': dict(resultados),
+        'jogadas_por_partida': round(jogadas / total, 2) if total else None,
+        'aberturas': {f'{linha},{coluna}': n for (linha, coluna), n in aberturas.most_common()},
+    }
+
+
+def replay(partida):
+    """Texto com o tabuleiro depois de cada jogada"""
+    n = partida['tamanho']
+    casas = [' '] * (n * n)
+    separador = "\n  " + "-" * (4 * n - 3) + "\n  "
+    quadros = [f"Partida {partida['id']}: X = {partida['x']}, O = {partida['o']}"]
+    for numero, (simbolo, casa) in enumerate(partida['jogadas'], 1):
+        casas[casa] = simbolo
+        linhas = [' | '.join(casas[i:i + n]) for i in range(0, n * n, n)]
+        quadros.append(f"Jogada {numero}: {simbolo} em ({casa // n}, {casa % n})\n  " + separador.join(linhas))
+    quadros.append(f"Resultado: {partida['resultado'] or 'cancelada'}")
+    return '\n\n'.join(quadros)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Leitor do histórico de partidas")
+    parser.add_argument('arquivos', nargs='+', help="arquivos JSONL gravados pelo servidor (--historico)")
+    parser.add_argument('--replay', metavar='ID', help="mostra a partida jogada a jogada")
+    args = parser.parse_args()
+
+    if args.replay:
+        for partida in ler_partidas(args.arquivos):
+            if partida['id'] == args.replay:
+                print(replay(partida))
+                break
+        else:
+            raise SystemExit(f"partida {args.replay} não encontrada")
+    else:
+        print(json.dumps(estatisticas(ler_partidas(args.arquivos)), indent=2))
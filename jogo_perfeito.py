@@ -0,0 +1,105 @@
+"""Jogo perfeito: tabela com o resultado e a melhor jogada de todas as posições.
+
+O jogo da velha tem 5.478 posições alcançáveis. Todas são resolvidas por minimax uma
+vez só (na subida do servidor, ou lidas de um arquivo salvo antes) e guardadas numa
+tabela indexada direto pelas máscaras do bitboard: índice = x | (o << 9). Cada posição
+ocupa um byte, com a melhor jogada (casa 0-8) nos 4 bits de baixo e o resultado para
+quem joga nos bits 4-5. Jogar ou dar uma dica é uma consulta, sem busca nenhuma.
+"""
+import os
+import zlib
+
+from tabuleiro import CHEIO, VITORIAS_POR_CASA
+
+SEM_JOGADA = 0x0F
+DERROTA, EMPATE, VITORIA = 1, 2, 3  # para quem tem a vez; 0 = posição inalcançável
+CABECALHO_ARQUIVO = b'JVPERF1\n'
+
+
+def vez(x, o):
+    """Quem joga na posição: X começa, então é X quando os dois têm o mesmo número de casas"""
+    return 'X' if bin(x).count('1') == bin(o).count('1') else 'O'
+
+
+class TabelaPerfeita:
+    def __init__(self, dados=None):
+        self.dados = dados if dados is not None else self._resolver()
+
+    def _resolver(self):
+        dados = bytearray(1 << 18)
+        pontos_salvos = {}
+
+        def resolver(x, o):
+            """Pontos para quem tem a vez: vence logo > vence depois > empate > perde depois > perde logo"""
+            indice = x | (o << 9)
+            if dados[indice]:
+                return pontos_salvos[indice]
+            joga_x = vez(x, o) == 'X'
+            meu, dele = (x, o) if joga_x else (o, x)
+            melhor, melhor_casa = None, SEM_JOGADA
+            livres = CHEIO & ~(x | o)
+            for casa in range(9):
+                bit = 1 << casa
+                if not livres & bit:
+                    continue
+                novo = meu | bit
+                if any(novo & v == v for v in VITORIAS_POR_CASA[casa]):
+                    pontos = 10 + bin(livres).count('1')  # vitória agora; quanto antes, melhor
+                elif livres == bit:
+                    pontos = 0  # última casa: empate
+                else:
+                    filho = (novo, dele) if joga_x else (dele, novo)
+                    pontos = -resolver(*filho)
+                if melhor is None or pontos > melhor:
+                    melhor, melhor_casa = pontos, casa
+            resultado = VITORIA if melhor > 0 else DERROTA if melhor < 0 else EMPATE
+            dados[indice] = (resultado << 4) | melhor_casa
+            pontos_salvos[indice] = melhor
+            return melhor
+
+        resolver(0, 0)
+        return dados
+
+    def __len__(self):
+        """Posições resolvidas (as que ainda têm jogada)"""
+        return sum(1 for byte in self.dados if byte)
+
+    def jogada(self, x, o):
+        """Melhor casa (0-8) para quem tem a vez, ou None se o jogo acabou"""
+        casa = self.dados[x | (o << 9)] & 0x0F
+        return None if casa == SEM_JOGADA else casa
+
+    def resultado(self, x, o):
+        """Como a partida termina com os dois jogando perfeitamente: 'X', 'O' ou 'EMPATE'"""
+        valor = self.dados[x | (o << 9)] >> 4
+        if valor == EMPATE:
+            return 'EMPATE'
+        jogador = vez(x, o)
+        if valor == VITORIA:
+            return jogador
+        return 'O' if jogador == 'X' else 'X'
+
+    def salvar(self, caminho):
+        with open(caminho, 'wb') as arquivo:
+            arquivo.write(CABECALHO_ARQUIVO + zlib.compress(bytes(self.dados), 9))
+
+    @classmethod
+    def carregar(cls, caminho):
+        with open(caminho, 'rb') as arquivo:
+            conteudo = arquivo.read()
+        if not conteudo.startswith(CABECALHO_ARQUIVO):
+            raise ValueError(f"{caminho} não é uma tabela de jogo perfeito")
+        dados = bytearray(zlib.decompress(conteudo[len(CABECALHO_ARQUIVO):]))
+        if len(dados) != 1 << 18:
+            raise ValueError(f"{caminho}: tabela com tamanho errado")
+        return cls(dados)
+
+
+def carregar_ou_resolver(caminho=None):
+    """Lê a tabela de 'caminho'; se o arquivo não existe, resolve e salva nele"""
+    if caminho and os.path.exists(caminho):
+        return TabelaPerfeita.carregar(caminho)
+    tabela = TabelaPerfeita()
+    if caminho:
+        tabela.salvar(caminho)
+    return tabela
@@ -0,0 +1,182 @@
+"""Métricas do servidor no formato texto do Prometheus, servidas por HTTP em /metrics.
+
+Contadores e histogramas são atualizados no caminho quente, então cada atualização é
+só um lock curto e uma soma (histograma: mais um bisect nos limites). Valores que já
+existem em outro lugar (jogadores, salas, filas) são medidores calculados na hora da
+leitura, sem custo nenhum entre uma leitura e outra.
+"""
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+
+# Limites em segundos: de 10µs (processar um PING) a ~1s (algo muito errado)
+LIMITES_TEMPO = (1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 5e-3, 1e-2, 2.5e-2, 0.1, 0.25, 1.0)
+
+
+def _rotulos(nomes, valores):
+    if not nomes:
+        return ''
+    return '{' + ','.join(f'{n}="{v}"' for n, v in zip(nomes, valores)) + '}'
+
+
+class Contador:
+    def __init__(self, nome, ajuda, rotulos=()):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = tuple(rotulos)
+        self.valores = {}  # {valores dos rótulos: total}
+        self.lock = Lock()
+
+    def inc(self, *rotulos, valor=1):
+        with self.lock:
+            self.valores[rotulos] = self.valores.get(rotulos, 0) + valor
+
+    def exportar(self):
+        linhas = [f'# HELP {self.nome} {self.ajuda}', f'# TYPE {self.nome} counter']
+        with self.lock:
+            itens = sorted(self.valores.items())
+        for rotulos, valor in itens:
+            linhas.append(f'{self.nome}{_rotulos(self.rotulos, rotulos)} {valor}')
+        return linhas
+
+
+class Medidor:
+    """Valor que sobe e desce; com 'funcao', é calculado na hora da leitura"""
+
+    def __init__(self, nome, ajuda, funcao=None):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.funcao = funcao
+        self.valor = 0
+        self.lock = Lock()
+
+    def inc(self, valor=1):
+        with self.lock:
+            self.valor += valor
+
+    def dec(self, valor=1):
+        self.inc(-valor)
+
+    def exportar(self):
+        valor = self.funcao() if self.funcao else self.valor
+        return [f'# HELP {self.nome} {self.ajuda}', f'# TYPE {self.nome} gauge', f'{self.nome} {valor}']
+
+
+class Histograma:
+    def __init__(self, nome, ajuda, rotulos=(), limites=LIMITES_TEMPO):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = tuple(rotulos)
+        self.limites = tuple(limites)
+        self.series = {}  # {valores dos rótulos: [contagens por faixa..., soma, total]}
+        self.lock = Lock()
+
+    def observar(self, valor, *rotulos):
+        faixa = bisect_left(self.limites, valor)
+        with self.lock:
+            serie = self.series.get(rotulos)
+            if serie is None:
+                serie = self.series[rotulos] = [0] * (len(self.limites) + 3)
+            serie[faixa] += 1
+            serie[-2] += valor
+            serie[-1] += 1
+
+    def exportar(self):
+        linhas = [f'# HELP {self.nome} {self.ajuda}', f'# TYPE {self.nome} histogram']
+        with self.lock:
+            itens = sorted((r, list(s)) for r, s in self.series.items())
+        for rotulos, serie in itens:
+            acumulado = 0
+            for limite, contagem in zip(self.limites + ('+Inf',), serie):
+                acumulado += contagem
+                le = _rotulos(self.rotulos + ('le',), rotulos + (limite,))
+                linhas.append(f'{self.nome}_bucket{le} {acumulado}')
+            base = _rotulos(self.rotulos, rotulos)
+            linhas.append(f'{self.nome}_sum{base} {serie[-2]}')
+            linhas.append(f'{self.nome}_count{base} {serie[-1]}')
+        return linhas
+
+
+class LockMedido:
+    """Lock que registra quanto tempo se esperou por ele e quanto tempo ficou preso
+
+    Mesma interface de threading.Lock (with, acquire, release).
+    """
+
+    def __init__(self, espera, posse):
+        self._lock = Lock()
+        self.espera = espera
+        self.posse = posse
+        self._desde = 0.0  # só quem está com o lock escreve aqui
+
+    def acquire(self, blocking=True, timeout=-1):
+        inicio = time.perf_counter()
+        if not self._lock.acquire(blocking, timeout):
+            return False
+        self._desde = time.perf_counter()
+        self.espera.observar(self._desde - inicio)
+        return True
+
+    def release(self):
+        posse = time.perf_counter() - self._desde
+        self._lock.release()
+        self.posse.observar(posse)
+
+    def locked(self):
+        return self._lock.locked()
+
+    __enter__ = acquire
+
+    def __exit__(self, *_):
+        self.release()
+
+
+class Metricas:
+    """Registro das métricas de um servidor"""
+
+    def __init__(self):
+        self.itens = []
+
+    def registrar(self, metrica):
+        self.itens.append(metrica)
+        return metrica
+
+    def contador(self, nome, ajuda, rotulos=()):
+        return self.registrar(Contador(nome, ajuda, rotulos))
+
+    def medidor(self, nome, ajuda, funcao=None):
+        return self.registrar(Medidor(nome, ajuda, funcao))
+
+    def histograma(self, nome, ajuda, rotulos=(), limites=LIMITES_TEMPO):
+        return self.registrar(Histograma(nome, ajuda, rotulos, limites))
+
+    def texto(self):
+        linhas = []
+        for metrica in self.itens:
+            linhas.extend(metrica.exportar())
+        return '\n'.join(linhas) + '\n'
+
+    def servir(self, porta, endereco='127.0.0.1'):
+        """Sobe o endpoint HTTP /metrics numa thread; retorna o servidor HTTP"""
+        metricas = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                corpo = metricas.texto().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(corpo)))
+                self.end_headers()
+                self.wfile.write(corpo)
+
+            def log_message(self, *_):
+                pass  # uma linha por leitura só polui o log
+
+        http = ThreadingHTTPServer((endereco, porta), Handler)
+        http.daemon_threads = True
+        Thread(target=http.serve_forever, daemon=True).start()
+        return http
@@ -0,0 +1,86 @@
+"""Espectadores: a plateia de cada sala recebe as mesmas atualizações dos jogadores.
+
+Quem joga não espera a plateia: o broadcast (dentro do lock da sala) só coloca a
+atualização numa fila. Uma única thread, o transmissor, tira da fila e espalha: a
+mensagem é codificada uma vez por codec e o mesmo objeto bytes vai para a fila de saída
+de todos os espectadores, sem json.dumps por destinatário. Como tudo passa pela mesma
+fila, a ordem das atualizações de uma sala é a ordem em que o lock da sala as gerou.
+
+Espectador lento (fila de saída cheia) é coalescido: o que ele ainda não leu é trocado
+pelo estado atual da sala, então ele pula jogadas mas nunca segura ninguém.
+"""
+import queue
+from threading import Thread
+
+
+class Transmissor:
+    """Thread que espalha as atualizações das salas para as plateias
+
+    sala.plateia ({conn: None}) só é lida e alterada por esta thread; entrar, sair e
+    publicar só colocam pedidos na fila, em ordem.
+    """
+
+    def __init__(self):
+        self.fila = queue.SimpleQueue()
+        self.enviados = 0  # quadros colocados em filas de espectadores
+        self.codificacoes = 0  # json.dumps/struct.pack feitos (um por codec por atualização)
+        self.coalescidos = 0  # espectadores lentos que pularam para o estado atual
+        Thread(target=self.transmitir, daemon=True).start()
+
+    def entrar(self, sala, conn, quadro):
+        """conn passa a receber as atualizações da sala, começando por 'quadro' (o snapshot)"""
+        self.fila.put(('entrar', sala, conn, quadro))
+
+    def sair(self, sala, conn):
+        self.fila.put(('sair', sala, conn, None))
+
+    def publicar(self, sala, mensagem, estado=None):
+        """Atualização para a plateia (chamar dentro do lock da sala, para manter a ordem)
+
+        'estado' é uma função que devolve o snapshot da sala já com a atualização, mandado no
+        lugar de tudo o que estava pendente para um espectador lento; ela só é chamada se
+        algum espectador transbordar. Sem ela, vai a própria mensagem.
+        """
+        self.fila.put(('publicar', sala, mensagem, estado))
+
+    def pendentes(self):
+        return self.fila.qsize()
+
+    def transmitir(self):
+        while True:
+            acao, sala, a, b = self.fila.get()
+            if acao == 'publicar':
+                self.espalhar(sala, a, b)
+            elif acao == 'entrar':
+                if sala is not None:  # sem sala: só o quadro, na ordem (espectador esperando partida)
+                    sala.plateia[a] = None
+                a.enfileirar(b)
+                self.enviados += 1
+            else:
+                sala.plateia.pop(a, None)
+
+    def espalhar(self, sala, mensagem, estado):
+        quadros = {}  # {codec: bytes} da mensagem
+        snapshots = {}  # {codec: bytes} do estado, só se algum espectador transbordar
+        snapshot_mensagem = None
+        for conn in sala.plateia:
+            codec = conn.codec
+            quadro = quadros.get(codec)
+            if quadro is None:
+                quadro = quadros[codec] = codec.codificar(mensagem)
+                self.codificacoes += 1
+            if conn.enfileirar(quadro):
+                self.enviados += 1
+                continue
+            # Fila cheia: o que ele não leu ficou velho
+            snapshot = snapshots.get(codec)
+            if snapshot is None:
+                if estado is None:
+                    snapshot = quadro
+                else:
+                    if snapshot_mensagem is None:
+                        snapshot_mensagem = estado()
+                    snapshot = codec.codificar(snapshot_mensagem)
+                snapshots[codec] = snapshot
+            conn.fila.substituir([snapshot])
+            self.coalescidos += 1
@@ -0,0 +1,273 @@
+"""Codecs do protocolo do jogo.
+
+Todo codec tem a mesma interface:
+    codificar(mensagem) -> bytes                     um quadro pronto para enviar
+    localizar(buffer, inicio, fim, desde) -> tupla   onde está o próximo quadro completo (ou None)
+    decodificar(quadro) -> dict | None               None para quadro vazio (linha em branco)
+
+O Enquadrador guarda os bytes recebidos e usa o localizar do codec da vez para separar os quadros.
+
+A conexão sempre começa em JSON. O cliente pede outro codec no CONECTAR ('codec': 'binario')
+e, se o servidor aceitar, os dois lados trocam de codec logo depois do CONECTADO.
+"""
+import json
+import struct
+
+# 1: toda atualização leva o tabuleiro inteiro
+# 2: jogadas chegam como delta (casa + seq); tabuleiro inteiro só em snapshots e em SINCRONIZAR
+VERSAO_PROTOCOLO = 2
+
+
+class CodecJSON:
+    """JSON delimitado por '\\n' (protocolo original)"""
+    nome = 'json'
+    quadro_vazio = b'\n'  # PING/PONG curto: 1 byte
+
+    def codificar(self, mensagem):
+        return (json.dumps(mensagem) + '\n').encode()
+
+    def localizar(self, buffer, inicio, fim, desde):
+        """Retorna (início do corpo, fim do corpo, início do próximo quadro) ou None
+
+        'desde' é até onde o buffer já foi varrido sem achar '\n': não procura de novo ali.
+        """
+        posicao = buffer.find(b'\n', desde, fim)
+        if posicao < 0:
+            return None
+        return inicio, posicao, posicao + 1
+
+    def decodificar(self, quadro):
+        texto = bytes(quadro)
+        if not texto.strip():
+            return None
+        return json.loads(texto)
+
+
+# Conversões de campos do codec binário
+SIMBOLOS = {'': 0, 'X': 1, 'O': 2}
+SIMBOLOS_REV = {v: k for k, v in SIMBOLOS.items()}
+GANHADORES = {None: 0, 'X': 1, 'O': 2, 'EMPATE': 3}
+GANHADORES_REV = {v: k for k, v in GANHADORES.items()}
+
+FORMATOS = {'u8': 'B', 'u16': 'H', 'u32': 'I', 'bool': '?', 'simbolo': 'B', 'ganhador': 'B', 'tabuleiro': 'HH'}
+
+# tipo -> variantes (código, campos); a variante usada é a que tem exatamente as mesmas chaves.
+# Campo 'texto' só pode ser o último (ocupa o resto do quadro).
+ESQUEMAS = {
+    'PING': [(1, ()), (15, (('rtt_ms', 'u16'),))],
+    'PONG': [(2, ())],
+    'JOGADA': [(3, (('linha', 'u8'), ('coluna', 'u8'))), (19, (('linha', 'u8'), ('coluna', 'u8'), ('seq', 'u16')))],
+    'JOGADA_OK': [
+        (4, (('linha', 'u8'), ('coluna', 'u8'), ('simbolo', 'simbolo'), ('seq', 'u16'), ('proximo_turno', 'simbolo'))),
+        (5, (('tabuleiro', 'tabuleiro'), ('proximo_turno', 'simbolo'))),
+    ],
+    'FIM_JOGO': [
+        (6, (('linha', 'u8'), ('coluna', 'u8'), ('simbolo', 'simbolo'), ('seq', 'u16'), ('ganhador', 'ganhador'))),
+        (7, (('tabuleiro', 'tabuleiro'), ('ganhador', 'ganhador'))),
+    ],
+    'REINICIAR': [(8, ())],
+    'REINICIO': [(9, (('tabuleiro', 'tabuleiro'), ('turno_atual', 'simbolo'), ('seq', 'u16')))],
+    'JOGO_INICIADO': [(10, (('simbolo', 'simbolo'), ('sala', 'u32'), ('jogadores', 'u8'), ('jogo_iniciado', 'bool'),
+                            ('tabuleiro', 'tabuleiro'), ('turno_atual', 'simbolo'), ('seq', 'u16')))],
+    'SINCRONIZAR': [(11, ())],
+    'ESTADO': [(12, (('jogo_iniciado', 'bool'), ('tabuleiro', 'tabuleiro'), ('turno_atual', 'simbolo'), ('seq', 'u16')))],
+    'ERRO': [(13, (('mensagem', 'texto'),)), (20, (('seq', 'u16'), ('mensagem', 'texto')))],
+    'OPONENTE_DESCONECTOU': [(14, (('mensagem', 'texto'),))],
+    'DICA': [(16, ()), (17, (('linha', 'u8'), ('coluna', 'u8'), ('resultado', 'ganhador')))],
+    'SALA_ENCERRADA': [(18, (('sala', 'u32'),))],
+}
+CODIGO_JSON = 0xFF  # qualquer mensagem sem esquema vai como JSON dentro do quadro binário
+
+CABECALHO = struct.Struct('!H')  # tamanho do corpo (tipo + campos)
+
+
+def _empacotar_tabuleiro(tabuleiro):
+    if len(tabuleiro) != 3 or any(len(linha) != 3 for linha in tabuleiro):
+        raise ValueError("só tabuleiros 3x3 têm formato binário")
+    x = o = 0
+    for i in range(3):
+        for j in range(3):
+            bit = 1 << (i * 3 + j)
+            if tabuleiro[i][j] == 'X':
+                x |= bit
+            elif tabuleiro[i][j] == 'O':
+                o |= bit
+    return x, o
+
+
+def _desempacotar_tabuleiro(x, o):
+    return [
+        ['X' if x & (1 << (i * 3 + j)) else 'O' if o & (1 << (i * 3 + j)) else '' for j in range(3)]
+        for i in range(3)
+    ]
+
+
+class _Variante:
+    def __init__(self, tipo, codigo, campos):
+        self.tipo = tipo
+        self.codigo = codigo
+        self.campos = campos
+        self.chaves = frozenset(['tipo'] + [nome for nome, _ in campos])
+        self.texto = campos[-1][0] if campos and campos[-1][1] == 'texto' else None
+        fixos = campos[:-1] if self.texto else campos
+        self.fixos = fixos
+        self.struct = struct.Struct('!B' + ''.join(FORMATOS[tipo_campo] for _, tipo_campo in fixos))
+
+    def empacotar(self, mensagem):
+        valores = [self.codigo]
+        for nome, tipo_campo in self.fixos:
+            valor = mensagem[nome]
+            if tipo_campo == 'simbolo':
+                valores.append(SIMBOLOS[valor])
+            elif tipo_campo == 'ganhador':
+                valores.append(GANHADORES[valor])
+            elif tipo_campo == 'tabuleiro':
+                valores.extend(_empacotar_tabuleiro(valor))
+            else:
+                valores.append(valor)
+        corpo = self.struct.pack(*valores)
+        if self.texto:
+            corpo += (mensagem[self.texto] or '').encode()
+        return corpo
+
+    def desempacotar(self, corpo):
+        valores = iter(self.struct.unpack_from(corpo))
+        next(valores)  # código
+        mensagem = {'tipo': self.tipo}
+        for nome, tipo_campo in self.fixos:
+            valor = next(valores)
+            if tipo_campo == 'simbolo':
+                valor = SIMBOLOS_REV[valor]
+            elif tipo_campo == 'ganhador':
+                valor = GANHADORES_REV[valor]
+            elif tipo_campo == 'tabuleiro':
+                valor = _desempacotar_tabuleiro(valor, next(valores))
+            mensagem[nome] = valor
+        if self.texto:
+            mensagem[self.texto] = bytes(corpo[self.struct.size:]).decode()
+        return mensagem
+
+
+class CodecBinario:
+    """Quadros com prefixo de tamanho; tipos e campos empacotados com struct, tabuleiro em bits"""
+    nome = 'binario'
+    quadro_vazio = b'\x00\x00'  # PING/PONG curto: só o cabeçalho, corpo vazio
+
+    def __init__(self):
+        self.por_tipo = {}
+        self.por_codigo = {}
+        for tipo, variantes in ESQUEMAS.items():
+            for codigo, campos in variantes:
+                variante = _Variante(tipo, codigo, campos)
+                self.por_tipo.setdefault(tipo, []).append(variante)
+                self.por_codigo[codigo] = variante
+
+    def codificar(self, mensagem):
+        corpo = None
+        chaves = mensagem.keys()
+        for variante in self.por_tipo.get(mensagem.get('tipo'), ()):
+            if chaves == variante.chaves:
+                try:
+                    corpo = variante.empacotar(mensagem)
+                except (KeyError, ValueError, struct.error):
+                    corpo = None  # valor fora do formato: cai no JSON
+                break
+        if corpo is None:
+            corpo = bytes([CODIGO_JSON]) + json.dumps(mensagem).encode()
+        return CABECALHO.pack(len(corpo)) + corpo
+
+    def localizar(self, buffer, inicio, fim, desde):
+        """Retorna (início do corpo, fim do corpo, início do próximo quadro) ou None"""
+        if fim - inicio < CABECALHO.size:
+            return None
+        (tamanho,) = CABECALHO.unpack_from(buffer, inicio)
+        fim_corpo = inicio + CABECALHO.size + tamanho
+        if fim_corpo > fim:
+            return None
+        return inicio + CABECALHO.size, fim_corpo, fim_corpo
+
+    def decodificar(self, quadro):
+        if not quadro:
+            return None
+        if quadro[0] == CODIGO_JSON:
+            return json.loads(bytes(quadro[1:]))
+        variante = self.por_codigo.get(quadro[0])
+        if variante is None:
+            raise ValueError(f"tipo de mensagem binária desconhecido: {quadro[0]}")
+        return variante.desempacotar(quadro)
+
+
+CODEC_JSON = CodecJSON()
+CODECS = {
+    'json': CODEC_JSON,
+    'binario': CodecBinario(),
+}
+
+
+class QuadroMuitoGrande(ValueError):
+    """O outro lado mandou (ou está mandando) um quadro maior que o limite"""
+
+
+class Enquadrador:
+    """Buffer de recepção reaproveitável para qualquer codec
+
+    Os dados entram direto no bytearray (recv_into), os quadros saem como memoryview
+    sobre ele, e o delimitador é procurado só nos bytes novos. O espaço é compactado
+    no lugar e o buffer só cresce até caber um quadro de tamanho_maximo.
+    """
+
+    def __init__(self, tamanho_inicial=4096, tamanho_maximo=64 * 1024):
+        self.buffer = bytearray(tamanho_inicial)
+        self.inicio = 0   # primeiro byte ainda não consumido
+        self.fim = 0      # fim dos bytes válidos
+        self.varrido = 0  # até onde já se procurou delimitador sem achar
+        self.tamanho_maximo = tamanho_maximo
+
+    def espaco_livre(self, minimo=4096):
+        """memoryview da parte livre do buffer, com pelo menos 'minimo' bytes"""
+        if len(self.buffer) - self.fim < minimo:
+            pendente = self.fim - self.inicio
+            if self.inicio:
+                # Compacta: move os bytes pendentes para o começo
+                self.buffer[:pendente] = self.buffer[self.inicio:self.fim]
+                self.varrido -= self.inicio
+                self.inicio, self.fim = 0, pendente
+            if len(self.buffer) - self.fim < minimo:
+                # Buffer novo em vez de resize: pode haver memoryview de quadro antigo ainda viva
+                novo = bytearray(max(2 * len(self.buffer), pendente + minimo))
+                novo[:pendente] = self.buffer[:pendente]
+                self.buffer = novo
+        return memoryview(self.buffer)[self.fim:]
+
+    def avancar(self, quantidade):
+        """Marca como recebidos os 'quantidade' bytes escritos em espaco_livre()"""
+        self.fim += quantidade
+
+    def receber(self, sock, tamanho=4096):
+        """recv_into direto no buffer; retorna quantos bytes chegaram (0 = conexão fechada)"""
+        quantidade = sock.recv_into(self.espaco_livre(tamanho))
+        self.avancar(quantidade)
+        return quantidade
+
+    def alimentar(self, dados):
+        """Copia bytes recebidos por outro meio (ex.: data_received do asyncio)"""
+        self.espaco_livre(len(dados))[:len(dados)] = dados
+        self.avancar(len(dados))
+
+    def proximo_quadro(self, codec):
+        """Próximo quadro completo (memoryview, válida até a próxima recepção) ou None"""
+        achado = codec.localizar(self.buffer, self.inicio, self.fim, max(self.varrido, self.inicio))
+        if achado is None:
+            self.varrido = self.fim
+            if self.fim - self.inicio > self.tamanho_maximo:
+                raise QuadroMuitoGrande(f"quadro passou de {self.tamanho_maximo} bytes")
+            return None
+
+        inicio_corpo, fim_corpo, proximo = achado
+        if fim_corpo - inicio_corpo > self.tamanho_maximo:
+            raise QuadroMuitoGrande(f"quadro passou de {self.tamanho_maximo} bytes")
+        self.inicio = proximo
+        if self.inicio == self.fim:
+            # Tudo consumido: a próxima recepção volta ao começo sem copiar nada
+            self.inicio = self.fim = self.varrido = 0
+        return memoryview(self.buffer)[inicio_corpo:fim_corpo]
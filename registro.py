@@ -0,0 +1,90 @@
+"""Log do servidor: logging com fila e uma thread de escrita.
+
+Quem loga (muitas vezes com o lock de uma sala na mão) só coloca o registro numa fila;
+a escrita no terminal/arquivo acontece numa thread separada (QueueListener).
+
+Canais (loggers):
+    jogo            eventos normais: conexões, salas, erros
+    jogo.mensagens  cada mensagem recebida/enviada (DEBUG, com amostragem)
+    jogo.tabuleiro  tabuleiro depois de cada jogada  } desligados por padrão;
+    jogo.banner     faixas de início/fim de jogo     } ligar_detalhes() ou SIGUSR1
+"""
+import atexit
+import logging
+import logging.handlers
+import queue
+import signal
+import sys
+from itertools import count
+
+log = logging.getLogger('jogo')
+log_mensagens = logging.getLogger('jogo.mensagens')
+log_tabuleiro = logging.getLogger('jogo.tabuleiro')
+log_banner = logging.getLogger('jogo.banner')
+
+DETALHES = (log_tabuleiro, log_banner)
+DESLIGADO = logging.CRITICAL + 1
+
+# Até configurar() ser chamado, os detalhes ficam desligados mesmo com o logging padrão
+for _logger in DETALHES:
+    _logger.setLevel(DESLIGADO)
+
+_ouvinte = None
+
+
+class FiltroAmostragem(logging.Filter):
+    """Deixa passar 1 a cada 'taxa' registros abaixo de WARNING; avisos e erros passam sempre"""
+
+    def __init__(self, taxa=1):
+        super().__init__()
+        self.taxa = max(1, int(taxa))
+        self._contador = count()
+
+    def filter(self, registro):
+        if registro.levelno >= logging.WARNING or self.taxa == 1:
+            return True
+        return next(self._contador) % self.taxa == 0
+
+
+def configurar(nivel='INFO', amostragem=1, detalhes=False, arquivo=None):
+    """Liga o log em fila: 'nivel' do canal principal, 1 a cada 'amostragem' mensagens
+    em jogo.mensagens, e os detalhes (tabuleiro e faixas) ligados ou não"""
+    global _ouvinte
+    if _ouvinte is not None:
+        _ouvinte.stop()
+
+    destino = logging.FileHandler(arquivo) if arquivo else logging.StreamHandler(sys.stdout)
+    destino.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+
+    fila = queue.SimpleQueue()
+    log.handlers[:] = [logging.handlers.QueueHandler(fila)]
+    log.propagate = False
+    log.setLevel(nivel)
+    _ouvinte = logging.handlers.QueueListener(fila, destino)
+    _ouvinte.start()
+    atexit.register(_ouvinte.stop)  # esvazia a fila antes de sair
+
+    log_mensagens.filters[:] = [FiltroAmostragem(amostragem)]
+    ligar_detalhes(detalhes)
+
+    if hasattr(signal, 'SIGUSR1'):
+        try:
+            signal.signal(signal.SIGUSR1, alternar_detalhes)
+        except ValueError:
+            pass  # fora da thread principal: só por ligar_detalhes()
+
+
+def ligar_detalhes(ligado=True):
+    """Liga/desliga tabuleiro e faixas em tempo de execução"""
+    for logger in DETALHES:
+        logger.setLevel(logging.DEBUG if ligado else DESLIGADO)
+
+
+def detalhes_ligados():
+    return log_tabuleiro.level != DESLIGADO
+
+
+def alternar_detalhes(*_):
+    """Handler do SIGUSR1 (kill -USR1 <pid>)"""
+    ligar_detalhes(not detalhes_ligados())
+    log.warning("Tabuleiro e faixas %s", 'ligados' if detalhes_ligados() else 'desligados')
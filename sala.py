@@ -0,0 +1,228 @@
+import logging
+import time
+from itertools import count
+from threading import RLock
+
+from emparelhamento import Emparelhador
+from registro import log_banner, log_tabuleiro
+from sessao import Jogador
+from tabuleiro import VARIANTE_PADRAO, VARIANTES, Tabuleiro
+
+
+# Instante (ms) em que o processo subiu: separa as partidas de execuções diferentes no mesmo histórico
+INICIO = f'{time.time_ns() // 1_000_000:x}'
+
+
+class Sala:
+    """Uma partida: tabuleiro, turno e jogadores próprios"""
+
+    def __init__(self, id_sala, variante=VARIANTE_PADRAO):
+        self.id = id_sala
+        self.variante = variante  # chave de VARIANTES: tamanho do tabuleiro e quantas em linha
+        self.estado = self.novo_tabuleiro()
+        self.jogadores = {}  # {conn: Jogador (o mesmo registro do servidor)}
+        self.turno_atual = 'X'
+        self.jogo_ativo = False
+        self.seq = 0  # número da última jogada aplicada na partida atual
+        self.id_partida = None  # id da partida atual no histórico
+        self.partidas = 0  # partidas já começadas nesta sala (entra no id_partida)
+        self.partida = None  # token combinado no CONECTAR ('partida'), se houver
+        self.faixa = None  # faixa de emparelhamento enquanto espera oponente
+        self.desde = 0.0
+        self.alcance = 0
+        self.plateia = {}  # {conn: None} espectadores; só o transmissor (plateia.py) mexe
+        self.espectadores = 0  # tamanho da plateia, mantido com o lock global do servidor
+        # Protege tabuleiro, turno e jogadores desta sala. Reentrante: o modo pipeline pega o
+        # lock uma vez para vários quadros, e cada processamento pega de novo sem esperar
+        self.lock = RLock()
+
+    @property
+    def tabuleiro(self):
+        """Tabuleiro no formato do protocolo (lista N x N)"""
+        return self.estado.para_lista()
+
+    def novo_tabuleiro(self):
+        return Tabuleiro(*VARIANTES[self.variante])
+
+    def cheia(self):
+        return len(self.jogadores) >= 2
+
+    def simbolo_livre(self):
+        """Retorna o símbolo que ainda não foi ocupado na sala"""
+        ocupados = {dados.simbolo for dados in self.jogadores.values()}
+        return 'X' if 'X' not in ocupados else 'O'
+
+    def criar_tabuleiro(self):
+        """Reinicia o tabuleiro"""
+        self.partidas += 1
+        self.id_partida = f'{INICIO}.{self.id}.{self.partidas}'  # ids de sala não repetem entre processos
+        self.estado = self.novo_tabuleiro()
+        self.seq = 0
+        self.turno_atual = 'X'
+        self.jogo_ativo = True
+        log_banner.info("%s\nNOVO JOGO INICIADO NA SALA %s!\n%s", "="*50, self.id, "="*50)
+        self.imprimir_tabuleiro()
+
+    def resetar(self):
+        """Volta a sala para o estado de espera"""
+        self.estado = self.novo_tabuleiro()
+        self.seq = 0
+        self.turno_atual = 'X'
+        self.jogo_ativo = False
+
+    def verificar_casa(self, linha, coluna):
+        """Verifica se a casa está vazia (sem lock - deve ser chamado dentro de lock)"""
+        return self.estado.casa_livre(linha, coluna)
+
+    def jogar(self, linha, coluna, simbolo):
+        """Aplica a jogada e retorna o ganhador, 'EMPATE' ou None (chamar dentro de lock)"""
+        self.seq += 1
+        return self.estado.jogar(linha, coluna, simbolo)
+
+    def imprimir_tabuleiro(self):
+        """Manda o tabuleiro para o log (canal jogo.tabuleiro, desligado por padrão)"""
+        if not log_tabuleiro.isEnabledFor(logging.DEBUG):
+            return  # nem monta o texto
+        linhas = [" | ".join([celula if celula else ' ' for celula in linha]) for linha in self.tabuleiro]
+        separador = "\n  " + "-" * (4 * self.estado.tamanho - 3) + "\n  "
+        log_tabuleiro.debug("Tabuleiro atual (sala %s):\n  %s", self.id, separador.join(linhas))
+
+
+class AssentoBot:
+    """Lugar de um bot numa sala: ocupa o lugar de uma conexão, mas não tem socket.
+
+    Ninguém manda mensagens para ele; o servidor joga por ele consultando a tabela de
+    jogo perfeito (jogo_perfeito.py) logo depois da jogada do oponente.
+    """
+
+
+class Lobby:
+    """Distribui os jogadores entre as salas (chamar dentro do lock global do servidor)
+
+    Sem token de partida, quem chega entra na sala de um jogador compatível que já está
+    esperando (faixa de rating e de RTT, ver emparelhamento.py) ou abre uma sala nova.
+    """
+
+    def __init__(self, primeiro_id=1, passo=1, emparelhador=None):
+        self.salas = {}  # {id: Sala}
+        self.espera = Emparelhador() if emparelhador is None else emparelhador  # salas aguardando jogador
+        self.por_partida = {}  # {token da partida: Sala} salas combinadas, fora da espera
+        self.em_destaque = None  # sala que quem pede ASSISTIR sem escolher vai ver
+        self._ids = count(primeiro_id, passo)  # vários processos: ids intercalados, sem repetir
+
+    def alocar(self, conn, dados, partida=None, contra_bot=False):
+        """Coloca o jogador na sala de um oponente compatível ou cria uma nova
+
+        Com 'partida', o jogador vai para a sala combinada com esse token (criada pelo
+        primeiro que chegar, que escolhe a variante) e nunca para uma sala aberta a
+        desconhecidos. Com 'contra_bot', vai para uma sala nova já com um bot. Sem token,
+        só encontra oponentes que pediram a mesma variante (dados.variante).
+        """
+        agora = time.monotonic()
+        faixa = None
+        variante = dados.variante
+        if contra_bot:
+            sala = Sala(next(self._ids), variante)
+            self.salas[sala.id] = sala
+            self._entrar(sala, conn, dados)
+            self.sentar_bot(sala)
+            return sala
+        if partida is not None:
+            sala = self.por_partida.get(partida)
+            if sala is None or sala.cheia():
+                sala = Sala(next(self._ids), variante)
+                sala.partida = partida
+                self.salas[sala.id] = sala
+                self.por_partida[partida] = sala
+        else:
+            faixa = self.espera.faixa(dados)
+            sala = self.espera.procurar(faixa, agora)
+            if sala is not None:
+                self.espera.retirar(sala)
+            else:
+                sala = Sala(next(self._ids), variante)
+                self.salas[sala.id] = sala
+
+        self._entrar(sala, conn, dados)
+
+        if not sala.cheia() and sala.partida is None:
+            self.espera.colocar(sala, faixa, agora)
+        return sala
+
+    def _entrar(self, sala, conn, dados):
+        with sala.lock:
+            dados.simbolo = sala.simbolo_livre()
+            dados.sala = sala
+            dados.variante = sala.variante
+            sala.jogadores[conn] = dados
+
+    def sentar_bot(self, sala):
+        """Completa a sala com um bot (ela sai da espera)"""
+        self.espera.retirar(sala)
+        assento = AssentoBot()
+        self._entrar(sala, assento, Jogador(assento, versao=2, bot=True))
+
+    def sentar_bots(self, agora, variante):
+        """Completa com bot as salas da 'variante' que passaram um alargamento sem oponente
+
+        A espera está em ordem de chegada, então só olha até a primeira sala que ainda não
+        esperou espera_alargar segundos. Retorna as salas que ficaram cheias.
+        """
+        limite = agora - self.espera.espera_alargar
+        alcance = min(1, self.espera.raio_max)  # sem alargamento (raio_max 0), basta o prazo
+        vencidas = []
+        for sala in self.espera.esperando.values():
+            if sala.desde > limite:
+                break
+            if sala.variante == variante and sala.alcance >= alcance:
+                vencidas.append(sala)
+        for sala in vencidas:
+            self.sentar_bot(sala)
+        return vencidas
+
+    def liberar(self, sala):
+        """Chamado depois que um jogador saiu: sala vazia é descartada, sala com vaga volta para a espera"""
+        if not sala.jogadores:
+            self.salas.pop(sala.id, None)
+            self.espera.retirar(sala)
+            if self.por_partida.get(sala.partida) is sala:
+                del self.por_partida[sala.partida]
+        elif not sala.cheia() and sala.partida is None and sala not in self.espera:
+            dados = next(iter(sala.jogadores.values()))
+            self.espera.colocar(sala, self.espera.faixa(dados), time.monotonic(), procurou=False)
+
+    def destaque(self):
+        """Partida em destaque: continua a mesma enquanto a sala existir; senão, a mais assistida com jogo
+
+        Assim a plateia se concentra numa sala só, e só a troca de destaque percorre as salas.
+        """
+        sala = self.em_destaque
+        if sala is None or self.salas.get(sala.id) is not sala:
+            sala = self.em_destaque = max((s for s in self.salas.values() if s.jogo_ativo),
+                                          key=lambda s: (s.espectadores, -s.id), default=None)
+        return sala
+
+    def emparelhar_espera(self, agora=None):
+        """Alarga as faixas de quem está esperando; retorna as salas que ficaram cheias
+
+        Dois jogadores que esperavam em salas diferentes e passaram a se aceitar: o da sala
+        mais nova muda para a mais antiga (e pode trocar de símbolo).
+        """
+        agora = time.monotonic() if agora is None else agora
+        cheias = []
+        for fica, vem in self.espera.alargar(agora):
+            # Sair de uma sala e entrar na outra com o lock da antiga na mão: quem olha
+            # dados.sala com o lock da sala (processar_conexao) vê o jogador numa ou noutra
+            with vem.lock:
+                movido = vem.jogadores.popitem() if vem.jogadores else None
+                if movido is not None:
+                    self._entrar(fica, *movido)
+            if movido is not None:
+                self.salas.pop(vem.id, None)
+            # Um dos dois pode ter saído nesse meio tempo (o liberar() dele ainda vem)
+            if fica.cheia():
+                cheias.append(fica)
+            elif fica.jogadores:
+                dados = next(iter(fica.jogadores.values()))
+                self.espera.colocar(fica, self.espera.faixa(dados), agora, procurou=False)
+        return cheias
@@ -1,125 +1,452 @@
+import argparse
+import secrets
+import signal
 import socket
-import json
+import struct
+import sys
 import time
-from threading import Thread, Lock
-from datetime import datetime, timedelta
+from threading import Thread
+
+from admissao import LIMITE_RECUSAS, QUADRO_LOTADO, Limitador
+from emparelhamento import Emparelhador
+from fila_envio import FilaEnvio
+from historico import DURABILIDADES, GravadorPartidas
+from jogo_perfeito import carregar_ou_resolver
+from metricas import LockMedido, Metricas
+from plateia import Transmissor
+from protocolo import CODEC_JSON, CODECS, VERSAO_PROTOCOLO, Enquadrador, QuadroMuitoGrande
+import registro
+from registro import log, log_banner, log_mensagens
+from sala import AssentoBot, Lobby
+from tabuleiro import VARIANTE_PADRAO, VARIANTES, Tabuleiro, mascaras_para_lista
+from servidor_multiprocesso import PRAZO_CONECTAR, iniciar_multiprocesso, receber_conexao
+from sessao import Espectador, Jogador, RegistroConexoes
+from temporizador import RodaTemporizadora
+
+POLITICAS_FILA = ('descartar', 'coalescer', 'desconectar')
+
+# Tipos que o cliente manda; qualquer outro vira 'outro' nas métricas (rótulo não pode crescer sem limite)
+TIPOS_CLIENTE = frozenset(('PING', 'CONECTAR', 'RETOMAR', 'SAIR', 'JOGADA', 'REINICIAR', 'SINCRONIZAR', 'DICA',
+                           'ASSISTIR'))
+
+# Modo pipeline: tipos que só pegam o lock da sala (nunca o global), então uma sequência
+# deles numa mesma leitura pode ser processada com o lock da sala pego uma vez só
+TIPOS_SALA = frozenset(('JOGADA', 'REINICIAR', 'SINCRONIZAR', 'DICA'))
+IOV_MAX = 1024  # buffers por sendmsg
+
+
+def configurar_keepalive(sock, ocioso, intervalo=None, tentativas=3):
+    """Liga o keepalive TCP do kernel: depois de 'ocioso' segundos sem tráfego, sondas a cada
+    'intervalo' segundos; 'tentativas' sem resposta derrubam a conexão (o recv dá erro)"""
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    # Opções que nem todo sistema tem (TCP_KEEPIDLE é Linux; macOS usa TCP_KEEPALIVE)
+    opcoes = (('TCP_KEEPIDLE', ocioso), ('TCP_KEEPALIVE', ocioso), ('TCP_KEEPINTVL', intervalo or max(1, ocioso // 3)),
+              ('TCP_KEEPCNT', tentativas))
+    for nome, valor in opcoes:
+        if hasattr(socket, nome):
+            sock.setsockopt(socket.IPPROTO_TCP, getattr(socket, nome), int(valor))
+
+class Conexao:
+    """Socket de um cliente com fila de saída própria
+    
+    Várias threads enfileiram mensagens para ele; só a thread de escrita da conexão
+    chama sendall, então um cliente lento não segura quem está enviando.
+    """
+    def __init__(self, sock, limite_fila=64 * 1024):
+        self.sock = sock
+        self.fila = FilaEnvio(limite_fila)
+        self.codec = CODEC_JSON  # trocado no CONECTAR se o cliente pedir outro
+        self.fd = sock.fileno()  # índice nos registros do servidor (fileno() vira -1 depois do close)
+        self.visto = time.monotonic()  # último byte recebido: qualquer tráfego prova que está vivo
+        self.limitador = None  # baldes de fichas (admissao.py), com limite_mensagens
+        Thread(target=self.escrever, daemon=True).start()
+    
+    def recv_into(self, buffer):
+        return self.sock.recv_into(buffer)
+    
+    def enfileirar(self, dados):
+        """Coloca um quadro na fila de saída; False se a fila está cheia"""
+        return self.fila.colocar(dados)
+    
+    def escrever(self):
+        """Thread de escrita: esvazia a fila, mandando tudo o que acumulou num único sendmsg (writev)"""
+        while True:
+            quadros = self.fila.retirar_quadros()
+            if quadros is None:
+                return
+            try:
+                if len(quadros) == 1:
+                    self.sock.sendall(quadros[0])
+                else:
+                    self.enviar_quadros(quadros)
+            except OSError as e:
+                log.warning("Erro ao enviar mensagem: %s", e)
+                # handle_cliente vê o socket derrubado e remove o jogador
+                self.fila.fechar()
+                try:
+                    self.sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+                return
+    
+    def enviar_quadros(self, quadros):
+        """sendmsg com os quadros como buffers separados (sem copiar para juntar); repete o que não saiu"""
+        while quadros:
+            lote = quadros[:IOV_MAX]
+            enviados = self.sock.sendmsg(lote)
+            usados = 0
+            for quadro in lote:
+                if enviados < len(quadro):
+                    break
+                enviados -= len(quadro)
+                usados += 1
+            quadros = quadros[usados:]
+            if enviados:
+                quadros[0] = memoryview(quadros[0])[enviados:]
+    
+    def shutdown(self, how):
+        self.sock.shutdown(how)
+    
+    def close(self):
+        self.fila.fechar()
+        self.sock.close()
 
 class ServidorJogoDaVelha:
-    def __init__(self, porta=12111):
+    def __init__(self, porta=12111, timeout_inatividade=15.0, intervalo_ping=5.0,
+                 limite_fila=64 * 1024, politica_fila='coalescer', tempo_retomada=20.0, indice=0,
+                 bot_sem_oponente=False, tabela=None, historico=None, durabilidade='periodica', pipeline=False,
+                 keepalive=None, max_conexoes=None, limite_mensagens=None, backlog=socket.SOMAXCONN):
         self.porta = porta
-        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)#afinet é para endereços IPV4 3 stream para tcp
-        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        self.server.bind(('', porta))
-        self.server.listen(2)
-        
-        self.tabuleiro = [['' for _ in range(3)] for _ in range(3)]
-        self.jogadores = {}  # {conn: {'simbolo': 'X'/'O', 'ultimo_ping': datetime, 'endereco': addr}}
-        self.turno_atual = 'X'
-        self.jogo_ativo = False
-        self.lock = Lock()
+        self.server = None
+        if porta is not None:  # None: trabalhador do modo multiprocesso, recebe as conexões já aceitas
+            self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)#afinet é para endereços IPV4 3 stream para tcp
+            self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self.server.bind(('', porta))
+            # Fila de conexões completas esperando o accept (o kernel corta em net.core.somaxconn)
+            self.server.listen(backlog)
+            self.porta = self.server.getsockname()[1]  # porta=0 deixa o sistema escolher
+        
+        # Registros indexados pelo descritor do socket, com um objeto de __slots__ por conexão (sessao.py)
+        self.jogadores = RegistroConexoes()  # {conn: Jogador}
+        
+        # Sessões: o token vai no CONECTADO; se a conexão cai no meio de um jogo, o lugar
+        # fica reservado por tempo_retomada segundos esperando um RETOMAR com o token.
+        # O token começa pelo índice do processo, para o modo multiprocesso achar o trabalhador
+        self.sessoes = {}  # {token: Jogador (os mesmos de self.jogadores)}
+        self.tempo_retomada = tempo_retomada
+        self.indice = indice
+        
+        # Jogo perfeito: bots e dicas são consultas numa tabela pronta, sem busca por jogada.
+        # Com bot_sem_oponente, quem espera um alargamento (espera_alargar) sem oponente joga contra um bot
+        self.tabela = carregar_ou_resolver(tabela)
+        self.bot_sem_oponente = bot_sem_oponente
+        
+        # Histórico: registros vão para a fila de uma thread de gravação, nunca direto para o disco
+        self.historico = GravadorPartidas(historico, durabilidade) if historico else None
+        
+        # Espectadores: não jogam, só recebem as atualizações de uma sala (plateia.py)
+        self.espectadores = RegistroConexoes()  # {conn: Espectador}
+        self.sem_partida = {}  # {conn: None} espectadores esperando aparecer uma partida em destaque
+        
+        # Trabalhador do modo multiprocesso: avisa o processo principal pelo canal se alguém
+        # sem token espera oponente aqui, para ele mandar o próximo sem token para cá
+        self.canal = None
+        self.entregues = 0  # conexões recebidas pelo canal com o primeiro quadro já processado
+        self.transmissor = Transmissor()
+        self.lobby = Lobby()
+        self.criar_metricas()
+        # Protege só o registro (jogadores e lobby); cada sala tem o próprio lock
+        self.lock = LockMedido(self.m_lock_espera, self.m_lock_posse)
         self.rodando = True
         
-        print(f"Servidor  iniciado na porta {porta}")
-        print("Aguardando jogadores...")
+        # Heartbeat: o cliente pinga a cada intervalo_ping (informado no CONECTADO) e é
+        # derrubado depois de timeout_inatividade sem mandar nada (qualquer quadro conta,
+        # não só PING). Com keepalive, o kernel também sonda conexões ociosas há tantos segundos
+        self.timeout_inatividade = timeout_inatividade
+        self.intervalo_ping = intervalo_ping
+        self.keepalive = keepalive
+        self.prazos = RodaTemporizadora(resolucao=min(1.0, timeout_inatividade / 4),
+                                        horizonte=timeout_inatividade)
+        
+        # Fila de saída por conexão: limite em bytes e o que fazer quando ela enche
+        if politica_fila not in POLITICAS_FILA:
+            raise ValueError(f"política de fila desconhecida: {politica_fila}")
+        self.limite_fila = limite_fila
+        self.politica_fila = politica_fila
+        
+        # Admissão: acima de max_conexoes abertas, a conexão nova recebe ERRO e é fechada na
+        # hora; com limite_mensagens, cada conexão pode mandar tantas mensagens por segundo
+        # (e menos dos tipos caros, admissao.LIMITES_TIPO)
+        self.max_conexoes = max_conexoes
+        self.limite_mensagens = limite_mensagens
+        
+        # Pipeline: os quadros de uma leitura são processados em sequência com o lock da sala
+        # pego uma vez só e as respostas saem juntas num único envio (processar_leitura)
+        self.pipeline = pipeline
+        
+        if self.server is not None:
+            log.info("Servidor iniciado na porta %s", self.porta)
+            log.info("Aguardando jogadores...")
         
         # Inicia thread de monitoramento de conexões
         Thread(target=self.monitorar_conexoes, daemon=True).start()
     
+    def criar_metricas(self):
+        """Contadores e histogramas do caminho quente; o resto é lido na hora (servir_metricas)"""
+        m = self.metricas = Metricas()
+        self.m_conexoes = m.medidor('jogo_conexoes_ativas', "Conexões TCP abertas")
+        self.m_recusadas = m.contador('jogo_conexoes_recusadas_total',
+                                      "Conexões recusadas (servidor cheio) ou derrubadas (mensagens demais, "
+                                      "sem handshake)", ('motivo',))
+        self.m_limitadas = m.contador('jogo_mensagens_limitadas_total',
+                                      "Mensagens descartadas pelo limite de taxa, por tipo", ('tipo',))
+        m.medidor('jogo_jogadores_registrados', "Jogadores que já mandaram CONECTAR", lambda: len(self.jogadores))
+        m.medidor('jogo_partidas_ativas', "Salas com jogo em andamento",
+                  lambda: sum(1 for sala in list(self.lobby.salas.values()) if sala.jogo_ativo))
+        self.m_mensagens = m.contador('jogo_mensagens_total', "Mensagens recebidas por tipo", ('tipo',))
+        self.m_processamento = m.histograma('jogo_processamento_segundos',
+                                            "Tempo de processar_mensagem por tipo", ('tipo',))
+        self.m_lock_espera = m.histograma('jogo_lock_global_espera_segundos', "Espera pelo lock global")
+        self.m_lock_posse = m.histograma('jogo_lock_global_posse_segundos', "Tempo com o lock global na mão")
+        self.m_timeouts = m.contador('jogo_timeouts_heartbeat_total', "Jogadores derrubados por falta de PING")
+        self.m_sessoes = m.contador('jogo_sessoes_total', "Lugares reservados depois de uma queda, pelo desfecho",
+                                    ('desfecho',))
+        m.medidor('jogo_sessoes_reservadas', "Lugares esperando RETOMAR",
+                  lambda: sum(1 for dados in list(self.sessoes.values()) if dados.ausente))
+        self.m_transbordos = m.contador('jogo_fila_transbordos_total',
+                                        "Filas de saída cheias, pela política aplicada", ('politica',))
+        m.medidor('jogo_fila_saida_bytes', "Bytes esperando nas filas de saída",
+                  lambda: self.metricas_filas()['bytes_pendentes'])
+        m.medidor('jogo_fila_saida_bytes_max', "Maior fila de saída (bytes)",
+                  lambda: self.metricas_filas()['bytes_pendentes_max'])
+        m.medidor('jogo_fila_saida_quadros', "Quadros esperando nas filas de saída",
+                  lambda: self.metricas_filas()['quadros_pendentes'])
+        m.medidor('jogo_espectadores', "Conexões assistindo partidas", lambda: len(self.espectadores))
+        m.medidor('jogo_plateia_pendentes', "Atualizações esperando o transmissor da plateia",
+                  lambda: self.transmissor.pendentes())
+        m.medidor('jogo_plateia_coalescidos', "Espectadores lentos que pularam para o estado atual",
+                  lambda: self.transmissor.coalescidos)
+        m.medidor('jogo_historico_pendentes', "Registros do histórico esperando gravação",
+                  lambda: self.historico.pendentes() if self.historico else 0)
+        m.medidor('jogo_historico_fsyncs', "fsyncs feitos pelo histórico",
+                  lambda: self.historico.fsyncs if self.historico else 0)
+    
+    def servir_metricas(self, porta):
+        """Endpoint HTTP /metrics (formato texto do Prometheus) em 127.0.0.1:porta"""
+        self.metricas.servir(porta)
+        log.info("Métricas em http://127.0.0.1:%s/metrics", porta)
+    
     def monitorar_conexoes(self):
-        """Monitora heartbeat dos jogadores e remove inativos"""
+        """Monitora heartbeat dos jogadores e remove inativos
+        
+        Cada leitura só atualiza conn.visto; a roda guarda um prazo por conexão e, a cada tick,
+        devolve só os prazos que venceram. Quem mandou algo nesse meio tempo é reagendado
+        para o prazo real. Nada disso pega o lock global. A mesma roda guarda o prazo dos
+        lugares reservados, com a chave ('sessao', token). No mesmo tick, o lobby alarga as
+        faixas de emparelhamento de quem está esperando há tempo e os espectadores sem
+        partida vão para a que estiver em destaque.
+        """
         while self.rodando:#enquanto o servidor estiver rodando 
-            time.sleep(5)
-            with self.lock:#o lock serve para caso tente desconectar 1 jogador e 2 threads façam isso 
-                desconectados = []
-                agora = datetime.now()
-                
-                for conn, dados in list(self.jogadores.items()):
-                    # Se não recebeu ping há mais de 15 segundos, desconecta
-                    if agora - dados['ultimo_ping'] > timedelta(seconds=15):
-                        print(f" Jogador {dados['simbolo']} ({dados['endereco']}) desconectado por timeout")
-                        desconectados.append(conn)
+            time.sleep(self.prazos.resolucao)
+            agora = time.monotonic()
+            self.emparelhar_espera(agora)
+            self.encaminhar_plateia()
+            
+            for conn in self.prazos.avancar(agora):
+                if isinstance(conn, tuple):
+                    self.expirar_sessao(conn[1])
+                    continue
                 
-                for conn in desconectados:
+                with self.lock:
+                    dados = self.jogadores.get(conn) or self.espectadores.get(conn)
+                if dados is None:
+                    # Prazo do handshake (admitir): quem sai tem o prazo cancelado, então esta
+                    # conexão continua aberta sem ter mandado CONECTAR, ASSISTIR ou RETOMAR
+                    self.m_recusadas.inc('sem_handshake')
+                    log.debug("Conexão encerrada: nenhum CONECTAR em %.0fs", self.prazo_handshake())
                     self.remover_jogador(conn)
+                    continue
+                
+                prazo = conn.visto + self.timeout_inatividade
+                if prazo > agora:
+                    self.prazos.agendar(conn, prazo)
+                    continue
+                
+                # Se não recebeu ping dentro do timeout, desconecta
+                self.m_timeouts.inc()
+                log.info("Jogador %s (%s) desconectado por timeout", dados.simbolo, dados.endereco)
+                self.remover_jogador(conn)
     
-    def remover_jogador(self, conn):
-        """Remove um jogador e notifica o outro"""
-        if conn in self.jogadores:
-            simbolo = self.jogadores[conn]['simbolo']
-            del self.jogadores[conn]
-            
-            try:
-                conn.close()
-            except:
-                pass
-            
-            print(f"✗ Jogador {simbolo} removido. Jogadores restantes: {len(self.jogadores)}")
+    def emparelhar_espera(self, agora):
+        """Começa os jogos de quem estava esperando em salas diferentes e passou a se aceitar
+
+        Com bot_sem_oponente, quem continua sozinho no jogo da velha depois do primeiro
+        alargamento joga contra o bot: dois humanos que chegam perto um do outro ainda se
+        encontram, e ninguém espera mais que espera_alargar segundos (mais um tick).
+        """
+        with self.lock:
+            cheias = self.lobby.emparelhar_espera(agora)
+            if self.bot_sem_oponente:
+                cheias += self.lobby.sentar_bots(agora, VARIANTE_PADRAO)
+            if cheias:
+                self.informar_espera()
+        for sala in cheias:
+            with sala.lock:
+                if sala.cheia() and not sala.jogo_ativo:
+                    log_banner.info("%s\n✓✓✓ DOIS JOGADORES NA SALA %s! INICIANDO JOGO ✓✓✓\n%s", "="*50, sala.id, "="*50)
+                    self.iniciar_partida(sala)
+                    self.notificar_inicio(sala)
+                    self.jogar_bot(sala)
+    
+    def remover_jogador(self, conn, definitivo=False):
+        """Remove um jogador e notifica o outro
+        
+        Se a conexão caiu no meio de um jogo (e não foi um SAIR), o lugar fica reservado
+        por tempo_retomada segundos: o oponente é avisado e o jogo só é cancelado se
+        ninguém mandar RETOMAR com o token da sessão até lá.
+        
+        Ordem dos locks: global -> sala. O lock global nunca é pedido com o lock de
+        uma sala na mão, e mensagens só são enviadas com o lock da sala.
+        """
+        with self.lock:
+            dados = self.jogadores.pop(conn, None)
+            self.prazos.cancelar(conn)
+            espectador = self.espectadores.pop(conn, None)
+            if espectador is not None:
+                if espectador.sala is not None:
+                    espectador.sala.espectadores -= 1
+                self.sem_partida.pop(conn, None)
+            if dados is not None:
+                reservar = not definitivo and self.tempo_retomada > 0 and dados.sala.jogo_ativo
+                if reservar:
+                    dados.ausente = True
+                    self.prazos.agendar(('sessao', dados.sessao), time.monotonic() + self.tempo_retomada)
+                else:
+                    self.sessoes.pop(dados.sessao, None)
+        if espectador is not None and espectador.sala is not None:
+            self.transmissor.sair(espectador.sala, conn)
+        self.fechar_conexao(conn)
+        if dados is None:
+            return  # nunca se registrou (ou já foi removido), ou só assistia
+        
+        simbolo = dados.simbolo
+        sala = dados.sala
+        
+        if reservar:
+            log.info("Jogador %s caiu da sala %s: lugar reservado por %.0fs", simbolo, sala.id, self.tempo_retomada)
+            with sala.lock:
+                if dados.ausente:  # um RETOMAR pode ter chegado antes daqui
+                    self.broadcast(sala, {
+                        'tipo': 'OPONENTE_RECONECTANDO',
+                        'mensagem': 'Oponente caiu. Aguardando ele voltar...',
+                        'prazo': self.tempo_retomada
+                    })
+            return
+        
+        log.info("✗ Jogador %s removido da sala %s. Jogadores restantes: %d", simbolo, sala.id, len(self.jogadores))
+        self.liberar_lugar(conn, dados)
+    
+    def fechar_conexao(self, conn):
+        """Derruba o socket e termina a escrita da conexão"""
+        try:
+            # shutdown antes do close: a thread do cliente pode estar presa no recv (ex.: timeout)
+            conn.shutdown(socket.SHUT_RDWR)
+        except:
+            pass
+        try:
+            conn.close()
+        except:
+            pass
+    
+    def liberar_lugar(self, conn, dados):
+        """Tira o jogador da sala; se havia jogo, cancela e avisa quem ficou"""
+        sala = dados.sala
+        with sala.lock:
+            sala.jogadores.pop(conn, None)
+            if all(d.bot for d in sala.jogadores.values()):
+                sala.jogadores.clear()  # bot não fica esperando sozinho
             
             # Se havia jogo ativo, finaliza
-            if self.jogo_ativo:
-                self.jogo_ativo = False
-                print(f"Jogo cancelado - jogador {simbolo} desconectou")
+            if sala.jogo_ativo:
+                log.info("Jogo da sala %s cancelado - jogador %s desconectou", sala.id, dados.simbolo)
+                self.registrar_historico({'e': 'cancelada', 'p': sala.id_partida, 't': time.time()})
                 
                 # Notificar jogador restante
-                self.broadcast({
+                self.broadcast(sala, {
                     'tipo': 'OPONENTE_DESCONECTOU',
                     'mensagem': 'Oponente desconectou. Aguardando novo jogador...'
                 })
                 
                 # Resetar tabuleiro
-                self.tabuleiro = [['' for _ in range(3)] for _ in range(3)]
-                self.turno_atual = 'X'
-    
-    def criar_tabuleiro(self):
-        """Reinicia o tabuleiro"""
-        self.tabuleiro = [['' for _ in range(3)] for _ in range(3)]
-        self.turno_atual = 'X'
-        self.jogo_ativo = True
-        print("\n" + "="*50)
-        print("NOVO JOGO INICIADO!")
-        print("="*50)
-        self.imprimir_tabuleiro()
-    
-    def verificar_casa(self, linha, coluna):
-        """Verifica se a casa está vazia (sem lock - deve ser chamado dentro de lock)"""
-        if 0 <= linha < 3 and 0 <= coluna < 3:
-            return self.tabuleiro[linha][coluna] == ''
-        return False
-    
-    def imprimir_tabuleiro(self):
-        """Imprime o tabuleiro no terminal do servidor"""
-        print("\nTabuleiro atual:")
-        for i, linha in enumerate(self.tabuleiro):
-            linha_str = " | ".join([celula if celula else ' ' for celula in linha])
-            print(f"  {linha_str}")
-            if i < 2:
-                print("  ---------")
-        print()
-    
-    def verificar_ganhador(self):
-        """Verifica se há um ganhador ou empate (sem lock - chamar dentro de lock)"""
-        # Verifica linhas
-        for linha in self.tabuleiro:
-            if linha[0] == linha[1] == linha[2] != '':
-                return linha[0]
-        
-        # Verifica colunas
-        for col in range(3):
-            if self.tabuleiro[0][col] == self.tabuleiro[1][col] == self.tabuleiro[2][col] != '':
-                return self.tabuleiro[0][col]
-        
-        # Verifica diagonais
-        if self.tabuleiro[0][0] == self.tabuleiro[1][1] == self.tabuleiro[2][2] != '':
-            return self.tabuleiro[0][0]
-        
-        if self.tabuleiro[0][2] == self.tabuleiro[1][1] == self.tabuleiro[2][0] != '':
-            return self.tabuleiro[0][2]
-        
-        # Verifica empate
-        if all(self.tabuleiro[i][j] != '' for i in range(3) for j in range(3)):
-            return 'EMPATE'
-        
-        return None
+                sala.resetar()
+        
+        # Só depois do cancelamento a sala volta a receber jogadores
+        with self.lock:
+            with sala.lock:
+                # Quem ficou também caiu e espera RETOMAR: sem jogo não há o que retomar, e a
+                # sala não pode voltar para a espera com um fantasma na vez (RETOMAR vê o lock global)
+                fantasmas = list(sala.jogadores.values())
+                if fantasmas and all(d.ausente for d in fantasmas):
+                    sala.jogadores.clear()
+                else:
+                    fantasmas = []
+            for fantasma in fantasmas:
+                self.prazos.cancelar(('sessao', fantasma.sessao))
+                if self.sessoes.pop(fantasma.sessao, None) is not None:
+                    self.m_sessoes.inc('expirada')
+            self.lobby.liberar(sala)
+            self.informar_espera()
+            encerrada = sala.id not in self.lobby.salas
+        if encerrada and sala.espectadores:
+            # A plateia fica sem partida: o cliente escolhe outra (ou volta ao destaque)
+            with sala.lock:
+                self.transmissor.publicar(sala, {'tipo': 'SALA_ENCERRADA', 'sala': sala.id})
+    
+    def expirar_sessao(self, token):
+        """Acabou o tempo de um lugar reservado: o jogo é cancelado como numa queda comum"""
+        with self.lock:
+            dados = self.sessoes.get(token)
+            if dados is None or not dados.ausente:
+                return  # retomada a tempo
+            del self.sessoes[token]
+        self.m_sessoes.inc('expirada')
+        log.info("Jogador %s não voltou para a sala %s a tempo", dados.simbolo, dados.sala.id)
+        # A sala ainda guarda o jogador pela conexão antiga (já fechada)
+        self.liberar_lugar(dados.conn, dados)
+    
+    def processar_retomada(self, conn, token, versao=1, codec='json'):
+        """RETOMAR: a conexão nova assume o lugar da sessão, com símbolo, tabuleiro e turno
+        
+        Também vale quando a conexão antiga ainda não caiu do lado do servidor (ex.: o
+        celular trocou de rede): ela é derrubada e o lugar passa para a nova.
+        """
+        with self.lock:
+            dados = self.sessoes.get(token)
+            if dados is None or conn in self.jogadores:
+                return {'tipo': 'ERRO', 'mensagem': 'Sessão expirada'}
+            antiga = dados.conn
+            if self.jogadores.pop(antiga, None) is not None:
+                self.prazos.cancelar(antiga)
+            self.prazos.cancelar(('sessao', token))
+            dados.conn = conn
+            dados.ausente = False
+            dados.versao = min(int(versao), VERSAO_PROTOCOLO)
+            self.jogadores[conn] = dados
+            self.prazos.agendar(conn, time.monotonic() + self.timeout_inatividade)
+            sala = dados.sala
+        
+        if antiga is not conn:
+            self.fechar_conexao(antiga)  # o handle_cliente dela não acha mais o jogador: só fecha
+        self.m_sessoes.inc('retomada')
+        log.info("↺ Jogador %s (%s) voltou para a sala %s", dados.simbolo, dados.endereco, sala.id)
+        
+        with sala.lock:
+            sala.jogadores.pop(antiga, None)
+            sala.jogadores[conn] = dados
+            self.responder_conectado(conn, dados, sala, codec)
+            for c in sala.jogadores:
+                if c is not conn:
+                    self.enviar_mensagem(c, {'tipo': 'OPONENTE_VOLTOU'})
     
     def processar_mensagem(self, mensagem, conn):
         """Processa mensagens recebidas dos clientes"""
@@ -128,122 +455,291 @@ class ServidorJogoDaVelha:
             tipo = mensagem.get('tipo')
             
             if tipo == 'PING':
-                with self.lock: # ta lockando pois ja tem threads que mexem com jogadores 
-                    if conn in self.jogadores:
-                        self.jogadores[conn]['ultimo_ping'] = datetime.now()
+                # Sem lock: leitura e atribuição em dict são atômicas, e o ping não disputa com
+                # jogadas. A vivacidade já foi marcada na leitura (conn.visto)
+                rtt = mensagem.get('rtt_ms')
+                dados = self.jogadores.get(conn) if rtt is not None else None
+                if dados is not None and isinstance(rtt, (int, float)):
+                    # Média móvel do RTT que o cliente mediu no PING/PONG anterior
+                    anterior = dados.rtt_ms
+                    dados.rtt_ms = rtt if anterior is None else 0.8 * anterior + 0.2 * rtt
                 return {'tipo': 'PONG'}
             
             elif tipo == 'CONECTAR':
-                return self.processar_conexao(conn, mensagem.get('endereco'))
+                return self.processar_conexao(conn, mensagem.get('endereco'), mensagem.get('versao', 1),
+                                              mensagem.get('codec', 'json'), mensagem.get('partida'),
+                                              mensagem.get('rating'), mensagem.get('rtt_ms'),
+                                              mensagem.get('oponente') == 'bot',
+                                              mensagem.get('variante', VARIANTE_PADRAO))
+            
+            elif tipo == 'RETOMAR':
+                return self.processar_retomada(conn, mensagem.get('sessao'), mensagem.get('versao', 1),
+                                               mensagem.get('codec', 'json'))
+            
+            elif tipo == 'ASSISTIR':
+                return self.processar_assistir(conn, mensagem.get('sala'), mensagem.get('endereco'),
+                                               mensagem.get('codec', 'json'))
+            
+            elif tipo == 'SAIR':
+                # Saída de propósito: o lugar não fica reservado
+                self.remover_jogador(conn, definitivo=True)
             
             elif tipo == 'JOGADA':
                 return self.processar_jogada(mensagem, conn)
             
             elif tipo == 'REINICIAR':
-                with self.lock:
-                    if len(self.jogadores) == 2:
-                        self.criar_tabuleiro()
-                        resposta = {
-                            'tipo': 'REINICIO',
-                            'tabuleiro': self.tabuleiro,
-                            'turno_atual': self.turno_atual
-                        }
-                        # Notificar todos
-                        self.broadcast(resposta)
-                        return resposta
-                    else:
+                dados = self.jogadores.get(conn)
+                if dados is None:
+                    return {'tipo': 'ERRO', 'mensagem': 'Aguarde outro jogador'}
+                sala = dados.sala
+                with sala.lock:
+                    if not sala.cheia() or any(d.ausente for d in sala.jogadores.values()):
                         return {'tipo': 'ERRO', 'mensagem': 'Aguarde outro jogador'}
+                    self.iniciar_partida(sala)
+                    # Notificar todos (inclusive quem pediu) dentro do lock da sala, para manter a ordem
+                    self.broadcast(sala, {
+                        'tipo': 'REINICIO',
+                        'tabuleiro': sala.tabuleiro,
+                        'turno_atual': sala.turno_atual,
+                        'seq': sala.seq
+                    })
+                    self.jogar_bot(sala)
+            
+            elif tipo == 'SINCRONIZAR':
+                return self.processar_sincronizacao(conn)
+            
+            elif tipo == 'DICA':
+                return self.processar_dica(conn)
             
         except Exception as e:
-            print(f"Erro ao processar mensagem: {e}")
-            import traceback
-            traceback.print_exc()
+            log.exception("Erro ao processar mensagem: %s", e)
             return {'tipo': 'ERRO', 'mensagem': str(e)}
     
-    def processar_conexao(self, conn, endereco):
-        """Processa a conexão de um novo jogador"""
+    def processar_conexao(self, conn, endereco, versao=1, codec='json', partida=None, rating=None, rtt_ms=None,
+                          contra_bot=False, variante=VARIANTE_PADRAO):
+        """Processa a conexão de um novo jogador
+        
+        'partida' é um token combinado entre os dois jogadores: quem manda o mesmo
+        token cai na mesma sala (e, no modo multiprocesso, no mesmo processo). Sem token,
+        o lobby procura um oponente pelo 'rating' e pelo RTT que o cliente informou (com
+        bot_sem_oponente, quem continua sozinho depois de um alargamento ganha um bot,
+        ver emparelhar_espera).
+        'variante' escolhe o tabuleiro (VARIANTES); o bot só joga o jogo da velha.
+        """
+        if variante not in VARIANTES:
+            return {'tipo': 'ERRO', 'mensagem': f'Variante desconhecida: {variante}'}
+        if contra_bot and variante != VARIANTE_PADRAO:
+            return {'tipo': 'ERRO', 'mensagem': 'O bot só joga o jogo da velha 3x3'}
+        with self.lock:
+            if conn in self.espectadores:
+                return {'tipo': 'ERRO', 'mensagem': 'Esta conexão está assistindo uma partida'}
+            dados = self.jogadores.get(conn)
+            novo = dados is None
+            if not novo:
+                # Essa conexão já está registrada: só responde de novo
+                log.debug("Jogador %s já conectado", endereco)
+            else:
+                # Registrar novo jogador numa sala aberta (ou numa sala nova)
+                dados = Jogador(conn, endereco, f'{self.indice}.{secrets.token_hex(16)}',
+                                min(int(versao), VERSAO_PROTOCOLO), variante)
+                if isinstance(rating, (int, float)):
+                    dados.rating = rating
+                if isinstance(rtt_ms, (int, float)):
+                    dados.rtt_ms = rtt_ms
+                sala = self.lobby.alocar(conn, dados, partida, contra_bot)
+                self.jogadores[conn] = dados
+                self.sessoes[dados.sessao] = dados
+                self.prazos.agendar(conn, time.monotonic() + self.timeout_inatividade)
+                log.info("✓ Jogador %s (%s) registrado na sala %s. Total na sala: %d/2",
+                         dados.simbolo, endereco, sala.id, len(sala.jogadores))
+            sala = dados.sala
+        
+        # Entre soltar o lock global e pegar o da sala, o monitor pode ter mudado o jogador
+        # de sala (Lobby.emparelhar_espera): confere de novo com o lock na mão
+        while True:
+            with sala.lock:
+                if dados.sala is sala:
+                    return self.concluir_conexao(conn, dados, sala, novo, codec)
+            sala = dados.sala
+    
+    def concluir_conexao(self, conn, dados, sala, novo, codec):
+        """CONECTADO para o jogador e início do jogo se a sala encheu (chamar dentro do lock da sala)"""
+        if conn not in sala.jogadores:
+            return {'tipo': 'ERRO', 'mensagem': 'Conexão encerrada'}
+        
+        # Se agora temos 2 jogadores, iniciar o jogo
+        iniciar = novo and sala.cheia() and not sala.jogo_ativo
+        if iniciar:
+            log_banner.info("%s\n✓✓✓ DOIS JOGADORES NA SALA %s! INICIANDO JOGO ✓✓✓\n%s", "="*50, sala.id, "="*50)
+            self.iniciar_partida(sala)
+        
+        # Respostas saem dentro do lock da sala para não cruzarem com jogadas
+        self.responder_conectado(conn, dados, sala, codec)
+        
+        if iniciar:
+            # Notificar o outro jogador
+            self.notificar_inicio(sala, exceto=conn)
+            self.jogar_bot(sala)
+    
+    def processar_assistir(self, conn, id_sala=None, endereco=None, codec='json'):
+        """ASSISTIR: entra na plateia de uma sala (sem 'sala', da partida em destaque)
+        
+        A resposta ASSISTINDO é o snapshot da sala; ela entra na fila do transmissor dentro
+        do lock da sala, então as atualizações seguintes vêm na ordem certa depois dela.
+        Mandar ASSISTIR de novo troca de sala. Sem partida em destaque, o espectador recebe
+        um ASSISTINDO sem sala e espera a próxima (encaminhar_plateia).
+        """
         with self.lock:
-            print(f"\n>>> Processando conexão de {endereco}")
-            print(f">>> Jogadores atuais: {len(self.jogadores)}")
-            print(f">>> Conexão já registrada? {conn in self.jogadores}")
-            
-            # Se essa conexão já está registrada, apenas atualizar
             if conn in self.jogadores:
-                print(f">>> Jogador já conectado, atualizando ping")
-                self.jogadores[conn]['ultimo_ping'] = datetime.now()
-                return {
-                    'tipo': 'CONECTADO',
-                    'simbolo': self.jogadores[conn]['simbolo'],
-                    'jogadores': len(self.jogadores),
-                    'jogo_iniciado': self.jogo_ativo,
-                    'tabuleiro': self.tabuleiro,
-                    'turno_atual': self.turno_atual
-                }
-            
-            # Verificar se a sala está cheia
-            if len(self.jogadores) >= 2:
-                print(f">>> SALA CHEIA! Rejeitando nova conexão")
-                return {'tipo': 'ERRO', 'mensagem': 'Sala cheia'}
-            
-            # Registrar novo jogador
-            simbolo = 'X' if len(self.jogadores) == 0 else 'O'
-            self.jogadores[conn] = {
-                'simbolo': simbolo,
-                'ultimo_ping': datetime.now(),
-                'endereco': endereco
-            }
-            print(f">>> ✓ Jogador {simbolo} registrado! Total: {len(self.jogadores)}/2")
-            
-            resposta = {
-                'tipo': 'CONECTADO',
-                'simbolo': simbolo,
-                'jogadores': len(self.jogadores),
-                'jogo_iniciado': False,
-                'tabuleiro': self.tabuleiro,
-                'turno_atual': self.turno_atual
-            }
-            
-            # Se agora temos 2 jogadores, iniciar o jogo
-            if len(self.jogadores) == 2:
-                print("\n" + "="*50)
-                print("✓✓✓ DOIS JOGADORES CONECTADOS! INICIANDO JOGO ✓✓✓")
-                print("="*50 + "\n")
-                self.criar_tabuleiro()
-                
-                # Atualizar resposta
-                resposta['jogo_iniciado'] = True
-                resposta['tabuleiro'] = self.tabuleiro
-                resposta['turno_atual'] = self.turno_atual
-                
-                # Notificar o outro jogador
-                for c, dados in self.jogadores.items():
-                    if c != conn:
-                        notificacao = {
-                            'tipo': 'JOGO_INICIADO',
-                            'simbolo': dados['simbolo'],
-                            'jogadores': 2,
-                            'jogo_iniciado': True,
-                            'tabuleiro': self.tabuleiro,
-                            'turno_atual': self.turno_atual
-                        }
-                        print(f">>> Notificando jogador {dados['simbolo']} que o jogo começou")
-                        self.enviar_mensagem(c, notificacao)
-            
-            return resposta
+                return {'tipo': 'ERRO', 'mensagem': 'Jogadores não podem assistir'}
+            sala = self.lobby.salas.get(id_sala) if id_sala is not None else self.lobby.destaque()
+            if sala is None and id_sala is not None:
+                return {'tipo': 'ERRO', 'mensagem': 'Sala não encontrada'}
+            dados = self.espectadores.get(conn)
+            primeira = dados is None
+            if primeira:
+                dados = Espectador(conn, endereco)
+                self.espectadores[conn] = dados
+                self.prazos.agendar(conn, time.monotonic() + self.timeout_inatividade)
+            anterior = dados.sala
+            if anterior is not None:
+                anterior.espectadores -= 1
+            else:
+                self.sem_partida.pop(conn, None)
+            dados.sala = sala
+            if sala is not None:
+                sala.espectadores += 1
+            else:
+                self.sem_partida[conn] = None
+        
+        if anterior is not None:
+            self.transmissor.sair(anterior, conn)
+        log.debug("Espectador %s assistindo a sala %s", endereco, sala.id if sala else None)
+        
+        # Codec só muda na primeira vez: trocando de sala, ainda pode haver atualizações da antiga no caminho
+        novo_codec = CODECS.get(codec, conn.codec) if primeira else conn.codec
+        resposta = {
+            'tipo': 'ASSISTINDO',
+            'sala': None,
+            'jogadores': 0,
+            'jogo_iniciado': False,
+            'tabuleiro': Tabuleiro().para_lista(),
+            'turno_atual': 'X',
+            'seq': 0,
+            'variante': VARIANTE_PADRAO,
+            'codec': novo_codec.nome,
+            'intervalo_ping': self.intervalo_ping,
+            'ping_curto': True
+        }
+        if sala is None:
+            self.transmissor.entrar(None, conn, conn.codec.codificar(resposta))
+            conn.codec = novo_codec
+            return
+        with sala.lock:
+            resposta.update(sala=sala.id, jogadores=len(sala.jogadores), jogo_iniciado=sala.jogo_ativo,
+                            tabuleiro=sala.tabuleiro, turno_atual=sala.turno_atual, seq=sala.seq,
+                            variante=sala.variante)
+            self.transmissor.entrar(sala, conn, conn.codec.codificar(resposta))
+            conn.codec = novo_codec
     
-    def processar_jogada(self, mensagem, conn):
-        """Processa uma jogada do cliente - TODA A LÓGICA DENTRO DO LOCK"""
+    def encaminhar_plateia(self):
+        """Espectadores sem partida vão para a partida em destaque, se já houver uma"""
+        if not self.sem_partida:
+            return
         with self.lock:
+            if self.lobby.destaque() is None:
+                return
+            conexoes = list(self.sem_partida)
+        for conn in conexoes:
+            self.processar_assistir(conn)
+    
+    def iniciar_partida(self, sala):
+        """Tabuleiro novo e registro de início no histórico (chamar dentro do lock da sala)"""
+        if sala.jogo_ativo:
+            # REINICIAR no meio do jogo: a partida anterior termina cancelada, senão fica aberta no histórico
+            self.registrar_historico({'e': 'cancelada', 'p': sala.id_partida, 't': time.time()})
+        sala.criar_tabuleiro()
+        if self.historico is not None:
+            jogadores = {d.simbolo: 'bot' if d.bot else d.endereco for d in sala.jogadores.values()}
+            registro = {'e': 'inicio', 'p': sala.id_partida, 't': time.time(),
+                        'x': jogadores.get('X'), 'o': jogadores.get('O')}
+            if sala.variante != VARIANTE_PADRAO:
+                registro['v'] = sala.variante
+            self.historico.registrar(registro)
+    
+    def registrar_historico(self, registro):
+        if self.historico is not None:
+            self.historico.registrar(registro)
+    
+    def notificar_inicio(self, sala, exceto=None):
+        """JOGO_INICIADO para os jogadores da sala e o estado novo para a plateia (chamar dentro do lock da sala)"""
+        if sala.espectadores:
+            self.transmissor.publicar(sala, self.estado_sala(sala))  # o próprio snapshot serve de coalescido
+        for c, dados in sala.jogadores.items():
+            if c is not exceto:
+                self.enviar_mensagem(c, {
+                    'tipo': 'JOGO_INICIADO',
+                    'simbolo': dados.simbolo,
+                    'sala': sala.id,
+                    'jogadores': len(sala.jogadores),
+                    'jogo_iniciado': True,
+                    'tabuleiro': sala.tabuleiro,
+                    'turno_atual': sala.turno_atual,
+                    'seq': sala.seq
+                })
+    
+    def responder_conectado(self, conn, dados, sala, codec):
+        """Manda o CONECTADO (também a resposta do RETOMAR) e troca o codec (chamar dentro do lock da sala)"""
+        # Codec desconhecido: continua em JSON, e o CONECTADO avisa qual ficou valendo
+        novo_codec = CODECS.get(codec, conn.codec)
+        self.enviar_mensagem(conn, {
+            'tipo': 'CONECTADO',
+            'simbolo': dados.simbolo,
+            'sala': sala.id,
+            'jogadores': len(sala.jogadores),
+            'jogo_iniciado': sala.jogo_ativo,
+            'tabuleiro': sala.tabuleiro,
+            'turno_atual': sala.turno_atual,
+            'seq': sala.seq,
+            'variante': sala.variante,
+            'versao': dados.versao,
+            'codec': novo_codec.nome,
+            'intervalo_ping': self.intervalo_ping,
+            'ping_curto': True,
+            'sessao': dados.sessao
+        })
+        # O CONECTADO sai no codec antigo; daqui em diante, nos dois sentidos, vale o novo
+        conn.codec = novo_codec
+    
+    def processar_jogada(self, mensagem, conn):
+        """Processa uma jogada do cliente; o ERRO leva o 'seq' da jogada, se ela veio com um
+        
+        O cliente que aplica a jogada antes da resposta (previsão) manda em 'seq' o número que
+        ela vai ter; com o seq de volta no ERRO, ele sabe qual jogada desfazer.
+        """
+        resposta = self.executar_jogada(mensagem, conn)
+        if resposta is not None and 'seq' in mensagem:
+            resposta['seq'] = mensagem['seq']
+        return resposta
+    
+    def executar_jogada(self, mensagem, conn):
+        """Valida e aplica a jogada - TODA A LÓGICA DENTRO DO LOCK DA SALA"""
+        dados = self.jogadores.get(conn)
+        if dados is None:
+            return {'tipo': 'ERRO', 'mensagem': 'Você não está registrado'}
+        
+        sala = dados.sala
+        with sala.lock:
             # Verificações de estado
-            if not self.jogo_ativo:
-                return {'tipo': 'ERRO', 'mensagem': 'Aguarde outro jogador'}
-            
-            if conn not in self.jogadores:
+            if conn not in sala.jogadores:
                 return {'tipo': 'ERRO', 'mensagem': 'Você não está registrado'}
             
-            simbolo_jogador = self.jogadores[conn]['simbolo']
+            if not sala.jogo_ativo:
+                return {'tipo': 'ERRO', 'mensagem': 'Aguarde outro jogador'}
+            
+            simbolo_jogador = dados.simbolo
             
-            if simbolo_jogador != self.turno_atual:
+            if simbolo_jogador != sala.turno_atual:
                 return {'tipo': 'ERRO', 'mensagem': 'Não é seu turno'}
             
             linha = mensagem.get('linha')
@@ -252,142 +748,605 @@ class ServidorJogoDaVelha:
             if linha is None or coluna is None:
                 return {'tipo': 'ERRO', 'mensagem': 'Jogada inválida'}
             
+            # Jogada feita sobre um estado velho (ex.: prevista antes de um REINICIO cruzar com ela)
+            seq = mensagem.get('seq')
+            if seq is not None and seq != sala.seq + 1:
+                return {'tipo': 'ERRO', 'mensagem': 'Jogada fora de sequência'}
+            
             # Verificar se casa está vazia
-            if not self.verificar_casa(linha, coluna):
+            if not sala.verificar_casa(linha, coluna):
                 return {'tipo': 'ERRO', 'mensagem': 'Casa ocupada'}
             
-            # Fazer jogada
-            self.tabuleiro[linha][coluna] = simbolo_jogador
-            print(f"Jogada: {simbolo_jogador} na posição ({linha}, {coluna})")
-            self.imprimir_tabuleiro()
-            
-            # Atualizar ping
-            self.jogadores[conn]['ultimo_ping'] = datetime.now()
-            
-            # Verificar fim de jogo
-            ganhador = self.verificar_ganhador()
-            
+            self.aplicar_jogada(sala, simbolo_jogador, linha, coluna)
+            self.jogar_bot(sala)
+            return None
+    
+    def aplicar_jogada(self, sala, simbolo_jogador, linha, coluna):
+        """Aplica uma jogada já validada e avisa a sala (chamar dentro do lock da sala)"""
+        # Fazer jogada (já devolve o resultado olhando só as linhas da casa jogada)
+        ganhador = sala.jogar(linha, coluna, simbolo_jogador)
+        log_mensagens.debug("Jogada na sala %s: %s na posição (%s, %s)", sala.id, simbolo_jogador, linha, coluna)
+        sala.imprimir_tabuleiro()
+        if self.historico is not None:
+            self.historico.registrar({'e': 'jogada', 'p': sala.id_partida, 'n': sala.seq, 's': simbolo_jogador,
+                                      'c': linha * sala.estado.tamanho + coluna})
             if ganhador:
-                self.jogo_ativo = False
-                print(f"\n{'='*50}")
-                print(f"JOGO FINALIZADO! Resultado: {ganhador}")
-                print(f"{'='*50}\n")
-                
-                resposta = {
-                    'tipo': 'FIM_JOGO',
-                    'tabuleiro': self.tabuleiro,
-                    'ganhador': ganhador
-                }
-                
-                # Notificar todos
-                self.broadcast(resposta)
-                return resposta
-            
-            # Alternar turno
-            self.turno_atual = 'O' if self.turno_atual == 'X' else 'X'
-            
-            resposta = {
-                'tipo': 'JOGADA_OK',
-                'tabuleiro': self.tabuleiro,
-                'proximo_turno': self.turno_atual
-            }
+                self.historico.registrar({'e': 'fim', 'p': sala.id_partida, 'g': ganhador, 't': time.time()})
+        
+        # Verificar fim de jogo
+        if ganhador:
+            sala.jogo_ativo = False
+            log_banner.info("%s\nJOGO DA SALA %s FINALIZADO! Resultado: %s\n%s", "="*50, sala.id, ganhador, "="*50)
             
-            # Notificar todos
-            self.broadcast(resposta)
-            return resposta
+            # Notificar todos (inclusive quem jogou) dentro do lock da sala, para manter a ordem.
+            # A forma completa só é montada (dentro do broadcast, ainda no lock) se um cliente v1 precisar
+            self.broadcast(sala, lambda: {
+                'tipo': 'FIM_JOGO',
+                'tabuleiro': sala.tabuleiro,
+                'ganhador': ganhador
+            }, delta={
+                'tipo': 'FIM_JOGO',
+                'linha': linha,
+                'coluna': coluna,
+                'simbolo': simbolo_jogador,
+                'seq': sala.seq,
+                'ganhador': ganhador
+            })
+            return
+        
+        # Alternar turno
+        sala.turno_atual = 'O' if sala.turno_atual == 'X' else 'X'
+        
+        # Notificar todos (inclusive quem jogou) dentro do lock da sala, para manter a ordem
+        self.broadcast(sala, lambda: {
+            'tipo': 'JOGADA_OK',
+            'tabuleiro': sala.tabuleiro,
+            'proximo_turno': sala.turno_atual
+        }, delta={
+            'tipo': 'JOGADA_OK',
+            'linha': linha,
+            'coluna': coluna,
+            'simbolo': simbolo_jogador,
+            'seq': sala.seq,
+            'proximo_turno': sala.turno_atual
+        })
+    
+    def jogar_bot(self, sala):
+        """Se a vez é de um bot da sala, joga por ele a jogada da tabela (chamar dentro do lock da sala)"""
+        if not sala.jogo_ativo:
+            return
+        for dados in sala.jogadores.values():
+            if dados.bot and dados.simbolo == sala.turno_atual:
+                casa = self.tabela.jogada(sala.estado.x, sala.estado.o)
+                self.aplicar_jogada(sala, dados.simbolo, casa // 3, casa % 3)
+                return
+    
+    def processar_dica(self, conn):
+        """DICA: a melhor jogada da posição atual e como o jogo termina se os dois jogarem perfeito"""
+        dados = self.jogadores.get(conn)
+        if dados is None:
+            return {'tipo': 'ERRO', 'mensagem': 'Você não está registrado'}
+        
+        sala = dados.sala
+        with sala.lock:
+            if not sala.jogo_ativo:
+                return {'tipo': 'ERRO', 'mensagem': 'Aguarde outro jogador'}
+            if dados.simbolo != sala.turno_atual:
+                return {'tipo': 'ERRO', 'mensagem': 'Não é seu turno'}
+            if sala.variante != VARIANTE_PADRAO:
+                return {'tipo': 'ERRO', 'mensagem': 'Dica só no jogo da velha 3x3'}
+            x, o = sala.estado.x, sala.estado.o
+        casa = self.tabela.jogada(x, o)
+        return {'tipo': 'DICA', 'linha': casa // 3, 'coluna': casa % 3, 'resultado': self.tabela.resultado(x, o)}
+    
+    def processar_sincronizacao(self, conn):
+        """Reenvia o estado completo da sala (cliente v2 detectou buraco na sequência)"""
+        dados = self.jogadores.get(conn)
+        if dados is None:
+            return {'tipo': 'ERRO', 'mensagem': 'Você não está registrado'}
+        
+        sala = dados.sala
+        with sala.lock:
+            self.enviar_mensagem(conn, self.estado_sala(sala))
+    
+    def estado_sala(self, sala):
+        """Snapshot ESTADO da sala (chamar dentro do lock da sala)"""
+        return {
+            'tipo': 'ESTADO',
+            'jogo_iniciado': sala.jogo_ativo,
+            'tabuleiro': sala.tabuleiro,
+            'turno_atual': sala.turno_atual,
+            'seq': sala.seq
+        }
+    
+    def estado_adiado(self, sala):
+        """estado_sala para montar depois (chamar dentro do lock da sala)
+        
+        Guarda agora só os inteiros do tabuleiro, o turno e o seq; a lista N x N só é montada
+        se a função for chamada (um espectador lento, no transmissor), fora do lock da sala.
+        """
+        x, o, tamanho = sala.estado.x, sala.estado.o, sala.estado.tamanho
+        jogo_ativo, turno, seq = sala.jogo_ativo, sala.turno_atual, sala.seq
+        return lambda: {
+            'tipo': 'ESTADO',
+            'jogo_iniciado': jogo_ativo,
+            'tabuleiro': mascaras_para_lista(x, o, tamanho),
+            'turno_atual': turno,
+            'seq': seq
+        }
+    
+    def enviar_mensagem(self, conn, mensagem, completa=None, quadro=None):
+        """Coloca a mensagem na fila de saída do cliente (não espera o socket)
+        
+        'completa' é a versão com o tabuleiro inteiro quando 'mensagem' é um delta (ou a
+        função que a monta); a política 'coalescer' usa ela no lugar do delta. 'quadro' é a mensagem já
+        codificada no codec da conexão (broadcast codifica uma vez para vários).
+        """
+        if isinstance(conn, AssentoBot):
+            return  # o bot lê o estado direto da sala
+        if conn.enfileirar(quadro if quadro is not None else conn.codec.codificar(mensagem)):
+            return
+        
+        # Fila cheia: o cliente não está dando conta de ler
+        politica = self.politica_fila
+        dados = self.jogadores.get(conn)
+        if politica == 'coalescer' and (dados is None or dados.versao < 2):
+            politica = 'desconectar'  # cliente v1 não entende ESTADO
+        
+        self.m_transbordos.inc(politica)
+        
+        if politica == 'coalescer':
+            # O que estava na fila fica velho: vai só o estado atual e a mensagem completa.
+            # broadcast chega aqui com o lock da sala (o snapshot já inclui esta mudança), mas a
+            # resposta de um pedido (responder) não: o lock é reentrante, então pega sempre
+            with dados.sala.lock:
+                estado = self.estado_sala(dados.sala)
+            if callable(completa):
+                completa = completa()
+            conn.fila.substituir([conn.codec.codificar(estado), conn.codec.codificar(completa or mensagem)])
+        elif politica == 'desconectar':
+            log.warning("Fila de saída cheia (%d bytes): desconectando cliente lento", conn.fila.bytes)
+            # Pode estar dentro do lock da sala: só derruba o socket, quem lê remove o jogador
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except:
+                pass
+        # 'descartar': a mensagem nova se perde; cliente v2 percebe o buraco no seq e pede SINCRONIZAR
+    
+    def metricas_filas(self):
+        """Profundidade das filas de saída e contadores de transbordo"""
+        conexoes = list(self.jogadores)
+        quadros = [len(conn.fila) for conn in conexoes]
+        tamanhos = [conn.fila.bytes for conn in conexoes]
+        transbordos = {politica: self.m_transbordos.valores.get((politica,), 0) for politica in POLITICAS_FILA}
+        metricas = {
+            'transbordos': sum(transbordos.values()),
+            'descartadas': transbordos['descartar'],
+            'coalescidas': transbordos['coalescer'],
+            'desconectadas': transbordos['desconectar'],
+        }
+        metricas.update({
+            'conexoes': len(conexoes),
+            'quadros_pendentes': sum(quadros),
+            'quadros_pendentes_max': max(quadros, default=0),
+            'bytes_pendentes': sum(tamanhos),
+            'bytes_pendentes_max': max(tamanhos, default=0),
+        })
+        return metricas
+    
+    def broadcast(self, sala, mensagem, delta=None):
+        """Envia mensagem para os jogadores e a plateia de uma sala (chamar dentro do lock da sala)
+        
+        Se houver delta, clientes que negociaram a versão 2 (e a plateia) recebem ele no
+        lugar da mensagem completa. Cada forma da mensagem é codificada uma vez por codec.
+        Com delta, 'mensagem' pode ser uma função: a forma completa (o tabuleiro N x N) só é
+        montada se um cliente v1 ou uma fila cheia (coalescer) precisar dela.
+        """
+        completa = None
+        
+        def montar_completa():
+            nonlocal completa
+            if completa is None:
+                completa = mensagem() if callable(mensagem) else mensagem
+            return completa
+        
+        quadros = {}  # {(codec, é delta): bytes}
+        for conn, dados in list(sala.jogadores.items()):
+            if isinstance(conn, AssentoBot):
+                continue
+            usa_delta = delta is not None and dados.versao >= 2
+            chave = (conn.codec, usa_delta)
+            quadro = quadros.get(chave)
+            if quadro is None:
+                quadro = quadros[chave] = conn.codec.codificar(delta if usa_delta else montar_completa())
+            if usa_delta:
+                self.enviar_mensagem(conn, delta, completa=montar_completa, quadro=quadro)
+            else:
+                self.enviar_mensagem(conn, montar_completa(), quadro=quadro)
+        if sala.espectadores:
+            self.transmissor.publicar(sala, montar_completa() if delta is None else delta, self.estado_adiado(sala))
+    
+    def processar_quadro(self, quadro, conn, addr):
+        """Decodifica um quadro no codec da conexão, processa e responde ao cliente"""
+        mensagem = self.decodificar_quadro(quadro, conn)
+        if mensagem is not None:
+            self.responder(mensagem, conn, addr)
     
-    def enviar_mensagem(self, conn, mensagem):
-        """Envia mensagem para um cliente específico"""
+    def decodificar_quadro(self, quadro, conn):
+        """Mensagem do quadro no codec da conexão; None se vazio ou inválido (que vai para o log)"""
         try:
-            dados = json.dumps(mensagem) + '\n'
-            conn.sendall(dados.encode())
-        except Exception as e:
-            print(f"Erro ao enviar mensagem: {e}")
-            with self.lock:
-                if conn in self.jogadores:
-                    self.remover_jogador(conn)
+            return conn.codec.decodificar(quadro)
+        except (ValueError, struct.error) as e:
+            log.warning("Erro ao decodificar mensagem (%s): %s - quadro recebido: %r", conn.codec.nome, e, bytes(quadro))
+            return None
+    
+    def responder(self, mensagem, conn, addr):
+        """Processa uma mensagem decodificada e coloca a resposta na fila do cliente"""
+        tipo = mensagem.get('tipo')
+        
+        if tipo != 'PING':  # Não logar PING para não poluir
+            log_mensagens.debug("← Recebido de %s: %s", addr, tipo)
+        
+        rotulo = tipo if tipo in TIPOS_CLIENTE else 'outro'
+        limitador = conn.limitador
+        if limitador is not None and not limitador.permitir(tipo, conn.visto):
+            erro = None
+            if tipo != 'PING':
+                erro = {'tipo': 'ERRO', 'mensagem': 'Mensagens demais'}
+                if 'seq' in mensagem:
+                    erro['seq'] = mensagem['seq']  # o cliente desfaz a jogada prevista
+            self.limitar(conn, addr, rotulo, erro)
+            return
+        
+        inicio = time.perf_counter()
+        resposta = self.processar_mensagem(mensagem, conn)
+        self.m_processamento.observar(time.perf_counter() - inicio, rotulo)
+        self.m_mensagens.inc(rotulo)
+        
+        if resposta:
+            if resposta.get('tipo') != 'PONG':
+                log_mensagens.debug("→ Enviando para %s: %s", addr, resposta.get('tipo'))
+            self.enviar_mensagem(conn, resposta)
     
-    def broadcast(self, mensagem):
-        """Envia mensagem para todos os jogadores"""
+    def conexao_entregue(self):
+        """Trabalhador: o primeiro quadro de uma conexão recebida pelo canal já foi processado"""
         with self.lock:
-            jogadores_copia = list(self.jogadores.keys())
+            self.entregues += 1
+            self.informar_espera()
+    
+    def informar_espera(self):
+        """Trabalhador: diz ao processo principal quem está esperando oponente sem token (com o lock global)
         
-        for conn in jogadores_copia:
-            self.enviar_mensagem(conn, mensagem)
+        'espera' são as chaves (variante, faixa de rating) das salas na espera. Vai junto
+        quantas conexões entregues já foram processadas: o principal só acredita num aviso
+        que já leva em conta todas as conexões que ele mandou para cá.
+        """
+        if self.canal is None:
+            return
+        aviso = {'entregues': self.entregues, 'espera': list(self.lobby.espera.chaves())}
+        try:
+            self.canal.send(CODEC_JSON.codificar(aviso))
+        except OSError:
+            pass  # processo principal saindo
     
-    def handle_cliente(self, conn, addr):
-        """Gerencia a comunicação com um cliente"""
-        print(f"\n{'='*50}")
-        print(f"NOVA CONEXÃO TCP ACEITA de {addr}")
-        print(f"{'='*50}\n")
-        buffer = ""
+    def lotado(self):
+        return bool(self.max_conexoes) and self.m_conexoes.valor >= self.max_conexoes
+    
+    def prazo_handshake(self):
+        return min(PRAZO_CONECTAR, self.timeout_inatividade)
+    
+    def admitir(self, conn):
+        """Conta a conexão nova, agenda o prazo do handshake e dá a ela os baldes de fichas
+        
+        Até o CONECTAR/ASSISTIR/RETOMAR (que troca o prazo pelo de inatividade), a conexão
+        ocupa uma vaga de max_conexoes; calada, ela é derrubada no prazo do handshake.
+        """
+        self.m_conexoes.inc()
+        self.prazos.agendar(conn, conn.visto + self.prazo_handshake())
+        if self.limite_mensagens:
+            conn.limitador = Limitador(self.limite_mensagens, conn.visto)
+    
+    def recusar(self, sock):
+        """Servidor cheio: ERRO e close na hora, sem thread nem registro (o cliente tenta de novo depois)"""
+        self.m_recusadas.inc('lotado')
+        try:
+            sock.setblocking(False)
+            sock.send(QUADRO_LOTADO)
+        except OSError:
+            pass
+        sock.close()
+    
+    def limitar(self, conn, addr, rotulo, erro=None):
+        """Mensagem acima do limite: descartada sem pegar lock nenhum
+        
+        'erro' vai para o cliente até a conexão passar de LIMITE_RECUSAS recusas seguidas;
+        aí ela é derrubada (uma vez só: o que ainda estava no buffer só é descartado).
+        """
+        self.m_limitadas.inc(rotulo)
+        recusas = conn.limitador.recusas_seguidas
+        if recusas < LIMITE_RECUSAS:
+            if erro is not None:
+                self.enviar_mensagem(conn, erro)
+        elif recusas == LIMITE_RECUSAS:
+            log.warning("Conexão com %s derrubada: mensagens demais", addr)
+            self.m_recusadas.inc('abuso')
+            self.fechar_conexao(conn)
+    
+    def aplicar_keepalive(self, sock):
+        """Keepalive TCP no socket de um cliente, se o servidor foi iniciado com --keepalive"""
+        if self.keepalive and sock is not None:
+            configurar_keepalive(sock, self.keepalive)
+
+    def responder_ping_curto(self, conn):
+        """Quadro vazio (PING curto: '\\n' em JSON, tamanho 0 no binário) é respondido com outro,
+        antes de qualquer decodificação, sem lock e sem alocar nada"""
+        limitador = conn.limitador
+        if limitador is not None and not limitador.permitir(None, conn.visto):
+            self.limitar(conn, None, 'ping_curto')
+            return
+        conn.enfileirar(conn.codec.quadro_vazio)
+        self.m_mensagens.inc('ping_curto')
+    
+    def processar_leitura(self, enquadrador, conn, addr):
+        """Processa todos os quadros completos que estão no buffer (uma leitura)
+        
+        No modo pipeline, a fila de saída da conexão fica segurada até o último quadro,
+        então respostas e broadcasts para ela saem num único envio; e uma sequência de
+        mensagens que só mexem na sala (TIPOS_SALA, com PINGs no meio) roda com o lock da
+        sala pego uma vez (ele é reentrante: os `with sala.lock` de dentro não esperam).
+        Antes de qualquer outro tipo o lock é solto, porque ele pode pedir o lock global.
+        O codec pode mudar entre um quadro e outro (CONECTAR), por isso os quadros são
+        decodificados um a um. Quadros vazios são PINGs curtos (responder_ping_curto).
+        """
+        if not self.pipeline:
+            while True:
+                quadro = enquadrador.proximo_quadro(conn.codec)
+                if quadro is None:
+                    return
+                if not quadro:
+                    self.responder_ping_curto(conn)
+                    continue
+                self.processar_quadro(quadro, conn, addr)
+        
+        travada = None  # sala cujo lock está na mão
+        conn.fila.segurar()
+        try:
+            while True:
+                quadro = enquadrador.proximo_quadro(conn.codec)
+                if quadro is None:
+                    return
+                if not quadro:
+                    self.responder_ping_curto(conn)
+                    continue
+                mensagem = self.decodificar_quadro(quadro, conn)
+                if mensagem is None:
+                    continue
+                tipo = mensagem.get('tipo')
+                if tipo in TIPOS_SALA:
+                    dados = self.jogadores.get(conn)
+                    sala = dados.sala if dados is not None else None
+                    if sala is not travada:
+                        if travada is not None:
+                            travada.lock.release()
+                        travada = sala
+                        if sala is not None:
+                            sala.lock.acquire()
+                elif tipo != 'PING' and travada is not None:
+                    travada.lock.release()
+                    travada = None
+                self.responder(mensagem, conn, addr)
+        finally:
+            if travada is not None:
+                travada.lock.release()
+            conn.fila.soltar()
+    
+    def handle_cliente(self, conn, addr, inicial=b''):
+        """Gerencia a comunicação com um cliente
+        
+        'inicial' são bytes que já foram lidos do socket por outro processo (modo multiprocesso).
+        """
+        log.debug("Nova conexão TCP aceita de %s", addr)
+        enquadrador = Enquadrador()
+        if inicial:
+            enquadrador.alimentar(inicial)
         
         try:
             while self.rodando:
-                dados = conn.recv(4096)
-                if not dados:
-                    print(f"Cliente {addr} fechou a conexão")
-                    break
+                # Processar mensagens completas (o codec pode mudar entre um quadro e outro)
+                self.processar_leitura(enquadrador, conn, addr)
+                if inicial:
+                    inicial = b''
+                    self.conexao_entregue()
                 
-                buffer += dados.decode()
-                
-                # Processar mensagens completas (delimitadas por \n)
-                while '\n' in buffer:
-                    linha, buffer = buffer.split('\n', 1)
-                    if linha.strip():
-                        try:
-                            mensagem = json.loads(linha)
-                            tipo = mensagem.get('tipo')
-                            
-                            if tipo != 'PING':  # Não logar PING para não poluir
-                                print(f"← Recebido de {addr}: {tipo}")
-                            
-                            resposta = self.processar_mensagem(mensagem, conn)
-                            
-                            if resposta:
-                                if resposta.get('tipo') != 'PONG':
-                                    print(f"→ Enviando para {addr}: {resposta.get('tipo')}")
-                                self.enviar_mensagem(conn, resposta)
-                        except json.JSONDecodeError as e:
-                            print(f"Erro ao decodificar JSON: {e}")
-                            print(f"Linha recebida: {linha}")
+                if not enquadrador.receber(conn):
+                    log.debug("Cliente %s fechou a conexão", addr)
+                    break
+                conn.visto = time.monotonic()
+        
+        except QuadroMuitoGrande as e:
+            log.warning("Conexão com %s encerrada: %s", addr, e)
+        
+        except OSError as e:
+            log.info("Erro na conexão com %s: %s", addr, e)
         
         except Exception as e:
-            print(f"Erro na conexão com {addr}: {e}")
-            import traceback
-            traceback.print_exc()
+            log.exception("Erro na conexão com %s: %s", addr, e)
         
         finally:
-            print(f"\n{'='*50}")
-            print(f"CONEXÃO ENCERRADA: {addr}")
-            print(f"{'='*50}\n")
-            with self.lock:
-                if conn in self.jogadores:
-                    self.remover_jogador(conn)
+            log.debug("Conexão encerrada: %s", addr)
+            self.m_conexoes.dec()
+            self.remover_jogador(conn)
+            if inicial:
+                self.conexao_entregue()  # o primeiro quadro deu erro: conta do mesmo jeito
     
     def iniciar(self):
         """Inicia o loop principal do servidor"""
-        print("\n" + "="*50)
-        print("SERVIDOR RODANDO E AGUARDANDO CONEXÕES")
-        print("="*50 + "\n")
+        log.info("Servidor rodando e aguardando conexões")
         
         try:
             while self.rodando:
                 try:
-                    conn, addr = self.server.accept()
+                    sock, addr = self.server.accept()
+                    if self.lotado():
+                        self.recusar(sock)
+                        continue
+                    self.aplicar_keepalive(sock)
+                    conn = Conexao(sock, self.limite_fila)
+                    self.admitir(conn)  # aqui e não na thread: o próximo accept já vê a contagem
                     thread = Thread(target=self.handle_cliente, args=(conn, addr), daemon=True)
                     thread.start()
                 except Exception as e:
                     if self.rodando:
-                        print(f"Erro ao aceitar conexão: {e}")
+                        log.error("Erro ao aceitar conexão: %s", e)
         
         except KeyboardInterrupt:
-            print("\nEncerrando servidor...")
+            log.info("Encerrando servidor...")
         
         finally:
             self.rodando = False
             self.server.close()
+    
+    def atender_canal(self, canal):
+        """Loop do trabalhador (modo multiprocesso): conexões chegam prontas do processo principal"""
+        log.info("Trabalhador rodando e aguardando conexões")
+        
+        try:
+            while self.rodando:
+                sock, inicial = receber_conexao(canal)
+                if sock is None:
+                    break  # processo principal saiu
+                try:
+                    addr = sock.getpeername()
+                except OSError:
+                    sock.close()  # cliente já foi embora
+                    self.conexao_entregue()
+                    continue
+                if self.lotado():
+                    self.recusar(sock)
+                    self.conexao_entregue()
+                    continue
+                self.aplicar_keepalive(sock)
+                conn = Conexao(sock, self.limite_fila)
+                self.admitir(conn)
+                thread = Thread(target=self.handle_cliente, args=(conn, addr, inicial), daemon=True)
+                thread.start()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.rodando = False
 
 if __name__ == '__main__':
-    servidor = ServidorJogoDaVelha()
-    servidor.iniciar()
+    parser = argparse.ArgumentParser(description="Servidor do Jogo da Velha")
+    parser.add_argument('--porta', type=int, default=12111)
+    parser.add_argument('--timeout', type=float, default=15.0,
+                        help="segundos sem PING até o jogador ser desconectado")
+    parser.add_argument('--intervalo-ping', type=float, default=5.0,
+                        help="intervalo de PING informado aos clientes no CONECTADO")
+    parser.add_argument('--keepalive', type=int,
+                        help="liga o keepalive TCP: o kernel sonda conexões ociosas há tantos segundos")
+    parser.add_argument('--max-conexoes', type=int,
+                        help="conexões abertas ao mesmo tempo; as que passarem recebem ERRO e são fechadas na hora")
+    parser.add_argument('--limite-mensagens', type=float,
+                        help="mensagens por segundo de cada conexão (rajada do dobro); as que passarem são descartadas")
+    parser.add_argument('--backlog', type=int, default=socket.SOMAXCONN,
+                        help="conexões esperando o accept na fila do kernel (limitado por net.core.somaxconn)")
+    parser.add_argument('--limite-fila', type=int, default=64 * 1024,
+                        help="bytes na fila de saída de cada conexão antes de aplicar a política")
+    parser.add_argument('--politica-fila', choices=POLITICAS_FILA, default='coalescer',
+                        help="fila cheia: descartar a mensagem, coalescer no estado atual ou desconectar")
+    parser.add_argument('--tempo-retomada', type=float, default=20.0,
+                        help="segundos que o lugar de quem caiu no meio do jogo fica reservado (0 = não reserva)")
+    parser.add_argument('--faixa-rating', type=int, default=200,
+                        help="largura das faixas de rating do emparelhamento")
+    parser.add_argument('--espera-alargar', type=float, default=5.0,
+                        help="segundos de espera até aceitar oponentes de uma faixa a mais")
+    parser.add_argument('--raio-max', type=int, default=10,
+                        help="quantas faixas de distância a espera pode alargar (0 = só a própria faixa)")
+    parser.add_argument('--bot', action='store_true',
+                        help="quem espera --espera-alargar segundos sem oponente joga contra o bot de jogo perfeito")
+    parser.add_argument('--tabela', help="arquivo da tabela de jogo perfeito (lido se existir; senão é criado)")
+    parser.add_argument('--historico', help="grava as partidas (JSONL, só acréscimo) neste arquivo "
+                                              "(multiprocesso: trabalhador i grava em ARQUIVO.i)")
+    parser.add_argument('--durabilidade', choices=DURABILIDADES, default='periodica',
+                        help="fsync do histórico: a cada lote, a cada segundo ou nunca")
+    parser.add_argument('--pipeline', action='store_true',
+                        help="processa os quadros de cada leitura juntos e manda as respostas num único envio")
+    parser.add_argument('--modo', choices=['threads', 'async'], default='threads',
+                        help="threads: uma thread por conexão; async: um único event loop (asyncio)")
+    parser.add_argument('--processos', type=int, default=1,
+                        help="mais de 1: um processo aceita e distribui as conexões entre N trabalhadores")
+    parser.add_argument('--log-nivel', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'], default='INFO',
+                        help="DEBUG mostra cada mensagem recebida/enviada")
+    parser.add_argument('--log-amostragem', type=int, default=1,
+                        help="no nível DEBUG, registra só 1 a cada N mensagens")
+    parser.add_argument('--log-arquivo', help="grava o log neste arquivo em vez do terminal")
+    parser.add_argument('--detalhes', action='store_true',
+                        help="liga tabuleiro e faixas no log (também dá para alternar com kill -USR1)")
+    parser.add_argument('--porta-metricas', type=int,
+                        help="serve /metrics em 127.0.0.1 nesta porta (multiprocesso: trabalhador i usa porta+i)")
+    parser.add_argument('--canal-fd', type=int, help=argparse.SUPPRESS)  # uso interno: trabalhador
+    parser.add_argument('--indice', type=int, default=0, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    registro.configurar(args.log_nivel, args.log_amostragem, args.detalhes, args.log_arquivo)
+    
+    if args.processos > 1 and args.canal_fd is None:
+        # Os trabalhadores recebem as mesmas opções
+        opcoes = ['--modo', args.modo, '--timeout', str(args.timeout), '--intervalo-ping', str(args.intervalo_ping),
+                  '--limite-fila', str(args.limite_fila), '--politica-fila', args.politica_fila,
+                  '--tempo-retomada', str(args.tempo_retomada), '--faixa-rating', str(args.faixa_rating),
+                  '--espera-alargar', str(args.espera_alargar), '--raio-max', str(args.raio_max),
+                  '--log-nivel', args.log_nivel, '--log-amostragem', str(args.log_amostragem)]
+        if args.log_arquivo:
+            opcoes += ['--log-arquivo', args.log_arquivo]
+        if args.detalhes:
+            opcoes.append('--detalhes')
+        if args.bot:
+            opcoes.append('--bot')
+        if args.pipeline:
+            opcoes.append('--pipeline')
+        if args.keepalive:
+            opcoes += ['--keepalive', str(args.keepalive)]
+        if args.max_conexoes:
+            # O limite é por processo: cada trabalhador fica com a sua parte
+            opcoes += ['--max-conexoes', str(-(-args.max_conexoes // args.processos))]
+        if args.limite_mensagens:
+            opcoes += ['--limite-mensagens', str(args.limite_mensagens)]
+        if args.tabela:
+            opcoes += ['--tabela', args.tabela]
+        if args.historico:
+            opcoes += ['--historico', args.historico, '--durabilidade', args.durabilidade]
+        if args.porta_metricas is not None:
+            opcoes += ['--porta-metricas', str(args.porta_metricas)]
+        iniciar_multiprocesso(args.porta, args.processos, opcoes, args.backlog, args.faixa_rating)
+        raise SystemExit
+    
+    trabalhador = args.canal_fd is not None
+    historico = args.historico
+    if historico and trabalhador:
+        historico = f'{historico}.{args.indice}'  # um arquivo por processo: writes não se misturam
+    # SIGTERM sai pelo caminho normal, e o histórico grava o que estava na fila
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    servidor = ServidorJogoDaVelha(porta=None if trabalhador else args.porta, timeout_inatividade=args.timeout,
+                                   intervalo_ping=args.intervalo_ping, limite_fila=args.limite_fila,
+                                   politica_fila=args.politica_fila, tempo_retomada=args.tempo_retomada,
+                                   indice=args.indice, bot_sem_oponente=args.bot, tabela=args.tabela,
+                                   historico=historico, durabilidade=args.durabilidade, pipeline=args.pipeline,
+                                   keepalive=args.keepalive, max_conexoes=args.max_conexoes,
+                                   limite_mensagens=args.limite_mensagens, backlog=args.backlog)
+    # Ids de sala intercalados entre os trabalhadores: não repetem entre processos
+    servidor.lobby = Lobby(primeiro_id=args.indice + 1, passo=args.processos if trabalhador else 1,
+                           emparelhador=Emparelhador(args.faixa_rating, espera_alargar=args.espera_alargar,
+                                                     raio_max=args.raio_max))
+    canal = None
+    if trabalhador:
+        canal = servidor.canal = socket.socket(fileno=args.canal_fd)
+    if args.porta_metricas is not None:
+        servidor.servir_metricas(args.porta_metricas + args.indice)
+    
+    if args.modo == 'async':
+        from servidor_async import iniciar_async
+        iniciar_async(servidor, canal)
+    elif trabalhador:
+        servidor.atender_canal(canal)
+    else:
+        servidor.iniciar()
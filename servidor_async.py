@@ -0,0 +1,224 @@
+import asyncio
+import threading
+import time
+
+from admissao import QUADRO_LOTADO
+from fila_envio import FilaEnvio
+from protocolo import CODEC_JSON, Enquadrador, QuadroMuitoGrande
+from registro import log
+from servidor_multiprocesso import receber_conexao
+
+
+class AgendaDespejo:
+    """Conexões com quadros novos esperando o event loop
+
+    Quem enfileira de outra thread (o transmissor da plateia espalhando para milhares de
+    espectadores, por exemplo) não acorda o loop uma vez por conexão: só a primeira de
+    uma leva faz call_soon_threadsafe, e o loop despeja todas de uma vez.
+    """
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.conexoes = []
+        self.agendada = False
+        self.lock = threading.Lock()
+
+    def agendar(self, conn):
+        with self.lock:
+            self.conexoes.append(conn)
+            if self.agendada:
+                return
+            self.agendada = True
+        self.loop.call_soon_threadsafe(self.despejar)
+
+    def despejar(self):
+        with self.lock:
+            conexoes, self.conexoes = self.conexoes, []
+            self.agendada = False
+        for conn in conexoes:
+            conn.despejar()
+
+
+class ConexaoAsync:
+    """Adapta um transporte asyncio à interface de conexão usada pelo servidor (enfileirar/shutdown/close)
+
+    Enquanto o transporte aceita escrita os quadros vão direto para ele; quando o buffer
+    do transporte passa do limite (pause_writing) eles esperam na fila, que é limitada
+    e pode ser descartada ou coalescida pelo servidor como no modo threads.
+    """
+
+    def __init__(self, transporte, loop, limite_fila=64 * 1024, agenda=None):
+        self.transporte = transporte
+        self.loop = loop
+        self.agenda = agenda if agenda is not None else AgendaDespejo(loop)
+        self.thread_loop = threading.get_ident()
+        self.codec = CODEC_JSON
+        self.fila = FilaEnvio(limite_fila)
+        self.pausado = False
+        self.agendado = False  # já há um despejar() pendente no event loop
+        self.fd = transporte.get_extra_info('socket').fileno()  # índice nos registros do servidor
+        self.visto = time.monotonic()  # último byte recebido (o monitor derruba quem ficar calado)
+        self.limitador = None  # baldes de fichas (admissao.py), com limite_mensagens
+        transporte.set_write_buffer_limits(high=limite_fila)
+
+    def _no_loop(self, funcao, *args):
+        # Transportes asyncio não são thread-safe: chamadas vindas de outras threads
+        # (ex.: monitorar_conexoes) são agendadas no event loop
+        if threading.get_ident() == self.thread_loop:
+            funcao(*args)
+        else:
+            self.loop.call_soon_threadsafe(funcao, *args)
+
+    def enfileirar(self, dados):
+        """Coloca um quadro na fila de saída; False se a fila está cheia"""
+        if not self.fila.colocar(dados):
+            return False
+        with self.fila.condicao:
+            if self.pausado or self.agendado:
+                return True
+            self.agendado = True
+        # Despeja no fim da volta atual do loop: tudo o que foi enfileirado até lá vai num write só
+        self.agenda.agendar(self)
+        return True
+
+    def despejar(self):
+        """Passa a fila para o transporte (no event loop)"""
+        with self.fila.condicao:
+            self.agendado = False
+            if self.pausado:
+                return
+        quadros = self.fila.retirar_quadros(esperar=False)
+        if quadros:
+            self.transporte.writelines(quadros)  # sendmsg quando o transporte suporta
+
+    def pausar(self):
+        with self.fila.condicao:
+            self.pausado = True
+
+    def retomar(self):
+        with self.fila.condicao:
+            self.pausado = False
+        self.despejar()
+
+    def shutdown(self, how=None):
+        # abort e não close: close espera o buffer de escrita esvaziar, e o cliente pode não estar lendo
+        self._no_loop(self.transporte.abort)
+
+    def close(self):
+        self.fila.fechar()
+        self._no_loop(self.transporte.close)
+
+
+class ProtocoloJogo(asyncio.BufferedProtocol):
+    """Uma conexão no modo async: mesmo protocolo e mesmo processar_mensagem
+
+    BufferedProtocol: o event loop faz recv_into direto no buffer do Enquadrador.
+    """
+
+    def __init__(self, servidor, inicial=b'', agenda=None):
+        self.servidor = servidor
+        self.agenda = agenda  # compartilhada pelas conexões do mesmo loop
+        self.conn = None
+        self.addr = None
+        self.enquadrador = Enquadrador()
+        self.inicial = inicial  # bytes já lidos pelo processo principal (modo multiprocesso)
+
+    def connection_made(self, transporte):
+        self.addr = transporte.get_extra_info('peername')
+        if self.servidor.lotado():
+            # Servidor cheio: ERRO e close, sem ConexaoAsync nem registro
+            self.servidor.m_recusadas.inc('lotado')
+            transporte.write(QUADRO_LOTADO)
+            transporte.close()
+            if self.inicial:
+                self.servidor.conexao_entregue()
+            return
+        self.conn = ConexaoAsync(transporte, asyncio.get_running_loop(), self.servidor.limite_fila, self.agenda)
+        log.debug("Nova conexão TCP aceita de %s", self.addr)
+        self.servidor.aplicar_keepalive(transporte.get_extra_info('socket'))
+        self.servidor.admitir(self.conn)
+        if self.inicial:
+            self.enquadrador.alimentar(self.inicial)
+            self.inicial = b''
+            self.processar_quadros()
+            self.servidor.conexao_entregue()
+
+    def pause_writing(self):
+        self.conn.pausar()
+
+    def resume_writing(self):
+        self.conn.retomar()
+
+    def get_buffer(self, sizehint):
+        return self.enquadrador.espaco_livre()
+
+    def buffer_updated(self, nbytes):
+        self.enquadrador.avancar(nbytes)
+        self.conn.visto = time.monotonic()
+        self.processar_quadros()
+
+    def processar_quadros(self):
+        # Processar mensagens completas (o codec pode mudar entre um quadro e outro)
+        try:
+            self.servidor.processar_leitura(self.enquadrador, self.conn, self.addr)
+        except QuadroMuitoGrande as e:
+            log.warning("Conexão com %s encerrada: %s", self.addr, e)
+            self.conn.close()
+        except Exception as e:
+            log.exception("Erro na conexão com %s: %s", self.addr, e)
+
+    def connection_lost(self, exc):
+        if self.conn is None:
+            return  # recusada em connection_made
+        log.debug("Conexão encerrada: %s", self.addr)
+        self.servidor.m_conexoes.dec()
+        self.conn.fila.fechar()
+        self.servidor.remover_jogador(self.conn)
+
+
+def _receber_do_canal(servidor, canal, loop, fim, agenda):
+    """Conexão entregue pelo processo principal: vira um ProtocoloJogo neste event loop"""
+    try:
+        sock, inicial = receber_conexao(canal)
+    except BlockingIOError:
+        return
+    if sock is None:
+        fim.set_result(None)  # processo principal saiu
+        return
+    sock.setblocking(False)
+    tarefa = loop.create_task(loop.connect_accepted_socket(lambda: ProtocoloJogo(servidor, inicial, agenda), sock))
+    # Sem connection_made, a conexão ainda precisa entrar na contagem dos avisos ao processo principal
+    tarefa.add_done_callback(lambda t: t.cancelled() or t.exception() is None or servidor.conexao_entregue())
+
+
+async def _servir(servidor, canal=None):
+    loop = asyncio.get_running_loop()
+    agenda = AgendaDespejo(loop)
+    if canal is not None:
+        # Trabalhador do modo multiprocesso: sem socket de escuta
+        fim = loop.create_future()
+        canal.setblocking(False)
+        loop.add_reader(canal.fileno(), _receber_do_canal, servidor, canal, loop, fim, agenda)
+        await fim
+        return
+    servidor.server.setblocking(False)
+    servidor_asyncio = await loop.create_server(lambda: ProtocoloJogo(servidor, agenda=agenda), sock=servidor.server)
+    async with servidor_asyncio:
+        await servidor_asyncio.serve_forever()
+
+
+def iniciar_async(servidor, canal=None):
+    """Roda o servidor num único event loop em vez de uma thread por conexão
+
+    Com 'canal', é um trabalhador do modo multiprocesso e as conexões chegam por ele.
+    """
+    log.info("Servidor (async) rodando e aguardando conexões")
+
+    try:
+        asyncio.run(_servir(servidor, canal))
+    except KeyboardInterrupt:
+        log.info("Encerrando servidor...")
+    finally:
+        servidor.rodando = False
+        if servidor.server is not None:
+            servidor.server.close()
@@ -0,0 +1,232 @@
+"""Modo multiprocesso: um processo principal aceita as conexões e N processos trabalhadores jogam.
+
+Cada trabalhador é um servidor completo (modo threads ou async), só que sem socket de escuta:
+o principal lê o CONECTAR de cada conexão nova, escolhe o trabalhador e passa para ele o
+descritor do socket (SCM_RIGHTS) junto com os bytes já lidos. Dois jogadores que mandam o
+mesmo token 'partida' sempre caem no mesmo trabalhador; sem token, a conexão vai para o
+trabalhador onde alguém compatível (mesma variante e faixa de rating) está esperando
+oponente (cada trabalhador avisa pelo canal quando isso muda), ou abre a espera no próximo
+do rodízio. Quem espera sem par compatível não prende os outros num trabalhador só. Um RETOMAR
+vai para o trabalhador que emitiu a sessão (o token começa pelo índice dele), e um ASSISTIR
+para o dono da sala pedida (sem sala, para o trabalhador 0).
+
+SO_REUSEPORT sozinho não serve aqui: o kernel espalha as conexões pelo hash do endereço,
+e os dois jogadores de uma partida podem cair em processos diferentes.
+"""
+import os
+import selectors
+import signal
+import socket
+import subprocess
+import sys
+import time
+import zlib
+from math import isfinite
+
+from emparelhamento import RATING_PADRAO
+from protocolo import CODEC_JSON
+from registro import log
+from tabuleiro import VARIANTE_PADRAO
+
+# Cada conexão entregue é uma mensagem, sem misturar os bytes de duas; SEQPACKET ainda
+# avisa o trabalhador (recv vazio) quando o processo principal morre
+TIPO_CANAL = getattr(socket, 'SOCK_SEQPACKET', socket.SOCK_DGRAM)
+
+TAMANHO_MAXIMO_INICIAL = 64 * 1024  # mesmo limite de quadro do Enquadrador
+PRAZO_CONECTAR = 10.0  # segundos para a conexão nova mandar o CONECTAR
+
+
+def enviar_conexao(canal, sock, inicial):
+    """Passa o socket (e os bytes já lidos dele) para o trabalhador do outro lado do canal"""
+    socket.send_fds(canal, [bytes(inicial)], [sock.fileno()])
+
+
+def receber_conexao(canal):
+    """(socket, bytes já lidos) recebidos do processo principal; (None, b'') se o canal fechou"""
+    dados, fds, _, _ = socket.recv_fds(canal, TAMANHO_MAXIMO_INICIAL, 1)
+    if not fds:
+        return None, b''
+    return socket.socket(fileno=fds[0]), dados
+
+
+class Distribuidor:
+    """Processo principal: aceita, lê o CONECTAR e entrega a conexão a um trabalhador"""
+
+    def __init__(self, porta, processos, argumentos_trabalhador=(), backlog=socket.SOMAXCONN, faixa_rating=200):
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind(('', porta))
+        self.server.listen(backlog)
+        self.server.setblocking(False)
+        self.porta = self.server.getsockname()[1]
+
+        self.canais = []
+        self.trabalhadores = []
+        script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'servidor.py')
+        for indice in range(processos):
+            canal, canal_filho = socket.socketpair(socket.AF_UNIX, TIPO_CANAL)
+            self.trabalhadores.append(subprocess.Popen(
+                [sys.executable, script, '--canal-fd', str(canal_filho.fileno()),
+                 '--indice', str(indice), '--processos', str(processos), *argumentos_trabalhador],
+                pass_fds=[canal_filho.fileno()]))
+            canal_filho.close()
+            self.canais.append(canal)
+
+        # Chaves (variante, faixa de rating) de quem espera oponente sem token em cada trabalhador.
+        # O aviso de um trabalhador só vale se ele já processou todas as conexões mandadas para
+        # ele; até lá, vale a conta feita aqui
+        self.faixa_rating = faixa_rating  # a mesma --faixa-rating dos trabalhadores
+        self.enviadas = [0] * processos  # conexões entregues a cada trabalhador
+        self.espera = [set() for _ in range(processos)]
+        self.proximo = 0  # rodízio de onde abrir a próxima espera
+        self.pendentes = {}  # {socket: [bytes lidos, prazo]} conexões esperando o CONECTAR
+        self.seletor = selectors.DefaultSelector()
+        log.info("Servidor (multiprocesso, %d trabalhadores) iniciado na porta %s", processos, self.porta)
+
+    def escolher_trabalhador(self, inicial):
+        """Índice do trabalhador a partir do primeiro quadro da conexão"""
+        try:
+            mensagem = CODEC_JSON.decodificar(inicial[:inicial.index(b'\n')])
+        except ValueError:
+            mensagem = None
+        if not isinstance(mensagem, dict):
+            mensagem = {}
+        if mensagem.get('tipo') == 'RETOMAR':
+            indice, _, _ = str(mensagem.get('sessao')).partition('.')
+            if indice.isdigit():
+                return int(indice) % len(self.canais)
+        if mensagem.get('tipo') == 'ASSISTIR':
+            # Ids de sala intercalados: a sala i+1+k*N é do trabalhador i. Sem sala, o destaque
+            # é o do trabalhador 0, para a plateia inteira ficar num processo só
+            sala = mensagem.get('sala')
+            return (sala - 1) % len(self.canais) if isinstance(sala, int) and sala > 0 else 0
+        chave = None
+        if mensagem.get('tipo') == 'CONECTAR':
+            partida = mensagem.get('partida')
+            if partida is not None:
+                return zlib.crc32(str(partida).encode()) % len(self.canais)
+            if mensagem.get('oponente') != 'bot':
+                chave = self.chave_espera(mensagem)
+                for indice, chaves in enumerate(self.espera):
+                    if chave in chaves:
+                        chaves.discard(chave)  # vai emparelhar com quem espera lá
+                        return indice
+        indice = self.proximo
+        self.proximo = (indice + 1) % len(self.canais)
+        if chave is not None:
+            self.espera[indice].add(chave)
+        return indice
+
+    def chave_espera(self, mensagem):
+        """(variante, faixa de rating) do CONECTAR: a mesma conta de Emparelhador.faixa no trabalhador"""
+        rating = mensagem.get('rating')
+        if not isinstance(rating, (int, float)) or not isfinite(rating):
+            rating = RATING_PADRAO
+        return str(mensagem.get('variante', VARIANTE_PADRAO)), int(rating // self.faixa_rating)
+
+    def aceitar(self):
+        while True:
+            try:
+                sock, _ = self.server.accept()
+            except BlockingIOError:
+                return
+            sock.setblocking(False)
+            self.pendentes[sock] = [bytearray(), time.monotonic() + PRAZO_CONECTAR]
+            self.seletor.register(sock, selectors.EVENT_READ)
+
+    def descartar(self, sock):
+        self.seletor.unregister(sock)
+        self.pendentes.pop(sock, None)
+        sock.close()
+
+    def ler(self, sock):
+        inicial = self.pendentes[sock][0]
+        try:
+            dados = sock.recv(4096)
+        except BlockingIOError:
+            return
+        except OSError:
+            dados = b''
+        if not dados:
+            self.descartar(sock)
+            return
+        inicial += dados
+        if b'\n' not in inicial:
+            if len(inicial) > TAMANHO_MAXIMO_INICIAL:
+                log.warning("Conexão encerrada: primeiro quadro grande demais")
+                self.descartar(sock)
+            return
+
+        indice = self.escolher_trabalhador(inicial)
+        sock.setblocking(True)  # o trabalhador espera um socket bloqueante (modo threads)
+        try:
+            enviar_conexao(self.canais[indice], sock, inicial)
+            self.enviadas[indice] += 1
+        except OSError as e:
+            log.error("Erro ao entregar conexão ao trabalhador %d: %s", indice, e)
+        self.descartar(sock)  # o trabalhador tem a própria cópia do descritor
+
+    def ler_aviso(self, indice):
+        """Aviso de um trabalhador: {'entregues': conexões processadas, 'espera': [[variante, faixa], ...]}"""
+        canal = self.canais[indice]
+        try:
+            dados = canal.recv(TAMANHO_MAXIMO_INICIAL)
+        except BlockingIOError:
+            return
+        except OSError:
+            dados = b''
+        if not dados:
+            self.seletor.unregister(canal)  # trabalhador saiu: o poll do loop avisa
+            return
+        try:
+            aviso = CODEC_JSON.decodificar(dados.rstrip(b'\n'))
+        except ValueError:
+            return
+        if aviso.get('entregues') == self.enviadas[indice]:
+            self.espera[indice] = {(variante, faixa) for variante, faixa in aviso.get('espera', ())}
+
+    def repassar_sinal(self, sinal, _quadro):
+        """kill -USR1 no processo principal alterna os detalhes do log em todos os trabalhadores"""
+        for trabalhador in self.trabalhadores:
+            trabalhador.send_signal(sinal)
+
+    def expirar(self):
+        agora = time.monotonic()
+        for sock, (_, prazo) in list(self.pendentes.items()):
+            if prazo < agora:
+                self.descartar(sock)
+
+    def iniciar(self):
+        """Loop do processo principal (só aceita e distribui; não joga)"""
+        self.seletor.register(self.server, selectors.EVENT_READ)
+        for indice, canal in enumerate(self.canais):
+            self.seletor.register(canal, selectors.EVENT_READ, indice)
+        # SIGTERM também passa pelo finally: os trabalhadores não podem ficar órfãos
+        signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+        signal.signal(signal.SIGUSR1, self.repassar_sinal)
+        try:
+            while True:
+                for chave, _ in self.seletor.select(timeout=1.0):
+                    if chave.fileobj is self.server:
+                        self.aceitar()
+                    elif chave.data is not None:
+                        self.ler_aviso(chave.data)
+                    else:
+                        self.ler(chave.fileobj)
+                self.expirar()
+                for indice, trabalhador in enumerate(self.trabalhadores):
+                    if trabalhador.poll() is not None:
+                        log.error("Trabalhador %d terminou (código %s)", indice, trabalhador.returncode)
+                        raise SystemExit(1)
+        except KeyboardInterrupt:
+            log.info("Encerrando servidor...")
+        finally:
+            for trabalhador in self.trabalhadores:
+                trabalhador.terminate()
+            for trabalhador in self.trabalhadores:
+                trabalhador.wait()
+            self.server.close()
+
+
+def iniciar_multiprocesso(porta, processos, argumentos_trabalhador=(), backlog=socket.SOMAXCONN, faixa_rating=200):
+    Distribuidor(porta, processos, argumentos_trabalhador, backlog, faixa_rating).iniciar()
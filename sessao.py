@@ -0,0 +1,117 @@
+"""Registro compacto das conexões: um objeto com __slots__ por jogador ou espectador.
+
+Com centenas de milhares de conexões paradas, o que cada uma custa no servidor decide
+quantas máquinas são precisas. Um dict por jogador carrega a tabela de hash inteira
+(~300 bytes com as chaves de sempre); o objeto com __slots__ guarda só os ponteiros
+(~130 bytes). O registro {conexão: sessão} também não é um dict: é uma lista indexada
+pelo descritor do socket, que o kernel já mantém pequeno e denso (8 bytes por conexão).
+
+Tempos são floats do time.monotonic() guardados na própria conexão (conn.visto); o
+símbolo é a string 'X'/'O', que o Python compartilha (o slot guarda só o ponteiro,
+como guardaria um código inteiro).
+"""
+from emparelhamento import RATING_PADRAO
+from tabuleiro import VARIANTE_PADRAO
+
+
+class Jogador:
+    """Sessão de um jogador: sobrevive à conexão (RETOMAR troca o conn)"""
+    __slots__ = ('conn', 'endereco', 'sessao', 'simbolo', 'sala', 'versao', 'ausente', 'variante', 'rating',
+                 'rtt_ms', 'bot')
+
+    def __init__(self, conn, endereco=None, sessao=None, versao=1, variante=VARIANTE_PADRAO, bot=False):
+        self.conn = conn
+        self.endereco = endereco
+        self.sessao = sessao  # token do CONECTADO
+        self.simbolo = None  # 'X'/'O', dado pela sala
+        self.sala = None
+        self.versao = versao
+        self.ausente = False  # caiu e o lugar está reservado esperando RETOMAR
+        self.variante = variante
+        self.rating = RATING_PADRAO
+        self.rtt_ms = None  # média móvel do RTT informado nos PINGs
+        self.bot = bot
+
+
+class Espectador:
+    """Conexão que só assiste (sala None: esperando uma partida em destaque)"""
+    __slots__ = ('conn', 'endereco', 'sala')
+    simbolo = None  # para os logs tratarem jogador e espectador igual
+
+    def __init__(self, conn, endereco=None):
+        self.conn = conn
+        self.endereco = endereco
+        self.sala = None
+
+
+class RegistroConexoes:
+    """{conexão: sessão} guardado numa lista indexada por conn.fd
+
+    A sessão guarda a própria conexão, então uma posição ocupada por outra conexão com
+    o mesmo descritor (fechada e reaproveitada pelo kernel antes de sair do registro)
+    não é confundida: a nova vai para um dict à parte até a antiga sair.
+    """
+    __slots__ = ('por_fd', 'colisoes', 'quantidade')
+
+    def __init__(self):
+        self.por_fd = []
+        self.colisoes = {}
+        self.quantidade = 0
+
+    def get(self, conn, padrao=None):
+        fd = conn.fd
+        if fd < len(self.por_fd):
+            sessao = self.por_fd[fd]
+            if sessao is not None and sessao.conn is conn:
+                return sessao
+        if self.colisoes:
+            return self.colisoes.get(conn, padrao)
+        return padrao
+
+    def __contains__(self, conn):
+        return self.get(conn) is not None
+
+    def __setitem__(self, conn, sessao):
+        fd = conn.fd
+        if fd >= len(self.por_fd):
+            self.por_fd.extend([None] * (fd + 1 - len(self.por_fd)))
+        atual = self.por_fd[fd]
+        if atual is None:
+            self.por_fd[fd] = sessao
+            self.quantidade += 1
+        elif atual.conn is conn:
+            self.por_fd[fd] = sessao
+        else:
+            if conn not in self.colisoes:
+                self.quantidade += 1
+            self.colisoes[conn] = sessao
+
+    def pop(self, conn, padrao=None):
+        fd = conn.fd
+        if fd < len(self.por_fd):
+            sessao = self.por_fd[fd]
+            if sessao is not None and sessao.conn is conn:
+                self.por_fd[fd] = None
+                self.quantidade -= 1
+                return sessao
+        sessao = self.colisoes.pop(conn, None)
+        if sessao is None:
+            return padrao
+        self.quantidade -= 1
+        return sessao
+
+    def __len__(self):
+        return self.quantidade
+
+    def __iter__(self):
+        """As conexões registradas (como iterar um dict)"""
+        for sessao in self.por_fd:
+            if sessao is not None:
+                yield sessao.conn
+        yield from list(self.colisoes)
+
+    def values(self):
+        for sessao in self.por_fd:
+            if sessao is not None:
+                yield sessao
+        yield from list(self.colisoes.values())
@@ -0,0 +1,93 @@
+"""Estado do jogo em bitboard: uma máscara de N*N bits para X e outra para O.
+
+A casa (linha, coluna) é o bit linha*N + coluna. Vence quem fizer k em linha (na
+horizontal, vertical ou diagonal): o jogo da velha é N=3, k=3; o gomoku, N=15, k=5.
+Jogada e verificação de vitória custam poucas operações com inteiros, sem percorrer
+o tabuleiro: só as janelas de k casas que passam pela casa jogada são testadas.
+"""
+from functools import lru_cache
+
+# Variantes que o cliente pode pedir no CONECTAR: nome -> (N, k)
+VARIANTES = {
+    'velha': (3, 3),
+    'gomoku': (15, 5),
+    'gomoku19': (19, 5),
+}
+VARIANTE_PADRAO = 'velha'
+
+
+@lru_cache(maxsize=None)
+def janelas(tamanho, k):
+    """(todas as janelas de vitória, janelas por casa) de um tabuleiro N x N com k em linha
+
+    Calculado uma vez por variante; no 19x19 com k=5 são 1020 janelas, no máximo 20 por casa.
+    """
+    todas = []
+    for linha in range(tamanho):
+        for coluna in range(tamanho):
+            for dl, dc in ((0, 1), (1, 0), (1, 1), (1, -1)):
+                fim_linha, fim_coluna = linha + dl * (k - 1), coluna + dc * (k - 1)
+                if not (0 <= fim_linha < tamanho and 0 <= fim_coluna < tamanho):
+                    continue
+                mascara = 0
+                for passo in range(k):
+                    mascara |= 1 << ((linha + dl * passo) * tamanho + coluna + dc * passo)
+                todas.append(mascara)
+    por_casa = tuple(tuple(v for v in todas if v & (1 << casa)) for casa in range(tamanho * tamanho))
+    return tuple(todas), por_casa
+
+
+# Jogo da velha (a tabela de jogo perfeito usa direto)
+CHEIO = 0b111111111
+VITORIAS, VITORIAS_POR_CASA = janelas(3, 3)
+
+
+class Tabuleiro:
+    """Tabuleiro N x N (3x3 por padrão) guardado como duas máscaras de bits"""
+
+    def __init__(self, tamanho=3, k=3):
+        self.tamanho = tamanho
+        self.k = k
+        self.x = 0
+        self.o = 0
+        self.livres = tamanho * tamanho  # casas vazias: empate quando chega a zero
+        _, self.vitorias_por_casa = janelas(tamanho, k)
+
+    def casa_livre(self, linha, coluna):
+        """Verifica se a casa existe e está vazia"""
+        if 0 <= linha < self.tamanho and 0 <= coluna < self.tamanho:
+            return not (self.x | self.o) & (1 << (linha * self.tamanho + coluna))
+        return False
+
+    def jogar(self, linha, coluna, simbolo):
+        """Marca a casa (deve estar livre) e retorna o resultado: 'X', 'O', 'EMPATE' ou None"""
+        casa = linha * self.tamanho + coluna
+        bit = 1 << casa
+        if simbolo == 'X':
+            self.x |= bit
+            mascara = self.x
+        else:
+            self.o |= bit
+            mascara = self.o
+        self.livres -= 1
+
+        # Só quem jogou pode ter vencido, e só numa janela que passa pela casa jogada
+        for vitoria in self.vitorias_por_casa[casa]:
+            if mascara & vitoria == vitoria:
+                return simbolo
+
+        if not self.livres:
+            return 'EMPATE'
+        return None
+
+    def para_lista(self):
+        """Formato do protocolo: lista N x N com 'X', 'O' ou ''"""
+        return mascaras_para_lista(self.x, self.o, self.tamanho)
+
+
+def mascaras_para_lista(x, o, n):
+    """Lista N x N do protocolo a partir das máscaras (dá para guardar só os dois inteiros e montar depois)"""
+    return [
+        ['X' if x & (1 << (i * n + j)) else 'O' if o & (1 << (i * n + j)) else '' for j in range(n)]
+        for i in range(n)
+    ]
@@ -0,0 +1,62 @@
+import time
+from threading import Lock
+
+
+class RodaTemporizadora:
+    """Roda de temporização (hashed timing wheel) sobre time.monotonic()
+
+    Cada chave fica no compartimento do tick do seu prazo. avancar() só olha os
+    compartimentos dos ticks que passaram, então o custo é proporcional ao que venceu,
+    não ao total de chaves agendadas. Prazos além de uma volta completa ficam no
+    compartimento e são pulados até a volta certa.
+    """
+
+    def __init__(self, resolucao=0.5, horizonte=30.0):
+        self.resolucao = resolucao
+        self.tamanho = int(horizonte / resolucao) + 2
+        self.compartimentos = [set() for _ in range(self.tamanho)]
+        self.alvo = {}  # {chave: tick do prazo}
+        self.tick_atual = self._tick(time.monotonic())
+        self.lock = Lock()
+
+    def _tick(self, instante):
+        return int(instante / self.resolucao)
+
+    def agendar(self, chave, prazo):
+        """Agenda (ou reagenda) a chave para vencer no instante monotônico 'prazo'"""
+        with self.lock:
+            self._remover(chave)
+            tick = max(self._tick(prazo), self.tick_atual + 1)
+            self.alvo[chave] = tick
+            self.compartimentos[tick % self.tamanho].add(chave)
+
+    def cancelar(self, chave):
+        with self.lock:
+            self._remover(chave)
+
+    def _remover(self, chave):
+        tick = self.alvo.pop(chave, None)
+        if tick is not None:
+            self.compartimentos[tick % self.tamanho].discard(chave)
+
+    def avancar(self, agora=None):
+        """Gira a roda até 'agora' e retorna as chaves vencidas (já fora da roda)"""
+        if agora is None:
+            agora = time.monotonic()
+        vencidas = []
+        with self.lock:
+            tick_final = self._tick(agora)
+            # Se ficou parada mais de uma volta, cada compartimento só precisa ser visto uma vez
+            inicio = max(self.tick_atual + 1, tick_final - self.tamanho + 1)
+            for tick in range(inicio, tick_final + 1):
+                compartimento = self.compartimentos[tick % self.tamanho]
+                for chave in list(compartimento):
+                    if self.alvo[chave] <= tick_final:
+                        compartimento.discard(chave)
+                        del self.alvo[chave]
+                        vencidas.append(chave)
+            self.tick_atual = max(self.tick_atual, tick_final)
+        return vencidas
+
+    def __len__(self):
+        return len(self.alvo)